@@ -0,0 +1,133 @@
+"""Аутентификация по токену с кешем найденных пользователей.
+
+TokenAuthentication выполняет запрос к authtoken_token и users_user на
+каждый вызов API. CachedTokenAuthentication хранит найденные пары
+(пользователь, токен) с ограниченным временем жизни. Ключом служит
+sha256 токена, сами токены в кеше не хранятся.
+
+Записи удаляются при удалении токена (выход), при сохранении
+пользователя (смена пароля, деактивация, правка профиля) и при
+изменении пароля или активности через QuerySet.update.
+
+Без AUTH_TOKEN_CACHE_SHARED записи живут в LRU процесса, и удаление
+видно только этому процессу, поэтому такой режим годится лишь для
+одного процесса (runserver, тесты). С AUTH_TOKEN_CACHE_SHARED записи
+хранятся только в общем кеше Django (memcached, redis), и удаление
+сразу видно всем процессам gunicorn; локальный кеш бэкенда
+(LocMemCache) для этого режима не подходит, это проверяет api.E001.
+"""
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+
+def token_digest(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class TokenCache:
+    """LRU процесса или общий кеш с временем жизни записей."""
+    key_prefix = 'auth-token'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def shared_key(self, digest):
+        return f'{self.key_prefix}:{digest}'
+
+    def get(self, digest):
+        if settings.AUTH_TOKEN_CACHE_SHARED:
+            value = cache.get(self.shared_key(digest))
+        else:
+            value = self._get_local(digest)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def _get_local(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(digest)
+                return entry[0]
+            self._entries.pop(digest, None)
+        return None
+
+    def set(self, digest, value):
+        if settings.AUTH_TOKEN_CACHE_SHARED:
+            cache.set(
+                self.shared_key(digest), value,
+                timeout=settings.AUTH_TOKEN_CACHE_TTL
+            )
+            return
+        with self._lock:
+            self._store(digest, value, time.monotonic())
+
+    def _store(self, digest, value, now):
+        self._entries[digest] = (value, now + settings.AUTH_TOKEN_CACHE_TTL)
+        self._entries.move_to_end(digest)
+        while len(self._entries) > settings.AUTH_TOKEN_CACHE_SIZE:
+            self._entries.popitem(last=False)
+
+    def delete(self, keys):
+        """Удаляет записи токенов keys из локального и общего кеша."""
+        digests = [token_digest(key) for key in keys]
+        with self._lock:
+            for digest in digests:
+                self._entries.pop(digest, None)
+        if settings.AUTH_TOKEN_CACHE_SHARED and digests:
+            cache.delete_many([self.shared_key(d) for d in digests])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size': len(self._entries),
+        }
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Замена TokenAuthentication с кешем токенов."""
+
+    @classmethod
+    def stats(cls):
+        """Попадания и промахи кеша токенов в этом процессе."""
+        return token_cache.stats()
+
+    def authenticate_credentials(self, key):
+        digest = token_digest(key)
+        cached = token_cache.get(digest)
+        if cached is None:
+            user, token = super().authenticate_credentials(key)
+            # В кеше и в запросе разные объекты: изменения request.user
+            # не должны попадать в кеш
+            token_cache.set(digest, (copy.copy(user), token))
+            return user, token
+        user, token = cached
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return copy.copy(user), token
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, register
+
+
+@register()
+def shared_token_cache_check(app_configs, **kwargs):
+    """Общий кеш токенов не может жить в памяти одного процесса."""
+    if settings.AUTH_TOKEN_CACHE_SHARED and isinstance(
+        caches['default'], (LocMemCache, DummyCache)
+    ):
+        return [Error(
+            'AUTH_TOKEN_CACHE_SHARED требует общего для процессов кеша.',
+            hint='Укажите CACHE_BACKEND и CACHE_LOCATION, например '
+                 'django.core.cache.backends.redis.RedisCache.',
+            id='api.E001'
+        )]
+    return []
@@ -1,14 +1,107 @@
 import base64
+import binascii
+import os
+import tempfile
+import weakref
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
 
 from rest_framework import serializers
 
+DATA_URI_MARKER = ';base64,'
+BASE64_WHITESPACE = ' \t\r\n'
+STRIP_WHITESPACE = str.maketrans('', '', BASE64_WHITESPACE)
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class DecodedImageFile(UploadedFile):
+    """Декодированное изображение во временном файле на диске.
+
+    Хранилище может перенести файл к себе (file_move_safe), поэтому он
+    удаляется при сборке мусора, только если остался на месте.
+    """
+
+    def __init__(self, name, content_type, size):
+        file = tempfile.NamedTemporaryFile(
+            suffix='.upload', dir=settings.FILE_UPLOAD_TEMP_DIR, delete=False
+        )
+        super().__init__(file, name, content_type, size)
+        weakref.finalize(self, _remove_quietly, file.name)
+
+    def temporary_file_path(self):
+        return self.file.name
+
 
 class Base64ImageField(serializers.ImageField):
+    """Изображение в виде data URI (data:image/png;base64,...) или файла.
+
+    Размер data URI проверяется по длине закодированной строки, а
+    декодирование идет порциями во временный файл, без второй полной
+    копии в памяти. Файлы из multipart/form-data передаются как есть.
+    """
+    # Кратно 4, чтобы каждая порция декодировалась независимо
+    chunk_size = 64 * 1024
+    default_error_messages = {
+        'too_large': 'Размер изображения не должен превышать {max_mb}MB',
+        'invalid_base64': 'Изображение должно быть в формате base64',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name=f'temp.{ext}')
+            data = self.decode(data)
+        elif (isinstance(data, UploadedFile)
+                and data.size > settings.IMAGE_UPLOAD_MAX_SIZE):
+            self.fail_too_large()
         return super().to_internal_value(data)
+
+    def fail_too_large(self):
+        self.fail(
+            'too_large',
+            max_mb=settings.IMAGE_UPLOAD_MAX_SIZE // (1024 * 1024)
+        )
+
+    def decode(self, data):
+        marker = data.find(DATA_URI_MARKER)
+        if marker == -1:
+            self.fail('invalid_base64')
+        extension = data[:marker].split('/')[-1]
+        start = marker + len(DATA_URI_MARKER)
+        # Многие клиенты переносят base64 по 76 символов в строке
+        whitespace = sum(
+            data.count(char, start) for char in BASE64_WHITESPACE
+        )
+        encoded_length = len(data) - start - whitespace
+        tail = data.rstrip(BASE64_WHITESPACE)
+        padding = 2 if tail.endswith('==') else 1 if tail.endswith('=') else 0
+        size = encoded_length // 4 * 3 - padding
+        if encoded_length % 4 or size < 0:
+            self.fail('invalid_base64')
+        if size > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.fail_too_large()
+
+        file = DecodedImageFile(
+            f'temp.{extension}', f'image/{extension}', size
+        )
+        try:
+            rest = ''
+            for position in range(start, len(data), self.chunk_size):
+                chunk = data[position:position + self.chunk_size]
+                if whitespace:
+                    # Остаток неполной четверки переходит в следующую
+                    # порцию, чтобы каждая декодировалась независимо
+                    chunk = rest + chunk.translate(STRIP_WHITESPACE)
+                    usable = len(chunk) - len(chunk) % 4
+                    chunk, rest = chunk[:usable], chunk[usable:]
+                file.write(base64.b64decode(chunk, validate=True))
+        except binascii.Error:
+            file.close()
+            self.fail('invalid_base64')
+        file.seek(0)
+        return file
@@ -0,0 +1,54 @@
+"""Выборочные поля ответа: параметры ?fields= и ?omit=.
+
+fields перечисляет поля, которые нужно оставить, omit - поля, которые
+нужно убрать; имена разделяются запятыми. Выбор относится к полям
+верхнего уровня: вложенный автор рецепта отдается целиком. По набору
+полей вьюсеты выбирают столбцы для only() и решают, нужны ли
+связанные объекты, поэтому ненужные данные не читаются из базы.
+"""
+from rest_framework import serializers
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def parse_fieldset(request, available):
+    """Набор полей ответа или None, если нужны все поля available."""
+    selected = None
+    for param in (FIELDS_PARAM, OMIT_PARAM):
+        value = request.query_params.get(param)
+        if value is None:
+            continue
+        names = {name.strip() for name in value.split(',') if name.strip()}
+        unknown = names - set(available)
+        if unknown:
+            raise serializers.ValidationError({param: [
+                f'Неизвестные поля: {", ".join(sorted(unknown))}'
+            ]})
+        if param == FIELDS_PARAM:
+            selected = names
+        else:
+            selected = (
+                set(available) if selected is None else selected
+            ) - names
+    return None if selected is None else frozenset(selected)
+
+
+class SparseFieldsMixin:
+    """Оставляет у сериализатора верхнего уровня поля context['fields'].
+
+    Вложенные сериализаторы получают тот же контекст, но не
+    сокращаются.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.context.get('fields')
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if selected is None or parent is not None:
+            return fields
+        return {
+            name: field for name, field in fields.items() if name in selected
+        }
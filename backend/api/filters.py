@@ -1,17 +1,20 @@
 import django_filters
 
+from recipes.ingredient_index import ingredient_index
 from recipes.models import Recipe, Ingredient
+from recipes.search import search_recipes
 
 
 class IngredientFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(
-        field_name='name', lookup_expr='istartswith'
-    )
+    name = django_filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
 
+    def filter_name(self, queryset, name, value):
+        return queryset.filter(pk__in=ingredient_index.startswith_ids(value))
+
 
 class RecipeFilter(django_filters.FilterSet):
     is_favorited = django_filters.NumberFilter(
@@ -19,6 +22,7 @@ class RecipeFilter(django_filters.FilterSet):
     is_in_shopping_cart = django_filters.NumberFilter(
         method='filter_in_shopping_cart')
     author = django_filters.NumberFilter(field_name='author__id')
+    search = django_filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
@@ -35,3 +39,6 @@ class RecipeFilter(django_filters.FilterSet):
         if value and user.is_authenticated:
             return queryset.filter(in_shopping_cart__user=user)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
@@ -0,0 +1,111 @@
+from django.conf import settings
+from django.core.cache import cache
+from recipes.models import Recipe
+
+from .media import MediaURLResolver
+from .row_serializers import RecipeRows
+from .serializers import VIEWER_RECIPE_FIELDS
+from .viewer import ViewerContext
+
+# Поля строки страницы, достаточные для сборки ответа из кеша
+FRAGMENT_ROW_FIELDS = ('id', 'version', 'author_id', 'pub_date')
+
+
+class RecipeFragmentCache:
+    """Кеш не зависящих от пользователя представлений рецептов.
+
+    Ключ состоит из id рецепта и его версии, версия увеличивается при
+    любом изменении рецепта, его ингредиентов или профиля автора.
+    Флаги текущего пользователя и абсолютные URL добавляются при ответе.
+    """
+    key_prefix = 'recipe-fragment'
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, recipe_id, version):
+        return f'{self.key_prefix}:{recipe_id}:{version}'
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def get_many(self, rows):
+        """Фрагменты для строк страницы: {id: фрагмент}, одним запросом."""
+        keys = {self.key(row['id'], row['version']): row['id']
+                for row in rows}
+        found = cache.get_many(keys)
+        fragments = {keys[key]: fragment for key, fragment in found.items()}
+        self.hits += len(fragments)
+        self.misses += len(rows) - len(fragments)
+        return fragments
+
+    def build_many(self, rows):
+        """Собирает фрагменты из строк базы и сохраняет их в кеш."""
+        serializer = RecipeRows({'viewer': ViewerContext(None)})
+        # Без request сериализатор отдает относительные URL и пустые флаги
+        data = serializer.many(Recipe.objects.filter(
+            pk__in=[row['id'] for row in rows]
+        ).values(*serializer.columns))
+        versions = {row['id']: row['version'] for row in rows}
+        fragments = {item['id']: item for item in data}
+        cache.set_many(
+            {self.key(pk, versions[pk]): fragment
+             for pk, fragment in fragments.items()},
+            timeout=settings.RECIPE_FRAGMENT_CACHE_TIMEOUT
+        )
+        return fragments
+
+    def delete(self, recipe_id, version):
+        cache.delete(self.key(recipe_id, version))
+
+    def render(self, rows, request, fields=None):
+        """Представления рецептов страницы и число промахов кеша.
+
+        fields - набор полей ответа (None - все поля).
+        """
+        fragments = self.get_many(rows)
+        missing = [row for row in rows if row['id'] not in fragments]
+        if missing:
+            fragments.update(self.build_many(missing))
+
+        def needs(*names):
+            return fields is None or not fields.isdisjoint(names)
+
+        viewer = ViewerContext(request.user).preload(
+            recipe_ids=[row['id'] for row in rows]
+            if needs(*VIEWER_RECIPE_FIELDS) else (),
+            author_ids=[row['author_id'] for row in rows]
+            if needs('author') else ()
+        )
+        media = MediaURLResolver(request)
+        data = [
+            self.merge(fragments[row['id']], viewer, media, fields)
+            for row in rows if row['id'] in fragments
+        ]
+        return data, len(missing)
+
+    def merge(self, fragment, viewer, media, fields=None):
+        data = {
+            key: value for key, value in fragment.items()
+            if fields is None or key in fields
+        }
+        if 'author' in data:
+            author = dict(data['author'])
+            author['is_subscribed'] = viewer.is_subscribed(author['id'])
+            for field in ('avatar', 'avatar_variants'):
+                author[field] = media.absolute(author[field])
+            data['author'] = author
+        if 'is_favorited' in data:
+            data['is_favorited'] = viewer.is_favorited(fragment['id'])
+        if 'is_in_shopping_cart' in data:
+            data['is_in_shopping_cart'] = viewer.is_in_shopping_cart(
+                fragment['id']
+            )
+        for field in ('image', 'image_variants'):
+            if field in data:
+                data[field] = media.absolute(data[field])
+        return data
+
+
+recipe_fragments = RecipeFragmentCache()
@@ -0,0 +1,82 @@
+import gzip
+import re
+import threading
+from collections import namedtuple
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+
+from rest_framework.renderers import JSONRenderer
+
+from recipes.catalog import get_catalog_version
+from recipes.models import Ingredient
+
+from .row_serializers import IngredientRows
+
+re_accepts_gzip = re.compile(r'\bgzip\b')
+
+CatalogPayload = namedtuple(
+    'CatalogPayload', ['body', 'gzipped', 'etag']
+)
+
+
+class IngredientCatalog:
+    """Заранее отрендеренный JSON полного каталога ингредиентов.
+
+    Payload собирается один раз на версию каталога и хранится в памяти
+    процесса вместе со сжатым gzip вариантом.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._payload = None
+
+    def get_payload(self):
+        version = get_catalog_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._payload = self._build(version)
+                    self._version = version
+        return self._payload
+
+    def _build(self, version):
+        serializer = IngredientRows()
+        body = JSONRenderer().render(serializer.many(
+            Ingredient.objects.values(*serializer.columns)
+        ))
+        return CatalogPayload(
+            body=body,
+            gzipped=gzip.compress(body),
+            etag=f'"{version}"'
+        )
+
+    def response(self, request):
+        """HTTP-ответ с каталогом с учетом условных заголовков запроса."""
+        payload = self.get_payload()
+        use_gzip = re_accepts_gzip.search(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        # Сильный ETag различается для разных кодировок тела
+        etag = payload.etag
+        if use_gzip:
+            etag = f'{etag[:-1]}-gzip"'
+
+        # Last-Modified с точностью до секунды не различает изменения
+        # каталога внутри одной секунды, поэтому валидатор - только ETag
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(
+                payload.gzipped if use_gzip else payload.body,
+                content_type='application/json'
+            )
+            if use_gzip:
+                response['Content-Encoding'] = 'gzip'
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        response['Vary'] = 'Accept-Encoding'
+        return response
+
+
+ingredient_catalog = IngredientCatalog()
@@ -0,0 +1,88 @@
+"""URL медиафайлов в ответах API.
+
+MediaURLResolver создается один раз на ответ: база URL (схема, хост и
+MEDIA_URL) вычисляется при создании, а URL файла получается склейкой
+базы и экранированного имени, без разбора URL на каждое изображение.
+Схема берется из request.scheme, поэтому за nginx учитывается
+X-Forwarded-Proto, если ему доверяет SECURE_PROXY_SSL_HEADER.
+
+Вместо абсолютных URL можно отдавать относительные
+(MEDIA_URLS_RELATIVE) или URL с префиксом CDN (MEDIA_URL_PREFIX).
+"""
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.encoding import filepath_to_uri
+
+from recipes.images import FORMATS
+
+
+class MediaURLResolver:
+    """URL файлов хранилища для одного запроса.
+
+    Без request (например, для кеша фрагментов) URL остаются
+    относительными, абсолютными их делает absolute при ответе.
+    """
+
+    def __init__(self, request=None):
+        self.relative_base = default_storage.base_url
+        if settings.MEDIA_URL_PREFIX:
+            self.base = settings.MEDIA_URL_PREFIX.rstrip('/') + '/'
+        elif request is None or settings.MEDIA_URLS_RELATIVE:
+            self.base = self.relative_base
+        else:
+            self.base = request.build_absolute_uri(self.relative_base)
+        self._memo = None
+
+    @classmethod
+    def from_context(cls, context):
+        """Общий для всех сериализаторов ответа объект из контекста."""
+        media = context.get('media')
+        if media is None:
+            media = cls(context.get('request'))
+            context['media'] = media
+        return media
+
+    def url(self, name):
+        return self.base + filepath_to_uri(name).lstrip('/')
+
+    def absolute(self, value):
+        """Переносит на базу запроса относительные URL из value.
+
+        value - URL, None или словарь (возможно, вложенный) с ними.
+        """
+        if isinstance(value, dict):
+            return {key: self.absolute(item) for key, item in value.items()}
+        if value and self.base != self.relative_base and value.startswith(
+            self.relative_base
+        ):
+            return self.base + value[len(self.relative_base):]
+        return value
+
+    def image_urls(self, name, variants, sizes):
+        """URL копий изображения name по вариантам sizes и форматам.
+
+        Для копий, которых еще нет (не построены или вариант добавлен в
+        настройки позже), отдается URL оригинала.
+        Результат для последнего изображения запоминается: поля image и
+        image_variants одного объекта запрашивают его подряд.
+        """
+        if not name:
+            return None
+        memo = self._memo
+        if (memo is not None and memo[0] == name and memo[1] is variants
+                and memo[2] is sizes):
+            return memo[3]
+        original = self.url(name)
+        ready = variants if variants.get('source') == name else {}
+        urls = {}
+        for variant in sizes:
+            files = ready.get(variant, {})
+            urls[variant] = {
+                extension: (
+                    self.url(files[extension]) if extension in files
+                    else original
+                )
+                for extension, _, _ in FORMATS
+            }
+        self._memo = (name, variants, sizes, urls)
+        return urls
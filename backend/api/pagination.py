@@ -1,6 +1,113 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class PageNumberPaginationWithLimit(PageNumberPagination):
     page_size_query_param = 'limit'
     max_page_size = 100
+
+
+class RecipePagination(PageNumberPaginationWithLimit):
+    """Постраничная навигация рецептов с режимом курсора по запросу.
+
+    По умолчанию работает как PageNumberPaginationWithLimit. Если в
+    запросе есть параметр cursor (пустой для первой страницы), лента
+    листается по ключу (pub_date, id) без COUNT(*) и OFFSET. Порядок по
+    ключу заменил бы ранжирование поиска, поэтому курсор вместе с search
+    отклоняется.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+    ranked_query_params = ('search',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+
+        ranked = [
+            param for param in self.ranked_query_params
+            if request.query_params.get(param)
+        ]
+        if ranked:
+            raise ValidationError({self.cursor_query_param: [
+                f'Курсор нельзя сочетать с параметром {ranked[0]}'
+            ]})
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(
+            request.query_params[self.cursor_query_param]
+        )
+        queryset = queryset.order_by('-pub_date', '-id')
+        if position:
+            pub_date, pk = position
+            # Первое условие дает индексу границу диапазона
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date) | Q(id__lt=pk),
+                pub_date__lte=pub_date
+            )
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        self.page = results[:page_size]
+        return self.page
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            value = base64.urlsafe_b64decode(cursor.encode()).decode()
+            pub_date, pk = value.rsplit('|', 1)
+            return datetime.fromisoformat(pub_date), int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, item):
+        if isinstance(item, dict):
+            pub_date, pk = item['pub_date'], item['id']
+        else:
+            pub_date, pk = item.pub_date, item.id
+        value = f'{pub_date.isoformat()}|{pk}'
+        return base64.urlsafe_b64encode(value.encode()).decode()
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.page[-1])
+        )
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+class FeedPagination(RecipePagination):
+    """Курсорная навигация ленты подписок, всегда по ключу."""
+
+    def paginate_feed(self, feed, request):
+        self.use_cursor = True
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param, '')
+        )
+        results = feed.page(position, page_size + 1)
+        self.has_next = len(results) > page_size
+        self.page = results[:page_size]
+        return self.page
@@ -0,0 +1,266 @@
+"""Быстрые сериализаторы чтения: строки values() -> словари ответа.
+
+ModelSerializer для каждого объекта обходит свои поля и вызывает их
+to_representation, а SerializerMethodField - еще и метод через getattr.
+Здесь набор полей разбирается один раз при создании сериализатора:
+каждому полю ответа заранее сопоставляются ключи его столбцов в
+строке values() и функция, собирающая значение. Ответ совпадает с
+выводом соответствующего сериализатора из serializers.py байт в байт,
+это проверяют golden-тесты.
+"""
+from operator import itemgetter
+
+from django.conf import settings
+
+from recipes.models import RecipeIngredient
+
+from .media import MediaURLResolver
+from .serializers import VIEWER_RECIPE_FIELDS
+from .viewer import ViewerContext
+
+
+class Column:
+    """Поле ответа, равное значению столбца."""
+
+    def __init__(self, column):
+        self.column = column
+
+    def compile(self, serializer, key):
+        return itemgetter(key(self.column))
+
+
+class Computed:
+    """Поле ответа, вычисляемое методом сериализатора из столбцов."""
+
+    def __init__(self, method, *columns):
+        self.method = method
+        self.columns = columns
+
+    def compile(self, serializer, key):
+        method = getattr(serializer, self.method)
+        getter = itemgetter(*[key(column) for column in self.columns])
+        if len(self.columns) == 1:
+            return lambda row: method(getter(row))
+        return lambda row: method(*getter(row))
+
+
+class Image:
+    """URL копий изображения из столбцов column и column_variants.
+
+    Как ImageURLsField: без variant - словарь URL всех копий, с variant -
+    URL JPEG-копии этого варианта.
+    """
+
+    def __init__(self, column, sizes, variant=None):
+        self.column = column
+        self.sizes = sizes
+        self.variant = variant
+
+    def compile(self, serializer, key):
+        getter = itemgetter(key(self.column), key(f'{self.column}_variants'))
+        image_urls = serializer.media.image_urls
+        sizes = getattr(settings, self.sizes)
+        variant = self.variant
+
+        def urls(row):
+            result = image_urls(*getter(row), sizes)
+            if result is None or variant is None:
+                return result
+            return result[variant]['jpeg']
+        return urls
+
+
+class Nested:
+    """Вложенный объект из столбцов связанной модели (author__email)."""
+
+    def __init__(self, serializer_class, relation):
+        self.serializer_class = serializer_class
+        self.relation = relation
+
+    def compile(self, serializer, key):
+        child = self.serializer_class(
+            serializer.context,
+            prefix=f'{serializer.prefix}{self.relation}__'
+        )
+        for column in child.columns:
+            key(column, prefixed=True)
+        return child.to_representation
+
+
+class RowSerializer:
+    """Сериализатор строк values(*columns).
+
+    Подклассы перечисляют в fields поля ответа в порядке Meta.fields
+    сериализатора DRF. fields в конструкторе - набор полей ответа из
+    ?fields= и ?omit= (None - все поля), prefix - префикс столбцов
+    вложенного объекта.
+    """
+    fields = {}
+
+    def __init__(self, context=None, fields=None, prefix=''):
+        self.context = {} if context is None else context
+        self.prefix = prefix
+        columns = {}
+
+        def key(column, prefixed=False):
+            if not prefixed:
+                column = prefix + column
+            columns[column] = None
+            return column
+
+        self.accessors = [
+            (name, spec.compile(self, key))
+            for name, spec in self.fields.items()
+            if fields is None or name in fields
+        ]
+        self.names = {name for name, _ in self.accessors}
+        self.columns = tuple(columns)
+
+    @property
+    def viewer(self):
+        return ViewerContext.from_context(self.context)
+
+    @property
+    def media(self):
+        return MediaURLResolver.from_context(self.context)
+
+    def values(self, rows, column):
+        column = self.prefix + column
+        return [row[column] for row in rows]
+
+    def to_representation(self, row):
+        return {name: get(row) for name, get in self.accessors}
+
+    def preload(self, rows):
+        """Загружает пачкой данные, общие для строк rows."""
+
+    def many(self, rows):
+        rows = list(rows)
+        self.preload(rows)
+        to_representation = self.to_representation
+        return [to_representation(row) for row in rows]
+
+    def one(self, row):
+        return self.many([row])[0]
+
+
+class IngredientRows(RowSerializer):
+    """IngredientSerializer."""
+    fields = {
+        'id': Column('id'),
+        'name': Column('name'),
+        'measurement_unit': Column('measurement_unit'),
+    }
+
+
+class UserRows(RowSerializer):
+    """UserSerializer."""
+    fields = {
+        'email': Column('email'),
+        'id': Column('id'),
+        'username': Column('username'),
+        'first_name': Column('first_name'),
+        'last_name': Column('last_name'),
+        'is_subscribed': Computed('get_is_subscribed', 'id'),
+        'avatar': Image('avatar', 'AVATAR_IMAGE_VARIANTS', 'avatar'),
+        'avatar_variants': Image('avatar', 'AVATAR_IMAGE_VARIANTS'),
+    }
+
+    def preload(self, rows):
+        if 'is_subscribed' in self.names:
+            self.viewer.preload(author_ids=self.values(rows, 'id'))
+
+    def get_is_subscribed(self, pk):
+        return self.viewer.is_subscribed(pk)
+
+
+class RecipeMinifiedRows(RowSerializer):
+    """RecipeMinifiedSerializer."""
+    fields = {
+        'id': Column('id'),
+        'name': Column('name'),
+        'image': Image('image', 'RECIPE_IMAGE_VARIANTS', 'card'),
+        'image_variants': Image('image', 'RECIPE_IMAGE_VARIANTS'),
+        'cooking_time': Column('cooking_time'),
+    }
+
+
+class UserWithRecipesRows(UserRows):
+    """UserWithRecipesSerializer.
+
+    Рецепты авторов передаются в context['recipes']: словарь
+    {id автора: строки RecipeMinifiedRows}.
+    """
+    fields = {
+        **UserRows.fields,
+        'recipes': Computed('get_recipes', 'id'),
+        'recipes_count': Column('recipes_count'),
+    }
+
+    def __init__(self, context=None, fields=None):
+        super().__init__(context, fields)
+        self.recipe_rows = RecipeMinifiedRows(self.context)
+
+    def preload(self, rows):
+        if not self.context.get('is_subscriptions_list'):
+            super().preload(rows)
+
+    def get_recipes(self, pk):
+        return self.recipe_rows.many(self.context['recipes'].get(pk, ()))
+
+    def get_is_subscribed(self, pk):
+        if (self.context.get('is_subscriptions_list')
+                and self.viewer.is_authenticated):
+            return True
+        return super().get_is_subscribed(pk)
+
+
+# Ключи IngredientInRecipeSerializer
+INGREDIENT_KEYS = ('id', 'name', 'measurement_unit', 'amount')
+
+
+class RecipeRows(RowSerializer):
+    """RecipeSerializer. Ингредиенты догружаются одним запросом."""
+    fields = {
+        'id': Column('id'),
+        'author': Nested(UserRows, 'author'),
+        'ingredients': Computed('get_ingredients', 'id'),
+        'is_favorited': Computed('get_is_favorited', 'id'),
+        'is_in_shopping_cart': Computed('get_is_in_shopping_cart', 'id'),
+        'name': Column('name'),
+        'image': Image('image', 'RECIPE_IMAGE_VARIANTS', 'detail'),
+        'image_variants': Image('image', 'RECIPE_IMAGE_VARIANTS'),
+        'text': Column('text'),
+        'cooking_time': Column('cooking_time'),
+    }
+
+    def preload(self, rows):
+        self.ingredients = {}
+        if 'ingredients' in self.names:
+            self.load_ingredients(self.values(rows, 'id'))
+        self.viewer.preload(
+            recipe_ids=self.values(rows, 'id')
+            if VIEWER_RECIPE_FIELDS & self.names else (),
+            author_ids=self.values(rows, 'author__id')
+            if 'author' in self.names else ()
+        )
+
+    def load_ingredients(self, recipe_ids):
+        for recipe_id, *ingredient in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by('pk').values_list(
+            'recipe_id', 'ingredient_id', 'ingredient__name',
+            'ingredient__measurement_unit', 'amount'
+        ):
+            self.ingredients.setdefault(recipe_id, []).append(
+                dict(zip(INGREDIENT_KEYS, ingredient))
+            )
+
+    def get_ingredients(self, pk):
+        return self.ingredients.get(pk, [])
+
+    def get_is_favorited(self, pk):
+        return self.viewer.is_favorited(pk)
+
+    def get_is_in_shopping_cart(self, pk):
+        return self.viewer.is_in_shopping_cart(pk)
@@ -1,124 +1,114 @@
-import base64
-
-from django.core.files.base import ContentFile
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.validators import RegexValidator
+from django.db import models, transaction
 
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
-from users.models import Subscription
+from recipes.signals import recipe_ingredients_changed
 from recipes.models import (
     Ingredient,
     Recipe,
-    RecipeIngredient,
-    Favorite,
-    ShoppingCart
+    RecipeIngredient
 )
 
-User = get_user_model()
-
+from .fields import Base64ImageField
+from .fieldsets import SparseFieldsMixin
+from .media import MediaURLResolver
+from .viewer import ViewerContext
 
-class Base64ImageField(serializers.ImageField):
-    """Кастомное поле для работы с изображениями в формате Base64."""
+User = get_user_model()
 
-    def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name=f'temp.{ext}')
-            if data.size > 10 * 1024 * 1024:
-                raise serializers.ValidationError(
-                    'Размер изображения не должен превышать 10MB'
-                )
-        return super().to_internal_value(data)
 
+class ImageURLsField(serializers.Field):
+    """URL копий изображения из поля field модели и поля field_variants.
 
-class BaseRelationSerializer(serializers.ModelSerializer):
-    """Базовый сериализатор для отношений пользователь/рецепт."""
+    sizes - имя настройки с вариантами копий. Без variant отдается
+    словарь URL по вариантам и форматам, с variant - URL JPEG-копии
+    этого варианта.
+    """
 
-    class Meta:
-        abstract = True
-        fields = ['user', 'recipe']
-        extra_kwargs = {
-            'user': {'read_only': True},
-            'recipe': {'required': True}
-        }
+    def __init__(self, field, sizes, variant=None, **kwargs):
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+        self.file_field = field
+        self.sizes = sizes
+        self.variant = variant
 
-    def get_already_exists_message(self):
-        raise NotImplementedError(
-            'Метод должен возвращать сообщение об ошибке'
+    def to_representation(self, obj):
+        urls = MediaURLResolver.from_context(self.context).image_urls(
+            getattr(obj, self.file_field).name,
+            getattr(obj, f'{self.file_field}_variants'),
+            getattr(settings, self.sizes)
         )
+        if urls is None or self.variant is None:
+            return urls
+        return urls[self.variant]['jpeg']
 
-    def validate_recipe(self, value):
-        user = self.context['request'].user
-        model_class = self.Meta.model
 
-        if model_class.objects.filter(user=user, recipe=value).exists():
-            raise serializers.ValidationError(
-                self.get_already_exists_message()
-            )
-        return value
+class ViewerListSerializer(serializers.ListSerializer):
+    """Список, заранее загружающий флаги текущего пользователя."""
 
-    def to_representation(self, instance):
-        recipe = instance.recipe
-        return RecipeMinifiedSerializer(recipe, context=self.context).data
+    def to_representation(self, data):
+        if isinstance(data, models.manager.BaseManager):
+            data = data.all()
+        data = list(data)
+        self.child.preload_viewer(data)
+        return super().to_representation(data)
 
 
-class FavoriteSerializer(BaseRelationSerializer):
-    """Сериализатор для избранных рецептов."""
+class ViewerFlagsMixin:
+    """Доступ к флагам текущего пользователя из контекста."""
 
-    class Meta(BaseRelationSerializer.Meta):
-        model = Favorite
+    @property
+    def viewer(self):
+        return ViewerContext.from_context(self.context)
 
-    def get_already_exists_message(self):
-        return 'Рецепт уже в избранном'
+    def preload_viewer(self, instances):
+        pass
 
 
-class ShoppingCartSerializer(BaseRelationSerializer):
-    """Сериализатор для списка покупок."""
+class UpdateFieldsMixin:
+    """Сохраняет при обновлении только поля из validated_data.
 
-    class Meta(BaseRelationSerializer.Meta):
-        model = ShoppingCart
+    Счетчики меняются запросами с F(), а объект может быть устаревшим
+    (пользователь из кеша токенов), поэтому полный save() затер бы их.
+    """
 
-    def get_already_exists_message(self):
-        return 'Рецепт уже в списке покупок'
+    def update(self, instance, validated_data):
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, ViewerFlagsMixin,
+                     serializers.ModelSerializer):
     """Сериализатор для пользователей."""
     is_subscribed = serializers.SerializerMethodField()
-    avatar = serializers.SerializerMethodField()
+    avatar = ImageURLsField('avatar', 'AVATAR_IMAGE_VARIANTS', 'avatar')
+    avatar_variants = ImageURLsField('avatar', 'AVATAR_IMAGE_VARIANTS')
 
     class Meta:
         model = User
         fields = [
             'email', 'id', 'username',
             'first_name', 'last_name',
-            'is_subscribed', 'avatar'
+            'is_subscribed', 'avatar', 'avatar_variants'
         ]
         extra_kwargs = {
             'email': {'required': True},
             'username': {'required': True}
         }
+        list_serializer_class = ViewerListSerializer
 
-    def get_avatar(self, obj):
-        if obj.avatar:
-            request = self.context.get('request')
-            return (
-                request.build_absolute_uri(obj.avatar.url)
-                if request else obj.avatar.url
-            )
-        return None
+    def preload_viewer(self, instances):
+        if 'is_subscribed' in self.fields:
+            self.viewer.preload(author_ids=[user.id for user in instances])
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return Subscription.objects.filter(
-            user=user,
-            author=obj
-        ).exists()
+        return self.viewer.is_subscribed(obj.id)
 
 
 class CustomUserCreateSerializer(serializers.ModelSerializer):
@@ -159,54 +149,27 @@ class UserWithRecipesSerializer(UserSerializer):
     class Meta(UserSerializer.Meta):
         fields = UserSerializer.Meta.fields + ['recipes', 'recipes_count']
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
     def get_recipes(self, obj):
-        recipes_limit = self.context.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if recipes_limit:
-            recipes = recipes[:int(recipes_limit)]
+        # Предзагрузка author_recipes_prefetch уже ограничена лимитом
+        recipes = getattr(obj, 'newest_recipes', None)
+        if recipes is None:
+            recipes_limit = self.context.get('recipes_limit')
+            recipes = obj.recipes.order_by('-pub_date', '-id')
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
         return RecipeMinifiedSerializer(
             recipes, many=True, context=self.context
         ).data
 
-    def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if not request or not request.user.is_authenticated:
-            return False
+    def preload_viewer(self, instances):
+        if not self.context.get('is_subscriptions_list'):
+            super().preload_viewer(instances)
 
-        if self.context.get('is_subscriptions_list'):
+    def get_is_subscribed(self, obj):
+        if (self.context.get('is_subscriptions_list')
+                and self.viewer.is_authenticated):
             return True
-
-        return Subscription.objects.filter(
-            user=request.user,
-            author=obj
-        ).exists()
-
-
-class SubscriptionSerializer(serializers.ModelSerializer):
-    """Сериализатор для подписок."""
-
-    class Meta:
-        model = Subscription
-        fields = ('user', 'author')
-        extra_kwargs = {
-            'user': {'read_only': True},
-            'author': {'required': True}
-        }
-
-    def validate_author(self, value):
-        user = self.context['request'].user
-        if user == value:
-            raise serializers.ValidationError(
-                'Нельзя подписаться на самого себя'
-            )
-        if Subscription.objects.filter(user=user, author=value).exists():
-            raise serializers.ValidationError(
-                'Вы уже подписаны на этого автора'
-            )
-        return value
+        return super().get_is_subscribed(obj)
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -219,20 +182,23 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 class RecipeMinifiedSerializer(serializers.ModelSerializer):
     """Сокращенный сериализатор для рецептов."""
-    image = serializers.SerializerMethodField()
+    image = ImageURLsField('image', 'RECIPE_IMAGE_VARIANTS', 'card')
+    image_variants = ImageURLsField('image', 'RECIPE_IMAGE_VARIANTS')
 
     class Meta:
         model = Recipe
-        fields = ['id', 'name', 'image', 'cooking_time']
-
-    def get_image(self, obj):
-        if obj.image:
-            request = self.context.get('request')
-            return (
-                request.build_absolute_uri(obj.image.url)
-                if request else obj.image.url
-            )
-        return None
+        fields = ['id', 'name', 'image', 'image_variants', 'cooking_time']
+
+
+class RecipeIngredientListSerializer(serializers.ListSerializer):
+    """Ингредиенты рецепта в порядке строк, как их передал автор."""
+
+    def to_representation(self, data):
+        if isinstance(data, models.manager.BaseManager):
+            data = data.all()
+        return super().to_representation(
+            sorted(data, key=lambda row: row.pk)
+        )
 
 
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
@@ -246,9 +212,15 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecipeIngredient
         fields = ['id', 'name', 'measurement_unit', 'amount']
+        list_serializer_class = RecipeIngredientListSerializer
+
+
+# Поля рецепта, зависящие от текущего пользователя
+VIEWER_RECIPE_FIELDS = {'is_favorited', 'is_in_shopping_cart'}
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(SparseFieldsMixin, ViewerFlagsMixin,
+                       serializers.ModelSerializer):
     """Основной сериализатор для рецептов."""
     author = UserSerializer(read_only=True)
     ingredients = IngredientInRecipeSerializer(
@@ -258,39 +230,37 @@ class RecipeSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
-    image = serializers.SerializerMethodField()
+    image = ImageURLsField('image', 'RECIPE_IMAGE_VARIANTS', 'detail')
+    image_variants = ImageURLsField('image', 'RECIPE_IMAGE_VARIANTS')
 
     class Meta:
         model = Recipe
         fields = [
             'id', 'author', 'ingredients',
             'is_favorited', 'is_in_shopping_cart',
-            'name', 'image', 'text', 'cooking_time'
+            'name', 'image', 'image_variants', 'text', 'cooking_time'
         ]
-
-    def get_image(self, obj):
-        if obj.image:
-            request = self.context.get('request')
-            return (
-                request.build_absolute_uri(obj.image.url)
-                if request else obj.image.url
-            )
-        return None
+        list_serializer_class = ViewerListSerializer
+
+    def preload_viewer(self, instances):
+        # Флаги загружаются только для полей, оставшихся в ответе
+        fields = self.fields
+        self.viewer.preload(
+            recipe_ids=[recipe.id for recipe in instances]
+            if VIEWER_RECIPE_FIELDS & fields.keys() else (),
+            author_ids=[recipe.author_id for recipe in instances]
+            if 'author' in fields else ()
+        )
 
     def get_is_favorited(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated:
-            return obj.favorited_by.filter(user=user).exists()
-        return False
+        return self.viewer.is_favorited(obj.id)
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated:
-            return obj.in_shopping_cart.filter(user=user).exists()
-        return False
+        return self.viewer.is_in_shopping_cart(obj.id)
 
 
-class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
+class RecipeCreateUpdateSerializer(UpdateFieldsMixin,
+                                   serializers.ModelSerializer):
     """Сериализатор для создания/обновления рецептов."""
     ingredients = serializers.JSONField(required=True, write_only=True)
     image = Base64ImageField(required=True)
@@ -379,29 +349,87 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
 
         return data
 
-    def create_ingredients(self, recipe, ingredients):
-        objs = []
-        for ingredient in ingredients:
-            objs.append(RecipeIngredient(
-                recipe=recipe,
-                ingredient_id=ingredient['id'],
-                amount=int(ingredient['amount'])
-            ))
-        RecipeIngredient.objects.bulk_create(objs)
+    def save_ingredients(self, recipe, ingredients, existing=None):
+        """Приводит ингредиенты рецепта к списку ingredients.
+
+        Пишет только разницу с текущими строками: новые вставляются,
+        измененные количества обновляются, лишние удаляются. Порядок
+        ингредиентов в ответе - порядок строк, поэтому на месте остается
+        только совпадающее с запросом начало списка, а строки после
+        первого расхождения порядка вставляются заново. Об итоговом
+        наборе изменений сообщает сигнал recipe_ingredients_changed.
+        """
+        if existing is None:
+            existing = {
+                row.ingredient_id: row
+                for row in RecipeIngredient.objects.filter(
+                    recipe=recipe
+                ).order_by('pk')
+            }
+        wanted = {item['id']: int(item['amount']) for item in ingredients}
+        added = {
+            pk: amount for pk, amount in wanted.items() if pk not in existing
+        }
+        changed = {
+            pk: (existing[pk].amount, amount)
+            for pk, amount in wanted.items()
+            if pk in existing and existing[pk].amount != amount
+        }
+        removed = {
+            pk: row.amount for pk, row in existing.items() if pk not in wanted
+        }
+        order = list(wanted)
+        kept = [pk for pk in existing if pk in wanted]
+        prefix = 0
+        while prefix < len(kept) and kept[prefix] == order[prefix]:
+            prefix += 1
+        moved = [pk for pk in order[prefix:] if pk in existing]
+        if not (added or changed or removed or moved):
+            return
+
+        if removed or moved:
+            RecipeIngredient.objects.filter(pk__in=[
+                existing[pk].pk for pk in [*removed, *moved]
+            ]).delete()
+        rows = []
+        for pk in order[:prefix]:
+            if pk in changed:
+                existing[pk].amount = wanted[pk]
+                rows.append(existing[pk])
+        if rows:
+            RecipeIngredient.objects.bulk_update(rows, ['amount'])
+        if order[prefix:]:
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient_id=pk, amount=wanted[pk]
+                )
+                for pk in order[prefix:]
+            )
+        # Перестановка без других изменений тоже меняет представление
+        # рецепта: сигнал с пустыми наборами увеличивает его версию
+        recipe_ingredients_changed.send(
+            sender=Recipe, recipe_id=recipe.id,
+            added=added, changed=changed, removed=removed
+        )
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data)
-        self.create_ingredients(recipe, ingredients)
+        self.save_ingredients(recipe, ingredients, existing={})
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients', None)
-        instance = super().update(instance, validated_data)
+        if any(
+            getattr(instance, field) != value
+            for field, value in validated_data.items()
+        ):
+            instance = super().update(instance, validated_data)
 
         if ingredients is not None:
-            instance.ingredient_amounts.all().delete()
-            self.create_ingredients(instance, ingredients)
+            self.save_ingredients(instance, ingredients)
 
         return instance
 
@@ -409,7 +437,7 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         return RecipeSerializer(instance, context=self.context).data
 
 
-class SetAvatarSerializer(serializers.ModelSerializer):
+class SetAvatarSerializer(UpdateFieldsMixin, serializers.ModelSerializer):
     """Сериализатор для обновления аватара."""
     avatar = Base64ImageField(required=True)
 
@@ -424,6 +452,49 @@ class SetPasswordSerializer(serializers.Serializer):
     new_password = serializers.CharField(required=True)
 
 
+class RecipesLimitSerializer(serializers.Serializer):
+    """Сколько рецептов показывать в карточке автора."""
+
+    recipes_limit = serializers.IntegerField(min_value=0, required=False)
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Рецепты пакетного добавления или удаления связей."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1,
+        max_length=settings.RELATION_BATCH_MAX_SIZE
+    )
+
+
+class PantryQuerySerializer(serializers.Serializer):
+    """Параметры подбора рецептов по кладовой."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1,
+        max_length=settings.PANTRY_MAX_INGREDIENTS
+    )
+    max_missing = serializers.IntegerField(
+        min_value=0,
+        max_value=settings.PANTRY_MAX_MISSING,
+        default=0
+    )
+
+    def to_internal_value(self, data):
+        # Принимаем и ?ingredients=1,2, и ?ingredients=1&ingredients=2
+        ingredients = [
+            value
+            for item in data.getlist('ingredients')
+            for value in item.split(',') if value
+        ]
+        return super().to_internal_value({
+            'ingredients': ingredients,
+            'max_missing': data.get('max_missing', 0)
+        })
+
+
 class ShortCodeValidatorSerializer(serializers.Serializer):
     """Сериализатор для короткой ссылки рецепта."""
 
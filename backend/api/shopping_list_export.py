@@ -0,0 +1,225 @@
+"""Выгрузка списка покупок в текстовом, CSV, JSON и HTML форматах.
+
+Формат выбирается стандартным согласованием DRF: параметром format или
+заголовком Accept. Тело отдается потоком по серверному курсору, поэтому
+расход памяти не зависит от размера корзины. Готовое тело кешируется
+по версии списка пользователя и версии каталога ингредиентов, та же
+пара служит ETag для условных запросов.
+"""
+import csv
+import json
+from abc import ABC, abstractmethod
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.html import escape
+
+from rest_framework.renderers import BaseRenderer
+
+from recipes.catalog import get_catalog_version
+from recipes.models import ShoppingListItem
+from recipes.shopping_list import get_shopping_list_version
+from recipes.units import combine_units
+
+TITLE = 'Список покупок'
+
+
+class ShoppingListRenderer(BaseRenderer, ABC):
+    """Формат выгрузки: заголовок, строка на ингредиент и окончание.
+
+    Как рендерер DRF класс нужен только для выбора формата, тело
+    собирает ShoppingListExport.
+    """
+    charset = 'utf-8'
+    separator = ''
+    disposition = 'attachment'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+    def head(self):
+        return ''
+
+    @abstractmethod
+    def row(self, name, unit, amount):
+        """Строка списка для одного ингредиента."""
+
+    def tail(self):
+        return ''
+
+    def chunks(self, rows, size):
+        """Куски тела, по size строк списка в каждом."""
+        yield self.head()
+        rows = iter(rows)
+        first = True
+        while batch := list(islice(rows, size)):
+            text = self.separator.join(self.row(*row) for row in batch)
+            yield text if first else self.separator + text
+            first = False
+        yield self.tail()
+
+
+class TextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def head(self):
+        return f'{TITLE}:\n\n'
+
+    def row(self, name, unit, amount):
+        return f'{name} ({unit}) - {amount}\n'
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+class CSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def __init__(self):
+        self.writer = csv.writer(_Echo())
+
+    def head(self):
+        return self.writer.writerow(['name', 'measurement_unit', 'amount'])
+
+    def row(self, name, unit, amount):
+        return self.writer.writerow([name, unit, amount])
+
+
+class JSONExportRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    separator = ','
+
+    def head(self):
+        return '['
+
+    def row(self, name, unit, amount):
+        return json.dumps(
+            {'name': name, 'measurement_unit': unit,
+             'amount': amount if isinstance(amount, int) else float(amount)},
+            ensure_ascii=False
+        )
+
+    def tail(self):
+        return ']'
+
+
+class HTMLRenderer(ShoppingListRenderer):
+    media_type = 'text/html'
+    format = 'html'
+    # Страница для печати открывается в браузере
+    disposition = 'inline'
+
+    def head(self):
+        return (
+            '<!DOCTYPE html>\n<html lang="ru">\n<head>\n'
+            '<meta charset="utf-8">\n'
+            f'<title>{TITLE}</title>\n'
+            '<style>\n'
+            'body { font-family: sans-serif; margin: 2em; }\n'
+            'table { border-collapse: collapse; width: 100%; }\n'
+            'td, th { border-bottom: 1px solid #ccc; padding: .4em; '
+            'text-align: left; }\n'
+            'td.amount { text-align: right; white-space: nowrap; }\n'
+            '.check { width: 1.5em; }\n'
+            '@media print { body { margin: 0; } }\n'
+            '</style>\n</head>\n<body>\n'
+            f'<h1>{TITLE}</h1>\n<table>\n<thead><tr><th class="check"></th>'
+            '<th>Ингредиент</th><th>Количество</th></tr></thead>\n<tbody>\n'
+        )
+
+    def row(self, name, unit, amount):
+        return (
+            f'<tr><td class="check">&#9744;</td><td>{escape(name)}</td>'
+            f'<td class="amount">{amount} {escape(unit)}</td></tr>\n'
+        )
+
+    def tail(self):
+        return '</tbody>\n</table>\n</body>\n</html>\n'
+
+
+EXPORT_RENDERERS = [
+    TextRenderer, CSVRenderer, JSONExportRenderer, HTMLRenderer
+]
+
+
+class ShoppingListExport:
+    key_prefix = 'shopping-list-export'
+
+    def version(self, user_id):
+        return (get_shopping_list_version(user_id), get_catalog_version())
+
+    def key(self, user_id, version, export_format):
+        return f'{self.key_prefix}:{user_id}:{export_format}:' + (
+            '-'.join(version)
+        )
+
+    def rows(self, user_id):
+        """Итоги пользователя; одноименные ингредиенты в разных единицах
+        объединяются, если единицы переводятся друг в друга."""
+        return combine_units(
+            ShoppingListItem.objects
+            .filter(user_id=user_id)
+            .values_list(
+                'ingredient__name',
+                'ingredient__measurement_unit',
+                'amount'
+            )
+            .order_by('ingredient__name', 'ingredient__measurement_unit')
+            .iterator(chunk_size=settings.SHOPPING_LIST_EXPORT_CHUNK_SIZE)
+        )
+
+    def stream(self, user_id, renderer, key):
+        """Тело выгрузки; целиком прочитанное небольшое тело кешируется."""
+        parts, size = [], 0
+        for chunk in renderer.chunks(
+            self.rows(user_id), settings.SHOPPING_LIST_EXPORT_CHUNK_SIZE
+        ):
+            data = chunk.encode(renderer.charset)
+            if parts is not None:
+                size += len(data)
+                if size > settings.SHOPPING_LIST_EXPORT_CACHE_MAX_SIZE:
+                    parts = None
+                else:
+                    parts.append(data)
+            yield data
+        if parts is not None:
+            cache.set(
+                key, b''.join(parts),
+                timeout=settings.SHOPPING_LIST_EXPORT_CACHE_TIMEOUT
+            )
+
+    def response(self, request, renderer):
+        """Ответ с выгрузкой с учетом условных заголовков запроса."""
+        user_id = request.user.pk
+        version = self.version(user_id)
+        etag = f'"{"-".join(version)}-{renderer.format}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            key = self.key(user_id, version, renderer.format)
+            content_type = f'{renderer.media_type}; charset={renderer.charset}'
+            body = cache.get(key)
+            if body is not None:
+                response = HttpResponse(body, content_type=content_type)
+            else:
+                response = StreamingHttpResponse(
+                    self.stream(user_id, renderer, key),
+                    content_type=content_type
+                )
+            response['Content-Disposition'] = (
+                f'{renderer.disposition}; '
+                f'filename="shopping_cart.{renderer.format}"'
+            )
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+shopping_list_export = ShoppingListExport()
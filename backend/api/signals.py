@@ -0,0 +1,37 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Recipe
+from users.models import User, credentials_updated
+
+from .authentication import token_cache
+from .fragments import recipe_fragments
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    recipe_fragments.delete(instance.id, instance.version)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    token_cache.delete([instance.key])
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    # Смена пароля, деактивация и правка профиля
+    if not created:
+        token_cache.delete(
+            Token.objects.filter(user=instance).values_list('key', flat=True)
+        )
+
+
+@receiver(credentials_updated, sender=User)
+def user_credentials_updated(sender, user_ids, **kwargs):
+    token_cache.delete(
+        Token.objects.filter(user_id__in=user_ids)
+        .values_list('key', flat=True)
+    )
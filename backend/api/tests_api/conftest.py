@@ -0,0 +1,45 @@
+import pytest
+
+from django.core.cache import cache
+
+from api.authentication import token_cache
+from recipes.catalog import cached_catalog_version
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Кеши процесса переживают тест, а БД откатывается после каждого
+    # теста, поэтому кеши сбрасываем вместе с ней.
+    cache.clear()
+    token_cache.clear()
+    cached_catalog_version.reset()
+    yield
+    cache.clear()
+    token_cache.clear()
+    cached_catalog_version.reset()
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    # Загруженные в тестах изображения не должны попадать в MEDIA_ROOT
+    settings.MEDIA_ROOT = tmp_path / 'media'
+    return settings.MEDIA_ROOT
+
+
+@pytest.fixture(autouse=True)
+def sync_image_processing(settings):
+    # Копии изображений строятся сразу, без фонового пула потоков
+    settings.IMAGE_PROCESSING_SYNC = True
+
+
+@pytest.fixture(scope='session')
+def django_db_modify_db_settings(tmp_path_factory):
+    # SQLite в памяти с общим кешем сразу отвечает "table is locked" на
+    # одновременную запись из потоков; файловая база ждет блокировку
+    from django.conf import settings
+
+    database = settings.DATABASES['default']
+    if database['ENGINE'] == 'django.db.backends.sqlite3':
+        database.setdefault('TEST', {})['NAME'] = str(
+            tmp_path_factory.mktemp('db') / 'test.sqlite3'
+        )
@@ -0,0 +1,134 @@
+import pytest
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import QuerySet
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.authentication import (
+    CachedTokenAuthentication,
+    token_cache,
+    token_digest
+)
+from users.models import User
+
+
+@pytest.fixture
+def client():
+    return APIClient()
+
+
+@pytest.fixture
+def user_client(client):
+    user = User.objects.create_user(
+        email='user@example.com',
+        username='user',
+        password='Qwerty123'
+    )
+    response = client.post('/api/auth/token/login/', {
+        'email': 'user@example.com',
+        'password': 'Qwerty123'
+    })
+    token = response.data['auth_token']
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+    client.user, client.token = user, token
+    return client
+
+
+def token_queries(client, url='/api/users/me/'):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    return [query for query in queries if 'authtoken_token' in query['sql']]
+
+
+@pytest.mark.django_db
+def test_token_lookup_is_cached(user_client):
+    assert len(token_queries(user_client)) == 1
+    assert token_queries(user_client) == []
+    stats = CachedTokenAuthentication.stats()
+    assert stats['hits'] >= 1 and 0 < stats['hit_rate'] < 1
+
+    # Правка профиля сбрасывает запись, ответ не устаревает
+    user = User.objects.get(pk=user_client.user.pk)
+    user.first_name = 'Новое имя'
+    user.save()
+    response = user_client.get('/api/users/me/')
+    assert response.data['first_name'] == 'Новое имя'
+
+
+@pytest.mark.django_db
+def test_token_cache_invalidation(user_client):
+    token_queries(user_client)
+    response = user_client.post('/api/users/set_password/', {
+        'current_password': 'Qwerty123',
+        'new_password': 'NewPassword456'
+    })
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert len(token_queries(user_client)) == 1
+
+    user = User.objects.get(pk=user_client.user.pk)
+    user.is_active = False
+    user.save()
+    response = user_client.get('/api/users/me/')
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    user.is_active = True
+    user.save()
+    token_queries(user_client)
+    response = user_client.post('/api/auth/token/logout/')
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = user_client.get('/api/users/me/')
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_shared_token_cache(user_client, settings):
+    settings.AUTH_TOKEN_CACHE_SHARED = True
+    token_queries(user_client)
+    # Запись хранится только в общем кеше, другой процесс берет ее оттуда
+    assert CachedTokenAuthentication.stats()['size'] == 0
+    assert token_queries(user_client) == []
+    # Ключ общего кеша - хеш токена, а не сам токен
+    key = token_cache.shared_key(token_digest(user_client.token))
+    assert cache.get(key)
+    assert cache.get(token_cache.shared_key(user_client.token)) is None
+
+    # Деактивация в другом процессе удаляет общую запись
+    User.objects.filter(pk=user_client.user.pk).update(is_active=False)
+    assert cache.get(key) is None
+    response = user_client.get('/api/users/me/')
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_queryset_update_invalidates_tokens(user_client):
+    token_queries(user_client)
+    User.objects.filter(pk=user_client.user.pk).update(is_active=False)
+    response = user_client.get('/api/users/me/')
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    User.objects.filter(pk=user_client.user.pk).update(is_active=True)
+    token_queries(user_client)
+    # Профильные поля не касаются аутентификации и запись не трогают
+    User.objects.filter(pk=user_client.user.pk).update(first_name='Имя')
+    assert token_queries(user_client) == []
+
+
+@pytest.mark.django_db
+def test_set_password_checks_current_password_in_database(user_client):
+    token_queries(user_client)
+    # Пароль сменили так, что запись кеша осталась прежней
+    QuerySet.update(
+        User.objects.filter(pk=user_client.user.pk),
+        password=make_password('Other123')
+    )
+    response = user_client.post('/api/users/set_password/', {
+        'current_password': 'Qwerty123',
+        'new_password': 'NewPassword456'
+    })
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
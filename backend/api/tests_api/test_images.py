@@ -0,0 +1,223 @@
+import base64
+import json
+import os
+import time
+from io import BytesIO, StringIO
+
+import pytest
+
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+
+from PIL import Image
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.fields import Base64ImageField
+from recipes.models import Ingredient, Recipe
+from users.models import User
+
+
+def noise(size):
+    # Шум почти не сжимается, размер файла близок к width * height * 3
+    return Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3))
+
+
+def encode_image(size, image_format='PNG', image=None):
+    buffer = BytesIO()
+    image = image or Image.new('RGB', size, (200, 80, 40))
+    image.save(buffer, image_format)
+    data = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/{image_format.lower()};base64,{data}'
+
+
+@pytest.fixture
+def author():
+    return User.objects.create_user(
+        email='author@example.com', username='author', password='Qwerty123'
+    )
+
+
+@pytest.fixture
+def client(author):
+    client = APIClient()
+    client.force_authenticate(author)
+    return client
+
+
+def create_recipe(client):
+    ingredient, _ = Ingredient.objects.get_or_create(
+        name='соль', measurement_unit='г'
+    )
+    response = client.post('/api/recipes/', {
+        'ingredients': [{'id': ingredient.id, 'amount': 5}],
+        'image': encode_image((2000, 1000)),
+        'name': 'Рецепт',
+        'text': 'Описание',
+        'cooking_time': 30
+    }, format='json')
+    assert response.status_code == status.HTTP_201_CREATED
+    return Recipe.objects.get(id=response.data['id'])
+
+
+@pytest.mark.django_db(transaction=True)
+def test_recipe_image_variants(client):
+    recipe = create_recipe(client)
+    recipe.refresh_from_db()
+    assert recipe.image_variants['source'] == recipe.image.name
+    for variant, size in (('card', (480, 240)), ('detail', (1200, 600))):
+        for extension in ('webp', 'jpeg'):
+            name = recipe.image_variants[variant][extension]
+            with default_storage.open(name) as file:
+                assert Image.open(file).size == size
+
+    data = client.get(f'/api/recipes/{recipe.id}/').json()
+    media = 'http://testserver/media/'
+    assert data['image'] == (
+        media + recipe.image_variants['detail']['jpeg']
+    )
+    assert data['image_variants']['card']['webp'] == (
+        media + recipe.image_variants['card']['webp']
+    )
+
+    response = client.put('/api/users/me/avatar/', {
+        'avatar': encode_image((300, 200), 'JPEG')
+    }, format='json')
+    assert response.status_code == status.HTTP_200_OK
+    author = client.get(f'/api/recipes/{recipe.id}/').json()['author']
+    variants = User.objects.get(id=author['id']).avatar_variants['avatar']
+    assert author['avatar'] == media + variants['jpeg']
+    with default_storage.open(variants['webp']) as file:
+        assert Image.open(file).size == (160, 160)
+
+
+@pytest.mark.django_db
+def test_recipe_image_falls_back_to_original(client):
+    # В транзакции теста on_commit не срабатывает, копий еще нет
+    recipe = create_recipe(client)
+    data = client.get(f'/api/recipes/{recipe.id}/').json()
+    original = f'http://testserver{recipe.image.url}'
+    assert data['image'] == original
+    assert data['image_variants'] == {
+        'card': {'webp': original, 'jpeg': original},
+        'detail': {'webp': original, 'jpeg': original},
+    }
+
+
+@pytest.mark.django_db
+def test_build_image_variants_command(client):
+    recipe = create_recipe(client)
+    assert recipe.image_variants == {}
+    out = StringIO()
+    call_command('build_image_variants', '--workers=1', stdout=out)
+    recipe.refresh_from_db()
+    assert recipe.image_variants['source'] == recipe.image.name
+    assert 'recipes: 1 of 1 processed' in out.getvalue()
+
+
+def image_file(size, name='image.png', image=None):
+    buffer = BytesIO()
+    image = image or Image.new('RGB', size, (200, 80, 40))
+    image.save(buffer, 'PNG')
+    buffer.name = name
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.mark.django_db
+def test_multipart_image_upload(client):
+    ingredient = Ingredient.objects.create(name='соль', measurement_unit='г')
+    response = client.post('/api/recipes/', {
+        'ingredients': json.dumps([{'id': ingredient.id, 'amount': 5}]),
+        'image': image_file((40, 30)),
+        'name': 'Рецепт',
+        'text': 'Описание',
+        'cooking_time': 30
+    }, format='multipart')
+    assert response.status_code == status.HTTP_201_CREATED
+    recipe = Recipe.objects.get(id=response.data['id'])
+    with recipe.image.open() as file:
+        assert Image.open(file).size == (40, 30)
+
+    response = client.put('/api/users/me/avatar/', {
+        'avatar': image_file((20, 20))
+    }, format='multipart')
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_image_size_limit(client, settings):
+    settings.IMAGE_UPLOAD_MAX_SIZE = 1024 * 1024
+    picture = noise((700, 700))
+    image = encode_image(picture.size, image=picture)
+
+    response = client.put(
+        '/api/users/me/avatar/', {'avatar': image}, format='json'
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()['avatar'] == [
+        'Размер изображения не должен превышать 1MB'
+    ]
+
+    response = client.put('/api/users/me/avatar/', {
+        'avatar': image_file(picture.size, image=picture)
+    }, format='multipart')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert 'Размер файла не должен превышать 1MB' in response.json()['detail']
+
+    response = client.put('/api/users/me/avatar/', {
+        'avatar': 'data:image/png;base64,!!!!'
+    }, format='json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_wrapped_base64_image(client, author, monkeypatch):
+    # Порции не совпадают с границами строк и четверок base64
+    monkeypatch.setattr(Base64ImageField, 'chunk_size', 64)
+    header, data = encode_image((30, 20)).split(',')
+    wrapped = '\r\n'.join(
+        data[position:position + 76] for position in range(0, len(data), 76)
+    )
+
+    response = client.put('/api/users/me/avatar/', {
+        'avatar': f'{header},{wrapped}\n'
+    }, format='json')
+    assert response.status_code == status.HTTP_200_OK
+    author.refresh_from_db()
+    with author.avatar.open() as file:
+        assert Image.open(file).size == (30, 20)
+
+
+@pytest.mark.django_db
+def test_media_is_content_addressed_and_collected(client, media_root):
+    first = create_recipe(client)
+    second = create_recipe(client)
+    # Одинаковые загрузки ссылаются на один файл
+    assert first.image.name == second.image.name
+    assert first.image.name.startswith('recipes/')
+    digest = os.path.splitext(os.path.basename(first.image.name))[0]
+    assert first.image.name == (
+        f'recipes/{digest[:2]}/{digest[2:4]}/{digest}.png'
+    )
+
+    response = client.put('/api/users/me/avatar/', {
+        'avatar': encode_image((20, 20), 'JPEG')
+    }, format='json')
+    avatar = User.objects.get(email='author@example.com').avatar.name
+    response = client.delete('/api/users/me/avatar/')
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    # Удаление ссылки не удаляет файл, это делает сборщик мусора
+    assert default_storage.exists(avatar)
+
+    old = time.time() - 2 * 60 * 60
+    for path in media_root.rglob('*'):
+        os.utime(path, (old, old))
+    fresh = media_root / 'avatars' / 'fresh.png'
+    fresh.write_bytes(b'x')
+
+    call_command('collect_media_garbage', stdout=StringIO())
+    assert not default_storage.exists(avatar)
+    assert default_storage.exists(first.image.name)
+    assert fresh.exists()
@@ -1,9 +1,18 @@
+import time
+
 import pytest
 
+from django.core.cache import cache
+from django.utils.http import http_date
+
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from api.ingredient_catalog import IngredientCatalog
+from recipes.catalog import CATALOG_VERSION_KEY
+from recipes.ingredient_index import IngredientIndex
 from recipes.models import Ingredient
+from recipes.versions import bump_versions
 
 
 @pytest.fixture
@@ -19,7 +28,7 @@ def test_ingredients_list(client):
 
     response = client.get('/api/ingredients/')
     assert response.status_code == status.HTTP_200_OK
-    assert len(response.data) == 2
+    assert len(response.json()) == 2
 
 
 @pytest.mark.django_db
@@ -32,3 +41,124 @@ def test_ingredients_filter_by_name(client):
     assert response.status_code == status.HTTP_200_OK
     assert len(response.data) == 1
     assert response.data[0]['name'] == 'сахар'
+
+
+@pytest.mark.django_db
+def test_ingredients_autocomplete_served_from_index(
+        client, django_assert_num_queries):
+    # Создаем ингредиенты
+    Ingredient.objects.create(name='Сахар', measurement_unit='г')
+    Ingredient.objects.create(name='сахарная пудра', measurement_unit='г')
+    Ingredient.objects.create(name='соль', measurement_unit='г')
+
+    # Первый запрос строит индекс
+    response = client.get('/api/ingredients/?name=сах')
+    assert [item['name'] for item in response.data] == [
+        'Сахар', 'сахарная пудра'
+    ]
+
+    # Последующие запросы не обращаются к БД
+    with django_assert_num_queries(0):
+        response = client.get('/api/ingredients/?name=СОЛ')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data == [
+        {'id': response.data[0]['id'], 'name': 'соль', 'measurement_unit': 'г'}
+    ]
+
+    # Изменение каталога перестраивает индекс
+    Ingredient.objects.create(name='сахарный сироп', measurement_unit='мл')
+    response = client.get('/api/ingredients/?name=сахарн')
+    assert len(response.data) == 2
+
+
+@pytest.mark.django_db
+def test_ingredients_autocomplete_rechecks_version_after_interval(
+        client, settings):
+    Ingredient.objects.create(name='соль', measurement_unit='г')
+    settings.CATALOG_VERSION_CHECK_INTERVAL = 60
+    assert len(client.get('/api/ingredients/?name=с').data) == 1
+
+    # Другой процесс изменил каталог: bulk_create не шлет сигналов,
+    # версию он увеличивает сам
+    Ingredient.objects.bulk_create(
+        [Ingredient(name='сахар', measurement_unit='г')]
+    )
+    bump_versions([CATALOG_VERSION_KEY])
+    assert len(client.get('/api/ingredients/?name=с').data) == 1
+
+    settings.CATALOG_VERSION_CHECK_INTERVAL = 0
+    assert len(client.get('/api/ingredients/?name=с').data) == 2
+
+
+@pytest.mark.django_db
+def test_ingredients_catalog_conditional_get(client):
+    Ingredient.objects.create(name='Сахар', measurement_unit='г')
+
+    response = client.get('/api/ingredients/')
+    etag = response['ETag']
+    assert not response.has_header('Last-Modified')
+
+    # Неизмененный каталог отдается как 304
+    response = client.get('/api/ingredients/', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    # Сжатый вариант имеет собственный ETag
+    response = client.get('/api/ingredients/', HTTP_ACCEPT_ENCODING='gzip')
+    assert response['Content-Encoding'] == 'gzip'
+    assert response['ETag'] != etag
+
+    # Изменение каталога меняет версию
+    Ingredient.objects.create(name='Соль', measurement_unit='г')
+    response = client.get('/api/ingredients/', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 2
+
+    # Дата с точностью до секунды не различает изменения в одну секунду
+    Ingredient.objects.create(name='Перец', measurement_unit='г')
+    response = client.get(
+        '/api/ingredients/', HTTP_IF_MODIFIED_SINCE=http_date(time.time())
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 3
+
+
+@pytest.mark.django_db
+def test_catalog_version_shared_between_processes():
+    # Второй процесс gunicorn: свои индекс, каталог и пустой кеш
+    Ingredient.objects.create(name='Сахар', measurement_unit='г')
+    first, second = IngredientCatalog(), IngredientCatalog()
+    first_index, second_index = IngredientIndex(), IngredientIndex()
+    assert first_index.startswith_ids('са')
+    etag = first.get_payload().etag
+    cache.clear()
+    assert second.get_payload().etag == etag
+
+    Ingredient.objects.get(name='Сахар').delete()
+    assert second.get_payload().etag != etag
+    assert first.get_payload().etag == second.get_payload().etag
+    assert first_index.startswith_ids('са') == []
+    assert second_index.startswith_ids('са') == []
+
+
+@pytest.mark.django_db
+def test_ingredients_fuzzy_search_ranking(client):
+    Ingredient.objects.create(name='моцарелла', measurement_unit='г')
+    Ingredient.objects.create(name='сыр моцарелла', measurement_unit='г')
+    Ingredient.objects.create(name='пармезан', measurement_unit='г')
+
+    # Префикс идет раньше подстроки
+    response = client.get('/api/ingredients/?name=моцар&fuzzy=1')
+    assert [item['name'] for item in response.data] == [
+        'моцарелла', 'сыр моцарелла'
+    ]
+
+    # Опечатки находятся по сходству триграмм
+    response = client.get('/api/ingredients/?name=мацарела&fuzzy=1')
+    assert 'моцарелла' in [item['name'] for item in response.data]
+
+    response = client.get('/api/ingredients/?name=пормезан&fuzzy=1')
+    assert response.data[0]['name'] == 'пармезан'
+
+    # Без fuzzy опечатка ничего не находит
+    response = client.get('/api/ingredients/?name=пормезан')
+    assert response.data == []
@@ -0,0 +1,104 @@
+import pytest
+
+from django.core.management import call_command
+
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+from users.models import User
+
+
+@pytest.fixture
+def ingredients_file(tmp_path):
+    path = tmp_path / 'ingredients.json'
+    path.write_text(
+        '[{"name": "сахар", "measurement_unit": "г"},\n'
+        ' {"name": "молоко", "measurement_unit": "мл"}]',
+        encoding='utf-8'
+    )
+    return path
+
+
+@pytest.mark.django_db
+def test_load_ingredients_creates_and_updates(ingredients_file, tmp_path):
+    Ingredient.objects.create(name='молоко', measurement_unit='л')
+
+    call_command('load_ingredients', path=str(ingredients_file))
+
+    assert set(Ingredient.objects.values_list(
+        'name', 'measurement_unit'
+    )) == {('сахар', 'г'), ('молоко', 'мл')}
+
+    csv_file = tmp_path / 'ingredients.csv'
+    csv_file.write_text('соль,г\n"молоко 3,2%",мл\n', encoding='utf-8')
+    call_command('load_ingredients', path=str(csv_file), batch_size=1)
+    assert Ingredient.objects.filter(name='молоко 3,2%').exists()
+    assert Ingredient.objects.count() == 4
+
+
+@pytest.mark.django_db
+def test_load_ingredients_noop_reload_is_single_query(
+        ingredients_file, django_assert_num_queries):
+    call_command('load_ingredients', path=str(ingredients_file))
+
+    with django_assert_num_queries(1):
+        call_command('load_ingredients', path=str(ingredients_file))
+
+
+@pytest.mark.django_db
+def test_load_ingredients_dry_run(ingredients_file, capsys):
+    call_command('load_ingredients', path=str(ingredients_file), dry_run=True)
+
+    assert not Ingredient.objects.exists()
+    assert '2 created' in capsys.readouterr().out
+
+
+@pytest.mark.django_db
+def test_load_ingredients_duplicates_and_multiple_units(tmp_path, capsys):
+    flour = Ingredient.objects.bulk_create([
+        Ingredient(name='мука', measurement_unit='г'),
+        Ingredient(name='мука', measurement_unit='стакан'),
+        Ingredient(name='яйца', measurement_unit='шт.'),
+        Ingredient(name='яйца', measurement_unit='г'),
+    ])[0]
+    path = tmp_path / 'ingredients.csv'
+    path.write_text(
+        'сахар,г\nмука,кг\nсахар,кг\nяйца,г\nсахар,ст. л.\n',
+        encoding='utf-8'
+    )
+
+    call_command('load_ingredients', path=str(path))
+
+    assert set(Ingredient.objects.values_list(
+        'name', 'measurement_unit'
+    )) == {('сахар', 'ст. л.'), ('мука', 'кг'), ('мука', 'стакан'),
+           ('яйца', 'шт.'), ('яйца', 'г')}
+    flour.refresh_from_db()
+    assert flour.measurement_unit == 'кг'
+    assert ('1 created, 1 updated, 1 unchanged, 2 duplicates'
+            in capsys.readouterr().out)
+
+
+@pytest.mark.django_db
+def test_load_ingredients_unit_change_refreshes_recipes(tmp_path):
+    author = User.objects.create_user(
+        email='author@example.com', username='author', password='Qwerty123'
+    )
+    milk = Ingredient.objects.create(name='молоко', measurement_unit='л')
+    recipe = Recipe.objects.create(
+        author=author, name='Каша', text='Сварить.', cooking_time=20
+    )
+    RecipeIngredient.objects.create(recipe=recipe, ingredient=milk, amount=1)
+    client = APIClient()
+
+    def units():
+        response = client.get(f'/api/recipes/{recipe.id}/')
+        return [item['measurement_unit']
+                for item in response.json()['ingredients']]
+
+    assert units() == ['л']
+    path = tmp_path / 'ingredients.csv'
+    path.write_text('молоко,мл\n', encoding='utf-8')
+    call_command('load_ingredients', path=str(path))
+
+    assert units() == ['мл']
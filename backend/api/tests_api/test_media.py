@@ -0,0 +1,118 @@
+import pytest
+
+from django.core.files.storage import default_storage
+
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api.media import MediaURLResolver
+from api.tests_api.test_images import create_recipe
+from users.models import User
+
+NAMES = (
+    'recipes/ab/cd/image.png',
+    'recipes/рецепт с пробелом.jpeg',
+    'avatars/a+b%20c#d?.webp',
+)
+
+
+@pytest.fixture
+def client():
+    client = APIClient()
+    client.force_authenticate(User.objects.create_user(
+        email='author@example.com', username='author', password='Qwerty123'
+    ))
+    return client
+
+
+@pytest.mark.parametrize('secure', (False, True))
+def test_resolver_matches_build_absolute_uri(secure):
+    request = APIRequestFactory().get('/api/recipes/', secure=secure)
+    media = MediaURLResolver(request)
+    for name in NAMES:
+        assert media.url(name) == request.build_absolute_uri(
+            default_storage.url(name)
+        )
+        assert media.absolute(default_storage.url(name)) == media.url(name)
+
+
+def test_resolver_honors_forwarded_proto(settings):
+    def request():
+        # nginx передает и Host, и X-Forwarded-Proto
+        return APIRequestFactory().get(
+            '/api/recipes/', HTTP_HOST='testserver',
+            HTTP_X_FORWARDED_PROTO='https'
+        )
+
+    # Без доверия к прокси заголовок клиента не учитывается
+    assert MediaURLResolver(request()).url(NAMES[0]) == (
+        'http://testserver/media/recipes/ab/cd/image.png'
+    )
+    settings.SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+    assert MediaURLResolver(request()).url(NAMES[0]) == (
+        'https://testserver/media/recipes/ab/cd/image.png'
+    )
+
+
+def test_resolver_relative_and_prefix(settings):
+    request = APIRequestFactory().get('/api/recipes/')
+    assert MediaURLResolver().url(NAMES[0]) == (
+        '/media/recipes/ab/cd/image.png'
+    )
+    settings.MEDIA_URLS_RELATIVE = True
+    media = MediaURLResolver(request)
+    assert media.url(NAMES[0]) == '/media/recipes/ab/cd/image.png'
+    assert media.absolute({'card': {'jpeg': '/media/x.jpeg'}}) == {
+        'card': {'jpeg': '/media/x.jpeg'}
+    }
+    settings.MEDIA_URL_PREFIX = 'https://cdn.example.com/media'
+    media = MediaURLResolver(request)
+    assert media.url(NAMES[0]) == (
+        'https://cdn.example.com/media/recipes/ab/cd/image.png'
+    )
+    assert media.absolute('/media/x.jpeg') == (
+        'https://cdn.example.com/media/x.jpeg'
+    )
+
+
+def test_resolver_falls_back_for_missing_variants():
+    media = MediaURLResolver()
+    name = 'recipes/image.png'
+    variants = {'source': name, 'card': {
+        'webp': 'recipes/variants/image-card.webp',
+        'jpeg': 'recipes/variants/image-card.jpeg',
+    }, 'detail': {'jpeg': 'recipes/variants/image-detail.jpeg'}}
+    # Вариант thumb и формат webp для detail добавлены после построения
+    assert media.image_urls(name, variants, ('card', 'detail', 'thumb')) == {
+        'card': {'webp': '/media/recipes/variants/image-card.webp',
+                 'jpeg': '/media/recipes/variants/image-card.jpeg'},
+        'detail': {'webp': '/media/recipes/image.png',
+                   'jpeg': '/media/recipes/variants/image-detail.jpeg'},
+        'thumb': {'webp': '/media/recipes/image.png',
+                  'jpeg': '/media/recipes/image.png'},
+    }
+
+
+@pytest.mark.django_db
+def test_api_media_urls(client, settings):
+    settings.SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+    recipe = create_recipe(client)
+    path = recipe.image.url
+    response = client.get(
+        '/api/recipes/', HTTP_HOST='testserver',
+        HTTP_X_FORWARDED_PROTO='https'
+    )
+    assert response.json()['results'][0]['image'] == (
+        f'https://testserver{path}'
+    )
+    detail = client.get(f'/api/recipes/{recipe.id}/').json()
+    assert detail['image'] == f'http://testserver{path}'
+
+    settings.MEDIA_URLS_RELATIVE = True
+    detail = client.get(f'/api/recipes/{recipe.id}/').json()
+    assert detail['image'] == path
+    assert detail['image_variants']['card']['webp'] == path
+
+    settings.MEDIA_URLS_RELATIVE = False
+    settings.MEDIA_URL_PREFIX = 'https://cdn.example.com/media/'
+    page = client.get('/api/recipes/').json()['results']
+    assert page[0]['image'] == 'https://cdn.example.com' + path
@@ -1,11 +1,21 @@
 import pytest
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from recipes.models import Recipe
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart
+)
+from recipes.pantry import PantryIndex, publish_pantry_changes
 
-from users.models import User
+from users.models import Subscription, User
 
 
 @pytest.fixture
@@ -93,3 +103,532 @@ def test_recipe_delete(client):
     response = client.delete(f'/api/recipes/{recipe.id}/')
     assert response.status_code == status.HTTP_204_NO_CONTENT
     assert not Recipe.objects.filter(id=recipe.id).exists()
+
+
+def _recipe_list_queries(client, limit):
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(f'/api/recipes/?limit={limit}')
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.data['results']) == limit
+    return len(context.captured_queries)
+
+
+@pytest.mark.django_db
+def test_recipes_list_viewer_flags_query_count(client):
+    # Создаем пользователя, авторов и рецепты
+    user = User.objects.create_user(
+        email='user@example.com',
+        username='user',
+        password='Qwerty123'
+    )
+    for index in range(10):
+        author = User.objects.create_user(
+            email=f'author{index}@example.com',
+            username=f'author{index}',
+            password='Qwerty123'
+        )
+        recipe = Recipe.objects.create(
+            author=author,
+            name=f'Рецепт {index}',
+            text='Описание',
+            cooking_time=30
+        )
+        if index % 2:
+            Favorite.objects.create(user=user, recipe=recipe)
+            Subscription.objects.create(user=user, author=author)
+        else:
+            ShoppingCart.objects.create(user=user, recipe=recipe)
+    client.force_authenticate(user)
+
+    # Число запросов не зависит от размера страницы
+    assert _recipe_list_queries(client, 2) == _recipe_list_queries(client, 10)
+
+    response = client.get('/api/recipes/?limit=10')
+    for item in response.data['results']:
+        index = int(item['name'].split()[-1])
+        assert item['is_favorited'] is bool(index % 2)
+        assert item['author']['is_subscribed'] is bool(index % 2)
+        assert item['is_in_shopping_cart'] is not bool(index % 2)
+
+
+@pytest.mark.django_db
+def test_recipes_cursor_pagination(client):
+    user = User.objects.create_user(
+        email='user@example.com',
+        username='user',
+        password='Qwerty123'
+    )
+    other = User.objects.create_user(
+        email='other@example.com',
+        username='other',
+        password='Qwerty123'
+    )
+    for index in range(5):
+        Recipe.objects.create(
+            author=user if index != 2 else other,
+            name=f'Рецепт {index}',
+            text='Описание',
+            cooking_time=30
+        )
+    # Одинаковая дата публикации: порядок задается id
+    Recipe.objects.filter(name__in=['Рецепт 3', 'Рецепт 4']).update(
+        pub_date=Recipe.objects.get(name='Рецепт 3').pub_date
+    )
+
+    names = []
+    url = '/api/recipes/?limit=2&cursor='
+    while url:
+        response = client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert 'count' not in response.data
+        names.extend(item['name'] for item in response.data['results'])
+        url = response.data['next']
+    assert names == [f'Рецепт {index}' for index in (4, 3, 2, 1, 0)]
+
+    # Курсор работает вместе с фильтрами
+    response = client.get(f'/api/recipes/?cursor=&author={other.id}')
+    assert [item['name'] for item in response.data['results']] == [
+        'Рецепт 2'
+    ]
+    assert response.data['next'] is None
+
+    response = client.get('/api/recipes/?cursor=broken')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    # Порядок по ключу потерял бы ранжирование поиска
+    response = client.get('/api/recipes/?cursor=&search=рецепт')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert 'cursor' in response.json()
+
+
+@pytest.mark.django_db
+def test_recipes_fragment_cache(client):
+    user = User.objects.create_user(
+        email='user@example.com',
+        username='user',
+        password='Qwerty123',
+        first_name='Иван'
+    )
+    ingredient = Ingredient.objects.create(name='соль', measurement_unit='г')
+    recipe = Recipe.objects.create(
+        author=user,
+        name='Рецепт 1',
+        text='Описание',
+        cooking_time=30
+    )
+    RecipeIngredient.objects.create(
+        recipe=recipe, ingredient=ingredient, amount=5
+    )
+
+    response = client.get('/api/recipes/')
+    assert response['X-Fragment-Cache'] == 'hits=0, misses=1'
+    first = response.data['results'][0]
+    assert first['ingredients'] == [{
+        'id': ingredient.id,
+        'name': 'соль',
+        'measurement_unit': 'г',
+        'amount': 5
+    }]
+
+    response = client.get(f'/api/recipes/{recipe.id}/')
+    assert response['X-Fragment-Cache'] == 'hits=1, misses=0'
+    assert response.data == first
+
+    # Изменение ингредиентов и профиля автора меняет версию рецепта
+    amount = RecipeIngredient.objects.get(recipe=recipe)
+    amount.amount = 7
+    amount.save()
+    response = client.get('/api/recipes/')
+    assert response['X-Fragment-Cache'] == 'hits=0, misses=1'
+    assert response.data['results'][0]['ingredients'][0]['amount'] == 7
+
+    user.first_name = 'Петр'
+    user.save()
+    response = client.get('/api/recipes/')
+    assert response['X-Fragment-Cache'] == 'hits=0, misses=1'
+    assert response.data['results'][0]['author']['first_name'] == 'Петр'
+
+    # Вход пользователя не сбрасывает кеш его рецептов
+    client.post('/api/auth/token/login/', {
+        'email': 'user@example.com',
+        'password': 'Qwerty123'
+    })
+    response = client.get('/api/recipes/')
+    assert response['X-Fragment-Cache'] == 'hits=1, misses=0'
+
+    # Переименование ингредиента тоже меняет версию рецепта
+    ingredient.name = 'соль морская'
+    ingredient.save()
+    response = client.get('/api/recipes/')
+    assert response['X-Fragment-Cache'] == 'hits=0, misses=1'
+    assert response.data['results'][0]['ingredients'][0]['name'] == (
+        'соль морская'
+    )
+    response = client.get(f'/api/recipes/{recipe.id}/')
+    assert response.data['ingredients'][0]['name'] == 'соль морская'
+
+    # После сохранения версия в объекте - число из базы
+    recipe = Recipe.objects.get(pk=recipe.pk)
+    version = recipe.version
+    recipe.save()
+    assert recipe.version == version + 1
+    recipe.save(update_fields=['name'])
+    assert recipe.version == version + 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_recipes_full_text_search(client):
+    author = User.objects.create_user(
+        email='author@example.com', username='author', password='Qwerty123'
+    )
+    potato = Ingredient.objects.create(name='картофель', measurement_unit='г')
+    fried = Recipe.objects.create(
+        author=author, name='Жареная картошка', text='Жарить на сковороде',
+        cooking_time=30
+    )
+    stew = Recipe.objects.create(
+        author=author, name='Рагу', text='Тушеные овощи и картошка',
+        cooking_time=60
+    )
+    RecipeIngredient.objects.create(
+        recipe=stew, ingredient=potato, amount=300
+    )
+    Recipe.objects.create(
+        author=author, name='Омлет', text='Яйца и молоко', cooking_time=10
+    )
+
+    response = client.get('/api/recipes/', {'search': 'картошкой'})
+    assert response.status_code == status.HTTP_200_OK
+    # Совпадение в названии весит больше совпадения в описании
+    assert [item['id'] for item in response.json()['results']] == [
+        fried.id, stew.id
+    ]
+
+    response = client.get('/api/recipes/', {'search': 'картофеля'})
+    assert [item['id'] for item in response.json()['results']] == [stew.id]
+
+    response = client.get('/api/recipes/', {'search': 'жареная омлет'})
+    assert response.json()['results'] == []
+
+
+@pytest.mark.django_db(transaction=True)
+def test_recipes_pantry(client):
+    author = User.objects.create_user(
+        email='author@example.com', username='author', password='Qwerty123'
+    )
+    egg, milk, flour, salt = Ingredient.objects.bulk_create(
+        Ingredient(name=name, measurement_unit='г')
+        for name in ('яйца', 'молоко', 'мука', 'соль')
+    )
+    recipes = {}
+    for name, ingredients in (
+        ('Омлет', (egg, milk)),
+        ('Блины', (egg, milk, flour)),
+        ('Хлеб', (flour, salt)),
+    ):
+        recipes[name] = Recipe.objects.create(
+            author=author, name=name, text='Описание', cooking_time=10
+        )
+        for ingredient in ingredients:
+            RecipeIngredient.objects.create(
+                recipe=recipes[name], ingredient=ingredient, amount=1
+            )
+
+    url = f'/api/recipes/pantry/?ingredients={egg.id},{milk.id}'
+    response = client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert [item['id'] for item in response.json()['results']] == [
+        recipes['Омлет'].id
+    ]
+
+    response = client.get(url + '&max_missing=1')
+    results = response.json()['results']
+    assert [(item['name'], item['missing_count']) for item in results] == [
+        ('Омлет', 0), ('Блины', 1)
+    ]
+    assert results[1]['missing_ingredients'] == [flour.id]
+
+    # Индекс обновляется при изменении рецепта через API
+    client.force_authenticate(author)
+    response = client.patch(f'/api/recipes/{recipes["Хлеб"].id}/', {
+        'ingredients': [{'id': egg.id, 'amount': 2}],
+        'name': 'Хлеб',
+        'text': 'Описание',
+        'cooking_time': 10
+    }, format='json')
+    assert response.status_code == status.HTTP_200_OK
+    response = client.get(url)
+    assert {item['name'] for item in response.json()['results']} == {
+        'Омлет', 'Хлеб'
+    }
+
+    response = client.get('/api/recipes/pantry/?ingredients=x')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_recipes_pantry_query_count_does_not_depend_on_page_size(client):
+    author = User.objects.create_user(
+        email='author@example.com', username='author', password='Qwerty123'
+    )
+    egg, milk = Ingredient.objects.bulk_create(
+        Ingredient(name=name, measurement_unit='г')
+        for name in ('яйца', 'молоко')
+    )
+    recipes = Recipe.objects.bulk_create(
+        Recipe(author=author, name=f'Омлет {i}', text='Описание',
+               cooking_time=10)
+        for i in range(12)
+    )
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+        for recipe in recipes for ingredient in (egg, milk)
+    )
+    publish_pantry_changes([recipe.id for recipe in recipes])
+    url = f'/api/recipes/pantry/?ingredients={egg.id}&max_missing=1&limit='
+    # Прогрев индекса и кеша фрагментов
+    client.get(url + '10')
+
+    counts = []
+    for limit in (2, 10):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url + str(limit))
+        results = response.json()['results']
+        assert len(results) == limit
+        assert all(
+            item['missing_ingredients'] == [milk.id] for item in results
+        )
+        counts.append(len(queries))
+    assert counts[0] == counts[1]
+
+
+@pytest.mark.django_db
+def test_pantry_index_syncs_between_processes(settings):
+    author = User.objects.create_user(
+        email='author@example.com', username='author', password='Qwerty123'
+    )
+    egg, milk = Ingredient.objects.bulk_create(
+        Ingredient(name=name, measurement_unit='г')
+        for name in ('яйца', 'молоко')
+    )
+    recipe = Recipe.objects.create(
+        author=author, name='Омлет', text='Описание', cooking_time=10
+    )
+    # Индексы двух процессов gunicorn
+    first, second = PantryIndex(), PantryIndex()
+    assert list(first.search([egg.id])) == []
+    assert list(second.search([egg.id])) == []
+
+    # Изменение, записанное первым процессом, видно второму из журнала
+    RecipeIngredient.objects.create(recipe=recipe, ingredient=egg, amount=1)
+    publish_pantry_changes([recipe.id])
+    assert list(first.search([egg.id])) == [(recipe.id, 0)]
+    with CaptureQueriesContext(connection) as queries:
+        assert list(second.search([egg.id])) == [(recipe.id, 0)]
+    assert not any(
+        'recipeingredient' in query['sql'] for query in queries
+    )
+
+    # Процесс, пропустивший удаленные записи журнала, строит индекс заново
+    settings.PANTRY_CHANGE_LOG_TIMEOUT = -1
+    RecipeIngredient.objects.create(recipe=recipe, ingredient=milk, amount=1)
+    publish_pantry_changes([recipe.id])
+    publish_pantry_changes([recipe.id])
+    assert list(second.search([egg.id], max_missing=1)) == [(recipe.id, 1)]
+
+
+@pytest.mark.django_db
+def test_recipe_update_writes_only_ingredient_diff(client):
+    author = User.objects.create_user(
+        email='author@example.com', username='author', password='Qwerty123'
+    )
+    ingredients = Ingredient.objects.bulk_create(
+        Ingredient(name=name, measurement_unit='г')
+        for name in ('мука', 'соль', 'сахар')
+    )
+    recipe = Recipe.objects.create(
+        author=author, name='Хлеб', text='Описание', cooking_time=60
+    )
+    for ingredient in ingredients:
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=10
+        )
+    client.force_authenticate(author)
+
+    def patch(amounts):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.patch(f'/api/recipes/{recipe.id}/', {
+                'ingredients': [
+                    {'id': ingredient.id, 'amount': amount}
+                    for ingredient, amount in zip(ingredients, amounts)
+                ],
+                'name': 'Хлеб',
+                'text': 'Описание',
+                'cooking_time': 60
+            }, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        return [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ]
+
+    # Одно измененное количество: UPDATE строки и версии рецепта
+    writes = patch([10, 15, 10])
+    assert len(writes) == 2
+    assert writes[0].startswith('UPDATE "recipes_recipeingredient"')
+    assert RecipeIngredient.objects.get(
+        recipe=recipe, ingredient=ingredients[1]
+    ).amount == 15
+
+    # Без изменений запись не выполняется вовсе
+    assert patch([10, 15, 10]) == []
+
+    patch([10, 15])
+    ingredients[2].refresh_from_db()
+    assert ingredients[2].usage_count == 0
+    assert recipe.ingredient_amounts.count() == 2
+
+    # Ответ перечисляет ингредиенты в порядке запроса: после первого
+    # расхождения порядка строки вставляются заново
+    def order(items):
+        response = client.patch(f'/api/recipes/{recipe.id}/', {
+            'ingredients': [
+                {'id': ingredients[index].id, 'amount': amount}
+                for index, amount in items
+            ],
+            'name': 'Хлеб',
+            'text': 'Описание',
+            'cooking_time': 60
+        }, format='json')
+        expected = [ingredients[index].id for index, _ in items]
+        assert [item['id'] for item in response.json()['ingredients']] == (
+            expected
+        )
+        response = client.get(f'/api/recipes/{recipe.id}/')
+        assert [item['id'] for item in response.json()['ingredients']] == (
+            expected
+        )
+        return expected
+
+    order([(1, 15), (2, 5), (0, 10)])
+    order([(1, 15), (0, 20), (2, 5)])
+    # Перестановка без изменения количеств тоже видна в ответе
+    order([(2, 5), (1, 15), (0, 20)])
+    assert [
+        (item.ingredient_id, item.amount)
+        for item in recipe.ingredient_amounts.order_by('pk')
+    ] == [(ingredients[2].id, 5), (ingredients[1].id, 15),
+          (ingredients[0].id, 20)]
+    for ingredient in ingredients:
+        ingredient.refresh_from_db()
+        assert ingredient.usage_count == 1
+
+
+@pytest.mark.django_db
+def test_recipes_subscription_feed(client, settings):
+    settings.FEED_FANOUT_MAX_SUBSCRIBERS = 1
+    settings.FEED_MAX_LENGTH = 3
+    user, fan, small, popular = (
+        User.objects.create_user(
+            email=f'{name}@example.com', username=name, password='Qwerty123'
+        )
+        for name in ('user', 'fan', 'small', 'popular')
+    )
+    Recipe.objects.create(
+        author=small, name='Старый', text='Описание', cooking_time=5
+    )
+    Subscription.objects.create(user=user, author=small)
+    Subscription.objects.create(user=user, author=popular)
+    Subscription.objects.create(user=fan, author=popular)
+    for number in range(3):
+        for author in (small, popular, fan):
+            Recipe.objects.create(
+                author=author, name=f'{author.username} {number}',
+                text='Описание', cooking_time=5
+            )
+    # Рецепты популярного автора не копируются, длина ленты ограничена
+    entries = user.feed_entries.all()
+    assert {entry.author_id for entry in entries} == {small.id}
+    assert entries.count() == 3
+    client.force_authenticate(user)
+
+    names, url = [], '/api/recipes/feed/?limit=2'
+    while url:
+        response = client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data['results']) <= 2
+        names += [item['name'] for item in response.data['results']]
+        url = response.data['next']
+    assert names == [
+        'popular 2', 'small 2', 'popular 1', 'small 1', 'popular 0', 'small 0'
+    ]
+
+    # Отписка убирает записи автора, новая подписка переносит рецепты
+    client.delete(f'/api/users/{small.id}/subscribe/')
+    response = client.get('/api/recipes/feed/')
+    assert [item['name'] for item in response.data['results']] == [
+        'popular 2', 'popular 1', 'popular 0'
+    ]
+    client.post(f'/api/users/{fan.id}/subscribe/')
+    response = client.get('/api/recipes/feed/?limit=2')
+    assert [item['name'] for item in response.data['results']] == [
+        'fan 2', 'popular 2'
+    ]
+    assert client.get('/api/recipes/feed/?cursor=broken').status_code == (
+        status.HTTP_404_NOT_FOUND
+    )
+    client.force_authenticate(None)
+    assert client.get('/api/recipes/feed/').status_code == (
+        status.HTTP_401_UNAUTHORIZED
+    )
+
+
+@pytest.mark.django_db
+def test_recipes_sparse_fieldsets(client):
+    user = User.objects.create_user(
+        email='user@example.com',
+        username='user',
+        password='Qwerty123'
+    )
+    salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+    recipe = Recipe.objects.create(
+        author=user, name='Рецепт 1', text='Описание', cooking_time=30
+    )
+    RecipeIngredient.objects.create(recipe=recipe, ingredient=salt, amount=5)
+    Favorite.objects.create(user=user, recipe=recipe)
+    client.force_authenticate(user)
+
+    # Карточке хватает столбцов рецепта: без автора, ингредиентов и text
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(
+            '/api/recipes/?fields=id,name,image,cooking_time'
+        )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['results'] == [{
+        'id': recipe.id, 'name': 'Рецепт 1', 'image': None,
+        'cooking_time': 30
+    }]
+    page_query = queries.captured_queries[-1]['sql']
+    assert '"text"' not in page_query
+    assert 'ingredient' not in ' '.join(
+        query['sql'] for query in queries.captured_queries
+    )
+
+    response = client.get(f'/api/recipes/{recipe.id}/?fields=is_favorited')
+    assert response.data == {'is_favorited': True}
+
+    # Автор и ингредиенты берутся из кеша фрагментов и тоже сокращаются
+    response = client.get(
+        '/api/recipes/?omit=text,image,image_variants,is_in_shopping_cart'
+    )
+    item = response.data['results'][0]
+    assert set(item) == {
+        'id', 'author', 'ingredients', 'is_favorited', 'name',
+        'cooking_time'
+    }
+    assert item['author']['username'] == 'user'
+    assert item['ingredients'][0]['amount'] == 5
+
+    response = client.get('/api/recipes/?fields=id,calories')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.data == {'fields': ['Неизвестные поля: calories']}
@@ -1,13 +1,33 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+
 import pytest
 
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
 
+from api.serializers import RecipeCreateUpdateSerializer
 from users.models import User
 from recipes.models import (
+    Ingredient,
     Recipe,
     Favorite,
-    ShoppingCart
+    ShoppingCart,
+    ShoppingListItem
+)
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAA'
+    'CVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNo'
+    'AAAAggCByxOyYQAAAABJRU5ErkJggg=='
 )
 
 
@@ -132,3 +152,468 @@ def test_recipe_remove_from_shopping_cart(client):
     response = client.delete(f'/api/recipes/{recipe.id}/shopping_cart/')
     assert response.status_code == status.HTTP_204_NO_CONTENT
     assert not ShoppingCart.objects.filter(user=user, recipe=recipe).exists()
+
+
+@pytest.mark.django_db
+def test_relation_counters_are_maintained(client):
+    user = User.objects.create_user(
+        email='user@example.com',
+        username='user',
+        password='Qwerty123'
+    )
+    ingredient = Ingredient.objects.create(name='соль', measurement_unit='г')
+    client.force_authenticate(user)
+
+    response = client.post('/api/recipes/', {
+        'ingredients': [{'id': ingredient.id, 'amount': 5}],
+        'image': IMAGE,
+        'name': 'Рецепт 1',
+        'text': 'Описание',
+        'cooking_time': 30
+    }, format='json')
+    assert response.status_code == status.HTTP_201_CREATED
+    recipe = Recipe.objects.get(id=response.data['id'])
+    user.refresh_from_db()
+    ingredient.refresh_from_db()
+    assert user.recipes_count == 1
+    assert ingredient.usage_count == 1
+
+    client.post(f'/api/recipes/{recipe.id}/favorite/')
+    client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+    recipe.refresh_from_db()
+    assert (recipe.favorites_count, recipe.in_carts_count) == (1, 1)
+
+    client.delete(f'/api/recipes/{recipe.id}/favorite/')
+    recipe.refresh_from_db()
+    assert recipe.favorites_count == 0
+
+    # Команда recount исправляет расхождения
+    Recipe.objects.filter(id=recipe.id).update(in_carts_count=7)
+    call_command('recount', stdout=StringIO())
+    recipe.refresh_from_db()
+    assert recipe.in_carts_count == 1
+
+    client.delete(f'/api/recipes/{recipe.id}/')
+    user.refresh_from_db()
+    ingredient.refresh_from_db()
+    assert user.recipes_count == 0
+    assert ingredient.usage_count == 0
+
+
+@pytest.mark.django_db
+def test_updates_do_not_overwrite_counters():
+    user = User.objects.create_user(
+        email='user@example.com', username='user', password='Qwerty123'
+    )
+    ingredient = Ingredient.objects.create(name='соль', measurement_unit='г')
+    client = APIClient()
+    token = client.post('/api/auth/token/login/', {
+        'email': 'user@example.com', 'password': 'Qwerty123'
+    }).data['auth_token']
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+    # Пользователь попадает в кеш токенов со счетчиком 0
+    assert client.get('/api/users/me/').status_code == status.HTTP_200_OK
+    response = client.post('/api/recipes/', {
+        'ingredients': [{'id': ingredient.id, 'amount': 5}],
+        'image': IMAGE, 'name': 'Рецепт', 'text': 'Описание',
+        'cooking_time': 30
+    }, format='json')
+    recipe_id = response.data['id']
+
+    response = client.put(
+        '/api/users/me/avatar/', {'avatar': IMAGE}, format='json'
+    )
+    assert response.status_code == status.HTTP_200_OK
+    user.refresh_from_db()
+    assert user.avatar
+    assert user.recipes_count == 1
+    assert client.delete('/api/users/me/avatar/').status_code == (
+        status.HTTP_204_NO_CONTENT
+    )
+    user.refresh_from_db()
+    assert user.recipes_count == 1
+
+    # Рецепт добавили в избранное после того, как его прочитали
+    recipe = Recipe.objects.get(id=recipe_id)
+    Favorite.objects.create(user=user, recipe=recipe)
+    request = Request(APIRequestFactory().patch(f'/api/recipes/{recipe_id}/'))
+    serializer = RecipeCreateUpdateSerializer(recipe, data={
+        'ingredients': [{'id': ingredient.id, 'amount': 5}],
+        'name': 'Новый', 'text': 'Описание', 'cooking_time': 45
+    }, partial=True, context={'request': request})
+    serializer.is_valid(raise_exception=True)
+    serializer.save()
+    recipe.refresh_from_db()
+    assert (recipe.name, recipe.cooking_time) == ('Новый', 45)
+    assert recipe.favorites_count == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_shopping_list_follows_cart_and_ingredients(client):
+    user = User.objects.create_user(
+        email='user@example.com',
+        username='user',
+        password='Qwerty123'
+    )
+    salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+    milk = Ingredient.objects.create(name='молоко', measurement_unit='мл')
+    client.force_authenticate(user)
+    recipe_ids = []
+    for name, amount in (('Рецепт 1', 5), ('Рецепт 2', 7)):
+        response = client.post('/api/recipes/', {
+            'ingredients': [
+                {'id': salt.id, 'amount': amount},
+                {'id': milk.id, 'amount': 100}
+            ],
+            'image': IMAGE,
+            'name': name,
+            'text': 'Описание',
+            'cooking_time': 30
+        }, format='json')
+        recipe_ids.append(response.data['id'])
+
+    def download():
+        response = client.get('/api/recipes/download_shopping_cart/')
+        assert response.status_code == status.HTTP_200_OK
+        return response.getvalue().decode()
+
+    for recipe_id in recipe_ids:
+        client.post(f'/api/recipes/{recipe_id}/shopping_cart/')
+    assert download() == (
+        'Список покупок:\n\nмолоко (мл) - 200\nсоль (г) - 12\n'
+    )
+
+    # Изменение рецепта из корзины пересчитывает итоги
+    client.patch(f'/api/recipes/{recipe_ids[0]}/', {
+        'ingredients': [{'id': salt.id, 'amount': 10}],
+        'name': 'Рецепт 1',
+        'text': 'Описание',
+        'cooking_time': 30
+    }, format='json')
+    assert download() == (
+        'Список покупок:\n\nмолоко (мл) - 100\nсоль (г) - 17\n'
+    )
+
+    client.delete(f'/api/recipes/{recipe_ids[1]}/shopping_cart/')
+    assert download() == 'Список покупок:\n\nсоль (г) - 10\n'
+
+    client.delete(f'/api/recipes/{recipe_ids[0]}/')
+    assert download() == 'Список покупок:\n\n'
+
+    # Команда rebuild_shopping_lists исправляет расхождения
+    client.post(f'/api/recipes/{recipe_ids[1]}/shopping_cart/')
+    ShoppingListItem.objects.filter(user=user, ingredient=salt).update(
+        amount=1
+    )
+    ShoppingListItem.objects.filter(user=user, ingredient=milk).delete()
+    call_command('rebuild_shopping_lists', stdout=StringIO())
+    assert download() == (
+        'Список покупок:\n\nмолоко (мл) - 100\nсоль (г) - 7\n'
+    )
+
+
+@pytest.mark.django_db(transaction=True)
+def test_shopping_list_export_formats_and_etag(client):
+    user = User.objects.create_user(
+        email='user@example.com',
+        username='user',
+        password='Qwerty123'
+    )
+    salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+    pepper = Ingredient.objects.create(
+        name='перец <черный>', measurement_unit='г'
+    )
+    client.force_authenticate(user)
+    response = client.post('/api/recipes/', {
+        'ingredients': [
+            {'id': salt.id, 'amount': 5},
+            {'id': pepper.id, 'amount': 2}
+        ],
+        'image': IMAGE,
+        'name': 'Рецепт 1',
+        'text': 'Описание',
+        'cooking_time': 30
+    }, format='json')
+    recipe_id = response.data['id']
+    client.post(f'/api/recipes/{recipe_id}/shopping_cart/')
+    url = '/api/recipes/download_shopping_cart/'
+
+    response = client.get(url, {'format': 'csv'})
+    assert response['Content-Type'] == 'text/csv; charset=utf-8'
+    assert response.streaming
+    assert response.getvalue().decode().splitlines() == [
+        'name,measurement_unit,amount', 'перец <черный>,г,2', 'соль,г,5'
+    ]
+    response = client.get(url, {'format': 'json'})
+    assert json.loads(response.getvalue()) == [
+        {'name': 'перец <черный>', 'measurement_unit': 'г', 'amount': 2},
+        {'name': 'соль', 'measurement_unit': 'г', 'amount': 5}
+    ]
+    body = client.get(url, HTTP_ACCEPT='text/html').getvalue().decode()
+    assert '<td>перец &lt;черный&gt;</td>' in body
+    assert client.get(url, {'format': 'xml'}).status_code == 404
+
+    # Повторная выгрузка берется из кеша, совпавший ETag дает 304
+    response = client.get(url)
+    etag, body = response['ETag'], response.getvalue()
+    cached = client.get(url)
+    assert not cached.streaming
+    assert cached.content == body
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    # Изменения корзины и каталога меняют версию
+    client.delete(f'/api/recipes/{recipe_id}/shopping_cart/')
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.getvalue().decode() == 'Список покупок:\n\n'
+    client.post(f'/api/recipes/{recipe_id}/shopping_cart/')
+    etag = client.get(url)['ETag']
+    salt.name = 'соль морская'
+    salt.save()
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert 'соль морская (г) - 5' in response.getvalue().decode()
+
+    # Одноименные ингредиенты в переводимых единицах складываются
+    salt_kg = Ingredient.objects.create(
+        name='соль морская', measurement_unit='кг'
+    )
+    client.patch(f'/api/recipes/{recipe_id}/', {
+        'ingredients': [
+            {'id': salt.id, 'amount': 200},
+            {'id': salt_kg.id, 'amount': 1},
+            {'id': pepper.id, 'amount': 2}
+        ],
+        'name': 'Рецепт 1',
+        'text': 'Описание',
+        'cooking_time': 30
+    }, format='json')
+    response = client.get(url)
+    assert response.getvalue().decode() == (
+        'Список покупок:\n\nперец <черный> (г) - 2\n'
+        'соль морская (кг) - 1.2\n'
+    )
+    response = client.get(url, {'format': 'json'})
+    assert json.loads(response.getvalue())[1] == {
+        'name': 'соль морская', 'measurement_unit': 'кг', 'amount': 1.2
+    }
+
+
+@pytest.mark.django_db(transaction=True)
+def test_shopping_list_version_shared_between_processes(client):
+    user = User.objects.create_user(
+        email='user@example.com', username='user', password='Qwerty123'
+    )
+    salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+    recipe = Recipe.objects.create(
+        author=user, name='Рецепт', text='Описание', cooking_time=30
+    )
+    recipe.ingredient_amounts.create(ingredient=salt, amount=5)
+    client.force_authenticate(user)
+    client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+    url = '/api/recipes/download_shopping_cart/'
+    etag = client.get(url)['ETag']
+
+    # Другой процесс со своим пустым кешем видит ту же версию
+    cache.clear()
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    client.delete(f'/api/recipes/{recipe.id}/shopping_cart/')
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.getvalue().decode() == 'Список покупок:\n\n'
+
+
+def relation_queries(queries):
+    return [
+        query['sql'] for query in queries
+        if 'SAVEPOINT' not in query['sql']
+    ]
+
+
+@pytest.mark.django_db
+def test_relation_toggles_use_two_queries(client):
+    user = User.objects.create_user(
+        email='user@example.com',
+        username='user',
+        password='Qwerty123'
+    )
+    recipe = Recipe.objects.create(
+        author=user, name='Рецепт 1', text='Описание', cooking_time=30
+    )
+    client.force_authenticate(user)
+    url = f'/api/recipes/{recipe.id}/favorite/'
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.post(url)
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.data['name'] == 'Рецепт 1'
+    sql = relation_queries(queries)
+    # Вставка и чтение рецепта для ответа, плюс счетчик из сигнала
+    assert [query.split()[0] for query in sql] == [
+        'INSERT', 'UPDATE', 'SELECT'
+    ]
+    recipe.refresh_from_db()
+    assert recipe.favorites_count == 1
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.post(url)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.data == {'recipe': ['Рецепт уже в избранном']}
+    assert len(relation_queries(queries)) == 2
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.delete(url)
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert [query.split()[0] for query in relation_queries(queries)] == [
+        'DELETE', 'UPDATE'
+    ]
+    assert client.delete(url).status_code == status.HTTP_400_BAD_REQUEST
+    recipe.refresh_from_db()
+    assert recipe.favorites_count == 0
+
+    for method in (client.post, client.delete):
+        response = method('/api/recipes/0/favorite/')
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        response = method('/api/users/0/subscribe/')
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+    response = client.post(f'/api/users/{user.id}/subscribe/')
+    assert response.data == {'author': ['Нельзя подписаться на самого себя']}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_relation_toggles_under_concurrency():
+    user = User.objects.create_user(
+        email='user@example.com',
+        username='user',
+        password='Qwerty123'
+    )
+    author = User.objects.create_user(
+        email='author@example.com',
+        username='author',
+        password='Qwerty123'
+    )
+    recipe = Recipe.objects.create(
+        author=author, name='Рецепт 1', text='Описание', cooking_time=30
+    )
+    urls = [
+        f'/api/recipes/{recipe.id}/favorite/',
+        f'/api/recipes/{recipe.id}/shopping_cart/',
+        f'/api/users/{author.id}/subscribe/',
+    ]
+    threads = 8
+    barrier = threading.Barrier(threads)
+
+    def hammer(url):
+        client = APIClient()
+        client.force_authenticate(user)
+        barrier.wait()
+        try:
+            return client.post(url).status_code
+        finally:
+            connection.close()
+
+    for url in urls:
+        with ThreadPoolExecutor(threads) as executor:
+            codes = list(executor.map(hammer, [url] * threads))
+        assert sorted(codes) == (
+            [status.HTTP_201_CREATED]
+            + [status.HTTP_400_BAD_REQUEST] * (threads - 1)
+        )
+    recipe.refresh_from_db()
+    author.refresh_from_db()
+    assert (recipe.favorites_count, recipe.in_carts_count) == (1, 1)
+    assert author.subscribers_count == 1
+
+
+@pytest.mark.django_db
+def test_batch_relations_report_each_recipe(client):
+    user = User.objects.create_user(
+        email='user@example.com',
+        username='user',
+        password='Qwerty123'
+    )
+    first, second = (
+        Recipe.objects.create(
+            author=user, name=name, text='Описание', cooking_time=30
+        ) for name in ('Рецепт 1', 'Рецепт 2')
+    )
+    Favorite.objects.create(user=user, recipe=second)
+    client.force_authenticate(user)
+    url = '/api/recipes/favorite/batch/'
+
+    response = client.post(url, {
+        'recipes': [first.id, second.id, 0, first.id]
+    }, format='json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.post(url, {
+            'recipes': [first.id, second.id, 999999, first.id]
+        }, format='json')
+    assert response.status_code == status.HTTP_200_OK
+    results = response.data['results']
+    assert [(item['id'], item['status']) for item in results] == [
+        (first.id, 201), (second.id, 400), (999999, 404)
+    ]
+    assert results[0]['data']['name'] == 'Рецепт 1'
+    assert results[1]['data'] == {'recipe': ['Рецепт уже в избранном']}
+    # Вставка, счетчики и одно чтение рецептов
+    assert [query.split()[0] for query in relation_queries(queries)] == [
+        'INSERT', 'UPDATE', 'SELECT'
+    ]
+    first.refresh_from_db()
+    assert first.favorites_count == 1
+
+    response = client.delete(url, {
+        'recipes': [first.id, second.id, 999999]
+    }, format='json')
+    assert [
+        (item['id'], item['status'], item['data'])
+        for item in response.data['results']
+    ] == [
+        (first.id, 204, None),
+        (second.id, 204, None),
+        (999999, 404, {'detail': 'Страница не найдена.'}),
+    ]
+    assert not Favorite.objects.filter(user=user).exists()
+    response = client.delete(url, {'recipes': [first.id]}, format='json')
+    assert response.data['results'][0]['data'] == {
+        'error': 'Рецепта нет в избранном'
+    }
+
+
+@pytest.mark.django_db
+def test_batch_shopping_cart_updates_shopping_list(client):
+    user = User.objects.create_user(
+        email='user@example.com',
+        username='user',
+        password='Qwerty123'
+    )
+    salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+    recipes = [
+        Recipe.objects.create(
+            author=user, name=f'Рецепт {i}', text='Описание',
+            cooking_time=30
+        ) for i in range(3)
+    ]
+    for amount, recipe in enumerate(recipes, start=1):
+        recipe.ingredient_amounts.create(ingredient=salt, amount=amount)
+    client.force_authenticate(user)
+    url = '/api/recipes/shopping_cart/batch/'
+
+    response = client.post(url, {
+        'recipes': [recipe.id for recipe in recipes]
+    }, format='json')
+    assert {item['status'] for item in response.data['results']} == {201}
+    assert ShoppingListItem.objects.get(user=user).amount == 6
+    assert set(Recipe.objects.values_list('in_carts_count', flat=True)) == {1}
+
+    client.delete(url, {'recipes': [recipes[0].id]}, format='json')
+    assert ShoppingListItem.objects.get(user=user).amount == 5
+    client.delete(url, {
+        'recipes': [recipe.id for recipe in recipes]
+    }, format='json')
+    assert not ShoppingListItem.objects.filter(user=user).exists()
+    assert set(Recipe.objects.values_list('in_carts_count', flat=True)) == {0}
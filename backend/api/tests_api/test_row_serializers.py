@@ -0,0 +1,279 @@
+import json
+
+import pytest
+
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api.row_serializers import (
+    IngredientRows,
+    RecipeMinifiedRows,
+    RecipeRows,
+    UserRows,
+    UserWithRecipesRows
+)
+from api.serializers import (
+    IngredientSerializer,
+    RecipeMinifiedSerializer,
+    RecipeSerializer,
+    UserSerializer,
+    UserWithRecipesSerializer
+)
+from api.tests_api.baseline import (
+    known_fields,
+    label,
+    load_responses,
+    run_scenario
+)
+from api.viewer import ViewerContext
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAA'
+    'CVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNo'
+    'AAAAggCByxOyYQAAAABJRU5ErkJggg=='
+)
+
+
+@pytest.fixture
+def catalog():
+    """Рецепты с готовыми и неготовыми копиями изображений и без них."""
+    viewer = User.objects.create_user(
+        email='viewer@example.com', username='viewer', password='Qwerty123'
+    )
+    author = User.objects.create_user(
+        email='author@example.com', username='author', password='Qwerty123',
+        first_name='Анна', last_name='Иванова'
+    )
+    salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+    milk = Ingredient.objects.create(name='молоко', measurement_unit='мл')
+    client = APIClient()
+    client.force_authenticate(author)
+    client.put('/api/users/me/avatar/', {'avatar': IMAGE}, format='json')
+    for name, ingredients in (
+        ('Блины', [{'id': milk.id, 'amount': 500},
+                   {'id': salt.id, 'amount': 2}]),
+        ('Каша "Дружба"', [{'id': milk.id, 'amount': 250}]),
+    ):
+        client.post('/api/recipes/', {
+            'ingredients': ingredients, 'image': IMAGE, 'name': name,
+            'text': 'Смешать.\nЖарить & подавать <горячим>.',
+            'cooking_time': 20
+        }, format='json')
+    # Копии первого рецепта и аватара готовы, второго рецепта - нет
+    Recipe.objects.filter(name__startswith='Каша').update(image_variants={})
+    for model, pk, field, sizes in (
+        (Recipe, Recipe.objects.get(name='Блины').pk, 'image',
+         ('card', 'detail')),
+        (User, author.pk, 'avatar', ('avatar',)),
+    ):
+        name = model.objects.values_list(field, flat=True).get(pk=pk)
+        model.objects.filter(pk=pk).update(**{f'{field}_variants': {
+            'source': name,
+            **{size: {extension: f'{field}s/variants/{pk}-{size}.{extension}'
+                      for extension in ('webp', 'jpeg')}
+               for size in sizes}
+        }})
+    Recipe.objects.create(
+        author=viewer, name='Без фото', text='', cooking_time=1
+    )
+    first = Recipe.objects.get(name='Блины')
+    Favorite.objects.create(user=viewer, recipe=first)
+    ShoppingCart.objects.create(user=viewer, recipe=first)
+    Subscription.objects.create(user=viewer, author=author)
+    return viewer
+
+
+def contexts(viewer):
+    request = Request(APIRequestFactory().get('/api/recipes/'))
+    request.user = viewer
+    anonymous = Request(APIRequestFactory().get('/api/recipes/'))
+    return {
+        'viewer': lambda: {'request': request},
+        'anonymous': lambda: {'request': anonymous},
+        'fragment': lambda: {'viewer': ViewerContext(None)},
+    }
+
+
+def render(data):
+    return JSONRenderer().render(data)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('context', ['viewer', 'anonymous', 'fragment'])
+@pytest.mark.parametrize('fields', [
+    None,
+    frozenset({'id', 'name', 'image', 'cooking_time'}),
+    frozenset({'author', 'is_favorited', 'text'}),
+])
+def test_recipe_rows_match_recipe_serializer(catalog, context, fields):
+    make_context = contexts(catalog)[context]
+    recipes = Recipe.objects.order_by('id')
+    expected = RecipeSerializer(
+        recipes.select_related('author')
+        .prefetch_related('ingredient_amounts__ingredient'),
+        many=True, context={**make_context(), 'fields': fields}
+    ).data
+    rows = RecipeRows(make_context(), fields)
+    assert render(rows.many(recipes.values(*rows.columns))) == render(
+        expected
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('context', ['viewer', 'anonymous', 'fragment'])
+def test_user_and_ingredient_rows_match_serializers(catalog, context):
+    make_context = contexts(catalog)[context]
+    users = User.objects.order_by('id')
+    rows = UserRows(make_context())
+    assert render(rows.many(users.values(*rows.columns))) == render(
+        UserSerializer(users, many=True, context=make_context()).data
+    )
+
+    recipes = Recipe.objects.order_by('id')
+    rows = RecipeMinifiedRows(make_context())
+    assert render(rows.many(recipes.values(*rows.columns))) == render(
+        RecipeMinifiedSerializer(
+            recipes, many=True, context=make_context()
+        ).data
+    )
+
+    ingredients = Ingredient.objects.all()
+    rows = IngredientRows(make_context())
+    assert render(rows.many(ingredients.values(*rows.columns))) == render(
+        IngredientSerializer(ingredients, many=True).data
+    )
+
+
+@pytest.mark.django_db
+def test_user_with_recipes_rows_match_serializer(catalog):
+    make_context = contexts(catalog)['viewer']
+    authors = User.objects.filter(subscribers__user=catalog)
+    expected = UserWithRecipesSerializer(
+        authors, many=True,
+        context={**make_context(), 'is_subscriptions_list': True}
+    ).data
+    recipes = {}
+    recipe_rows = RecipeMinifiedRows()
+    for row in Recipe.objects.order_by('-pub_date', '-id').values(
+        'author_id', *recipe_rows.columns
+    ):
+        recipes.setdefault(row['author_id'], []).append(row)
+    rows = UserWithRecipesRows({
+        **make_context(), 'is_subscriptions_list': True, 'recipes': recipes
+    })
+    assert render(rows.many(authors.values(*rows.columns))) == render(
+        expected
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('authenticated', [True, False])
+@pytest.mark.parametrize('fields', [
+    None,
+    frozenset({'id', 'name', 'image', 'cooking_time'}),
+    frozenset({'author', 'is_favorited', 'text'}),
+])
+def test_recipe_retrieve_matches_recipe_serializer(
+        catalog, authenticated, fields):
+    client = APIClient()
+    query = '' if fields is None else f'?fields={",".join(sorted(fields))}'
+    for recipe in Recipe.objects.order_by('id'):
+        path = f'/api/recipes/{recipe.id}/{query}'
+        request = Request(APIRequestFactory().get(path))
+        if authenticated:
+            client.force_authenticate(catalog)
+            request.user = catalog
+        expected = render(RecipeSerializer(recipe, context={
+            'request': request, 'fields': fields
+        }).data)
+        cache.clear()
+        # Промах кеша фрагментов, затем попадание
+        for _ in range(2):
+            response = client.get(path)
+            assert response.status_code == 200
+            assert response.content == expected
+
+
+def baseline_expected():
+    """Исходные ответы с учетом намеренных изменений API.
+
+    user-018: в карточке автора новейшие рецепты, от новых к старым, а
+    не первые по дате публикации.
+    """
+    expected = load_responses()
+    author = expected['subscriptions']['results'][0]
+    newest = author['recipes'][::-1]
+    author['recipes'] = newest
+    expected['subscriptions limited']['results'][0]['recipes'] = newest[:1]
+    expected['subscribe']['recipes'] = newest[:1]
+    return expected
+
+
+def api_client(user):
+    client = APIClient()
+    if user is not None:
+        client.force_authenticate(user)
+    return client
+
+
+@pytest.mark.django_db
+def test_api_matches_baseline_responses():
+    expected = baseline_expected()
+    responses = run_scenario(api_client)
+    assert responses.keys() == expected.keys()
+    for name, response in responses.items():
+        assert known_fields(response, expected[name]) == expected[name], name
+
+
+@pytest.mark.django_db
+def test_serializers_and_rows_match_baseline_responses():
+    expected = baseline_expected()
+    run_scenario(api_client)
+    viewer = User.objects.get(username='viewer')
+    author = User.objects.get(username='author')
+
+    def context(user):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        if user is not None:
+            request.user = user
+        return {'request': request}
+
+    def check(name, data):
+        data = label(json.loads(render(data)))
+        assert known_fields(data, expected[name]) == expected[name], name
+
+    recipes = Recipe.objects.order_by('-pub_date', '-id')
+    blini = recipes.get(name='Блины')
+    for user, name in ((viewer, 'recipes viewer'),
+                       (None, 'recipes anonymous')):
+        rows = RecipeRows(context(user))
+        check(name, {**expected[name], 'results': rows.many(
+            recipes.values(*rows.columns)
+        )})
+        check(name, {**expected[name], 'results': RecipeSerializer(
+            recipes, many=True, context=context(user)
+        ).data})
+    for user, name in ((viewer, 'recipe viewer'),
+                       (None, 'recipe anonymous')):
+        rows = RecipeRows(context(user))
+        check(name, rows.one(
+            recipes.values(*rows.columns).get(pk=blini.pk)
+        ))
+        check(name, RecipeSerializer(blini, context=context(user)).data)
+
+    users = User.objects.order_by('id')
+    rows = UserRows(context(viewer))
+    check('users viewer', {**expected['users viewer'], 'results': rows.many(
+        users.values(*rows.columns)
+    )})
+    check('users viewer', {
+        **expected['users viewer'],
+        'results': UserSerializer(
+            users, many=True, context=context(viewer)
+        ).data
+    })
+    check('me', UserSerializer(author, context=context(author)).data)
@@ -0,0 +1,64 @@
+import csv
+from decimal import Decimal
+
+import pytest
+
+from django.conf import settings
+
+from recipes.units import UNITS, canonical_unit, combine_units
+
+INGREDIENTS_CSV = settings.BASE_DIR.parent / 'data' / 'ingredients.csv'
+
+# Единицы каталога, которые нельзя перевести ни в граммы, ни в миллилитры
+COUNTED_UNITS = {
+    'шт.', 'кусок', 'банка', 'горсть', 'щепотка', 'веточка', 'батон'
+}
+
+
+@pytest.fixture
+def catalog_units():
+    if not INGREDIENTS_CSV.exists():
+        pytest.skip('data/ingredients.csv not found')
+    with open(INGREDIENTS_CSV, encoding='utf-8') as file:
+        return {row[1] for row in csv.reader(file)}
+
+
+def test_catalog_units_are_classified(catalog_units):
+    convertible = catalog_units - COUNTED_UNITS
+    assert convertible == {'г', 'мл', 'ч. л.', 'ст. л.', 'капля', 'стакан'}
+    assert all(canonical_unit(unit) in UNITS for unit in convertible)
+    assert not any(canonical_unit(unit) for unit in COUNTED_UNITS)
+
+
+def test_catalog_units_combine_with_each_other(catalog_units):
+    rows = [('вода', unit, 1) for unit in sorted(catalog_units)]
+    combined = list(combine_units(rows))
+    # Масса и объем дают по строке, штучные единицы остаются как есть
+    assert combined == sorted(
+        [('вода', 'г', 1), ('вода', 'мл', Decimal('271.05'))]
+        + [('вода', unit, 1) for unit in COUNTED_UNITS]
+    )
+
+
+@pytest.mark.parametrize('rows, expected', [
+    ([('г', 200), ('кг', 1)], [('кг', Decimal('1.2'))]),
+    ([('г', 500), ('кг', 1), ('кг', 1)], [('кг', Decimal('2.5'))]),
+    ([('мл', 300), ('л', 1)], [('л', Decimal('1.3'))]),
+    ([('ст. л.', 1), ('ч. л.', 2)], [('мл', 25)]),
+    ([('ч. л.', 2), ('ч.л.', 1)], [('ч. л.', 3)]),
+    ([('мг', 300), ('г', 0)], [('мг', 300)]),
+    ([('г', 100), ('мл', 50), ('шт.', 2)],
+     [('г', 100), ('мл', 50), ('шт.', 2)]),
+])
+def test_combine_units(rows, expected):
+    combined = list(combine_units(
+        ('мука', unit, amount) for unit, amount in rows
+    ))
+    assert combined == [('мука', unit, amount) for unit, amount in expected]
+
+
+def test_combine_units_keeps_single_rows_and_order():
+    rows = [('мука', 'г', 1500), ('соль', 'г', 5), ('соль', 'кг', 1)]
+    assert list(combine_units(rows)) == [
+        ('мука', 'г', 1500), ('соль', 'кг', Decimal('1.01'))
+    ]
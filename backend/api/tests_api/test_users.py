@@ -155,3 +155,40 @@ def test_user_avatar_delete(client):
     # Удаляем аватар
     response = client.delete('/api/users/me/avatar/')
     assert response.status_code == status.HTTP_204_NO_CONTENT
+
+
+@pytest.mark.django_db
+def test_users_sparse_fieldsets(client):
+    user = User.objects.create_user(
+        email='user@example.com',
+        username='user',
+        password='Qwerty123'
+    )
+    author = User.objects.create_user(
+        email='author@example.com',
+        username='author',
+        password='Qwerty123'
+    )
+    Subscription.objects.create(user=user, author=author)
+    client.force_authenticate(user)
+
+    response = client.get('/api/users/?fields=id,username')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['results'] == [
+        {'id': user.id, 'username': 'user'},
+        {'id': author.id, 'username': 'author'},
+    ]
+    response = client.get('/api/users/me/?omit=avatar,avatar_variants')
+    assert set(response.data) == {
+        'email', 'id', 'username', 'first_name', 'last_name',
+        'is_subscribed'
+    }
+
+    response = client.get(
+        '/api/users/subscriptions/?fields=id,username,recipes_count'
+    )
+    assert response.data['results'] == [
+        {'id': author.id, 'username': 'author', 'recipes_count': 0}
+    ]
+    response = client.get('/api/users/?omit=recipes')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
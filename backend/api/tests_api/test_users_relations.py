@@ -1,5 +1,7 @@
 import pytest
 
+from django.db import connection
+
 from rest_framework import status
 from rest_framework.test import APIClient
 
@@ -51,3 +53,96 @@ def test_user_subscriptions(client):
     assert response.status_code == status.HTTP_201_CREATED
     assert response.data['recipes_count'] == 2
     assert len(response.data['recipes']) == 2
+
+
+@pytest.fixture
+def subscriptions(client):
+    user = User.objects.create_user(
+        email='user@example.com',
+        username='user',
+        password='Qwerty123'
+    )
+    authors = []
+    for number in range(4):
+        author = User.objects.create_user(
+            email=f'author{number}@example.com',
+            username=f'author{number}',
+            password='Qwerty123'
+        )
+        for index in range(5):
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number}-{index}',
+                text='Описание', cooking_time=10
+            )
+        user.subscriptions.create(author=author)
+        authors.append(author)
+    client.force_authenticate(user)
+    return authors
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('window', [True, False])
+def test_subscriptions_prefetch_newest_recipes(
+        client, subscriptions, window, monkeypatch,
+        django_assert_num_queries):
+    monkeypatch.setattr(
+        connection.features, 'supports_over_clause', window
+    )
+    newest = {
+        author.id: list(
+            author.recipes.order_by('-pub_date', '-id')
+            .values_list('id', flat=True)[:2]
+        )
+        for author in subscriptions
+    }
+    # Количество, страница авторов и их рецепты одним запросом
+    with django_assert_num_queries(3):
+        response = client.get(
+            '/api/users/subscriptions/', {'recipes_limit': 2, 'limit': 10}
+        )
+    assert response.status_code == status.HTTP_200_OK
+    assert {
+        item['id']: [recipe['id'] for recipe in item['recipes']]
+        for item in response.data['results']
+    } == newest
+    assert {item['recipes_count'] for item in response.data['results']} == {5}
+
+
+@pytest.mark.django_db
+def test_recipes_limit_is_validated(client, subscriptions):
+    for value in ('abc', '-1'):
+        response = client.get(
+            '/api/users/subscriptions/', {'recipes_limit': value}
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+    author = User.objects.create_user(
+        email='new@example.com', username='new', password='Qwerty123'
+    )
+    response = client.post(
+        f'/api/users/{author.id}/subscribe/?recipes_limit=x'
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert not author.subscribers.exists()
+
+    # Ноль означает «без ограничения»
+    response = client.get(
+        '/api/users/subscriptions/', {'recipes_limit': 0}
+    )
+    assert {
+        len(item['recipes']) for item in response.data['results']
+    } == {5}
+
+
+@pytest.mark.django_db
+def test_subscribe_response_uses_limited_prefetch(
+        client, subscriptions):
+    author = subscriptions[0]
+    author.subscribers.all().delete()
+    response = client.post(
+        f'/api/users/{author.id}/subscribe/?recipes_limit=3'
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert [recipe['id'] for recipe in response.data['recipes']] == list(
+        author.recipes.order_by('-pub_date', '-id')
+        .values_list('id', flat=True)[:3]
+    )
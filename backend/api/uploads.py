@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http.multipartparser import MultiPartParserError
+
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загружаемые файлы на диск и обрывает загрузку сверх лимита.
+
+    Файл не накапливается в памяти целиком, а лимит проверяется по мере
+    получения данных, до того как запрос прочитан до конца.
+    """
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.file.close()
+            max_mb = settings.IMAGE_UPLOAD_MAX_SIZE // (1024 * 1024)
+            raise MultiPartParserError(
+                f'Размер файла не должен превышать {max_mb}MB'
+            )
+        return super().receive_data_chunk(raw_data, start)
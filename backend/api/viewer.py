@@ -0,0 +1,70 @@
+from users.models import Subscription
+from recipes.models import Favorite, ShoppingCart
+
+
+class ViewerContext:
+    """Флаги текущего пользователя для рецептов и авторов в ответе.
+
+    Флаги загружаются пачкой на страницу: не более трех запросов на
+    избранное, корзину и подписки. Для объектов вне загруженной пачки
+    флаги догружаются по требованию.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.is_authenticated = bool(user and user.is_authenticated)
+        self._favorited = set()
+        self._in_cart = set()
+        self._subscribed = set()
+        self._loaded_recipes = set()
+        self._loaded_authors = set()
+
+    @classmethod
+    def from_context(cls, context):
+        """Общий для всех сериализаторов ответа объект из контекста."""
+        viewer = context.get('viewer')
+        if viewer is None:
+            request = context.get('request')
+            viewer = cls(getattr(request, 'user', None))
+            context['viewer'] = viewer
+        return viewer
+
+    def preload(self, recipe_ids=(), author_ids=()):
+        if not self.is_authenticated:
+            return self
+
+        recipe_ids = set(recipe_ids) - self._loaded_recipes
+        if recipe_ids:
+            self._favorited.update(Favorite.objects.filter(
+                user=self.user, recipe_id__in=recipe_ids
+            ).values_list('recipe_id', flat=True))
+            self._in_cart.update(ShoppingCart.objects.filter(
+                user=self.user, recipe_id__in=recipe_ids
+            ).values_list('recipe_id', flat=True))
+            self._loaded_recipes |= recipe_ids
+
+        author_ids = set(author_ids) - self._loaded_authors
+        if author_ids:
+            self._subscribed.update(Subscription.objects.filter(
+                user=self.user, author_id__in=author_ids
+            ).values_list('author_id', flat=True))
+            self._loaded_authors |= author_ids
+        return self
+
+    def is_favorited(self, recipe_id):
+        if not self.is_authenticated:
+            return False
+        self.preload(recipe_ids=[recipe_id])
+        return recipe_id in self._favorited
+
+    def is_in_shopping_cart(self, recipe_id):
+        if not self.is_authenticated:
+            return False
+        self.preload(recipe_ids=[recipe_id])
+        return recipe_id in self._in_cart
+
+    def is_subscribed(self, author_id):
+        if not self.is_authenticated:
+            return False
+        self.preload(author_ids=[author_id])
+        return author_id in self._subscribed
@@ -1,12 +1,14 @@
 from django.conf import settings
-from django.db.models import Count, Exists, OuterRef, Prefetch, Sum
-from django.http import HttpResponse
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Prefetch, Subquery, Window
+from django.db.models.functions import RowNumber
 from django.shortcuts import get_object_or_404
 
 from djoser.views import UserViewSet as DjoserUserViewSet
 
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import (
     AllowAny,
     IsAuthenticated,
@@ -15,35 +17,124 @@ from rest_framework.permissions import (
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from users.models import User
+from users.models import Subscription, User
+from recipes.feed import Feed
+from recipes.ingredient_index import ingredient_index
+from recipes.ingredient_search import search_ingredients
+from recipes.pantry import pantry_index
+from recipes.relations import (
+    add_relation,
+    add_relations,
+    remove_relation,
+    remove_relations
+)
 from recipes.models import (
     Ingredient,
     Recipe,
-    RecipeIngredient,
     Favorite,
     ShoppingCart
 )
 
 
+from .fieldsets import parse_fieldset
 from .filters import IngredientFilter, RecipeFilter
-from .pagination import PageNumberPaginationWithLimit
+from .fragments import FRAGMENT_ROW_FIELDS, recipe_fragments
+from .ingredient_catalog import ingredient_catalog
+from .pagination import (
+    FeedPagination,
+    PageNumberPaginationWithLimit,
+    RecipePagination
+)
 from .permissions import IsAuthorOrReadOnly
+from .row_serializers import (
+    RecipeMinifiedRows,
+    RecipeRows,
+    UserRows,
+    UserWithRecipesRows
+)
+from .shopping_list_export import EXPORT_RENDERERS, shopping_list_export
 from .serializers import (
     CustomUserCreateSerializer,
-    FavoriteSerializer,
     IngredientSerializer,
+    PantryQuerySerializer,
+    RecipeIdsSerializer,
     RecipeCreateUpdateSerializer,
+    RecipeMinifiedSerializer,
+    RecipesLimitSerializer,
     RecipeSerializer,
     SetAvatarSerializer,
     SetPasswordSerializer,
-    ShoppingCartSerializer,
-    SubscriptionSerializer,
     UserSerializer,
     UserWithRecipesSerializer,
     ShortCodeValidatorSerializer,
 )
 
 
+def newest_recipes(queryset, limit=None):
+    """Не более limit новейших рецептов каждого автора из queryset.
+
+    Отбор выполняется одним запросом с ROW_NUMBER() OVER (PARTITION BY
+    author_id). Без оконных функций берутся id из коррелированного
+    подзапроса с LIMIT для каждого автора.
+    """
+    queryset = queryset.order_by('-pub_date', '-id')
+    if limit is None:
+        return queryset
+    if connection.features.supports_over_clause:
+        return queryset.annotate(author_position=Window(
+            RowNumber(),
+            partition_by=F('author_id'),
+            order_by=[F('pub_date').desc(), F('id').desc()]
+        )).filter(author_position__lte=limit)
+    newest = Recipe.objects.filter(
+        author_id=OuterRef('author_id')
+    ).order_by('-pub_date', '-id').values('id')[:limit]
+    return queryset.filter(pk__in=Subquery(newest))
+
+
+def author_recipes_prefetch(limit=None):
+    """Предзагрузка новейших рецептов авторов в атрибут newest_recipes."""
+    queryset = Recipe.objects.only(
+        'id', 'author_id', 'name', 'image', 'image_variants', 'cooking_time'
+    )
+    return Prefetch(
+        'recipes', queryset=newest_recipes(queryset, limit),
+        to_attr='newest_recipes'
+    )
+
+
+# Ошибки связей с рецептом: (связь уже есть, связи нет)
+RELATION_ERRORS = {
+    Favorite: ('Рецепт уже в избранном', 'Рецепта нет в избранном'),
+    ShoppingCart: (
+        'Рецепт уже в списке покупок', 'Рецепта нет в списке покупок'
+    ),
+}
+
+# Поля рецепта для ответа RecipeMinifiedSerializer
+RELATION_RECIPE_FIELDS = (
+    'id', 'name', 'image', 'image_variants', 'cooking_time'
+)
+
+
+# Поля рецепта, которые собираются через кеш фрагментов
+FRAGMENT_FIELDS = {'author', 'ingredients'}
+
+
+def parse_pk(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise NotFound
+
+
+def get_recipes_limit(request):
+    params = RecipesLimitSerializer(data=request.query_params)
+    params.is_valid(raise_exception=True)
+    # 0, как и отсутствие параметра, означает «без ограничения»
+    return params.validated_data.get('recipes_limit') or None
+
+
 class UserViewSet(DjoserUserViewSet):
     """Вьюсет для работы с пользователями"""
     queryset = User.objects.all()
@@ -55,12 +146,36 @@ class UserViewSet(DjoserUserViewSet):
             return CustomUserCreateSerializer
         return super().get_serializer_class()
 
+    def get_fieldset(self):
+        if self.action not in ('list', 'retrieve', 'me'):
+            return None
+        return parse_fieldset(self.request, UserSerializer.Meta.fields)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_fieldset()
+        if fields is not None:
+            queryset = queryset.only('id', *UserRows(fields=fields).columns)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        rows = UserRows(self.get_serializer_context(), self.get_fieldset())
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset.values('id', *rows.columns))
+        return self.get_paginated_response(rows.many(page))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.get_fieldset()
+        return context
+
     @action(['post'], detail=False, permission_classes=[IsAuthenticated])
     def set_password(self, request):
         serializer = SetPasswordSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        user = request.user
+        # request.user мог прийти из кеша токенов с устаревшим паролем
+        user = User.objects.get(pk=request.user.pk)
         if not user.check_password(serializer.data['current_password']):
             return Response(
                 {'current_password': ['Неверный пароль']},
@@ -68,7 +183,7 @@ class UserViewSet(DjoserUserViewSet):
             )
 
         user.set_password(serializer.data['new_password'])
-        user.save()
+        user.save(update_fields=['password'])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -98,7 +213,8 @@ class UserViewSet(DjoserUserViewSet):
 
         elif request.method == 'DELETE':
             if user.avatar:
-                user.avatar.delete()
+                user.avatar.delete(save=False)
+                user.save(update_fields=['avatar'])
             return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(['get'], detail=False, permission_classes=[IsAuthenticated])
@@ -108,19 +224,30 @@ class UserViewSet(DjoserUserViewSet):
 
     @action(['post'], detail=True, permission_classes=[IsAuthenticated])
     def subscribe(self, request, id=None):
-        author = get_object_or_404(
-            User.objects.annotate(recipes_count=Count('recipes')),
-            id=id
-        )
+        author_id = parse_pk(id)
+        recipes_limit = get_recipes_limit(request)
+        if author_id == request.user.pk:
+            return Response(
+                {'author': ['Нельзя подписаться на самого себя']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        serializer = SubscriptionSerializer(
-            data={'author': author.id},
-            context={'request': request}
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save(user=request.user)
+        with transaction.atomic():
+            created = add_relation(
+                Subscription, request.user.pk, 'author', author_id
+            )
+        # Автор нужен для ответа, заодно отличаем 404 от повтора
+        author = User.objects.filter(pk=author_id).prefetch_related(
+            author_recipes_prefetch(recipes_limit)
+        ).first()
+        if author is None:
+            raise NotFound
+        if created is None:
+            return Response(
+                {'author': ['Вы уже подписаны на этого автора']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        recipes_limit = request.query_params.get('recipes_limit')
         response_serializer = UserWithRecipesSerializer(
             author,
             context={
@@ -133,13 +260,15 @@ class UserViewSet(DjoserUserViewSet):
 
     @subscribe.mapping.delete
     def unsubscribe(self, request, id=None):
-        author = get_object_or_404(User, id=id)
-
-        deleted_count, _ = request.user.subscriptions.filter(
-            author=author
-        ).delete()
+        author_id = parse_pk(id)
+        with transaction.atomic():
+            deleted = remove_relation(
+                Subscription, request.user.pk, 'author', author_id
+            )
 
-        if deleted_count == 0:
+        if deleted is None:
+            if not User.objects.filter(pk=author_id).exists():
+                raise NotFound
             return Response(
                 {'error': 'Вы не подписаны на этого автора'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -149,29 +278,33 @@ class UserViewSet(DjoserUserViewSet):
 
     @action(['get'], detail=False, permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
+        recipes_limit = get_recipes_limit(request)
+        fields = parse_fieldset(
+            request, UserWithRecipesSerializer.Meta.fields
+        )
+        context = {
+            'request': request,
+            'is_subscriptions_list': True,
+            'recipes': {}
+        }
+        rows = UserWithRecipesRows(context, fields)
         authors = User.objects.filter(
             subscribers__user=request.user
-        ).annotate(
-            recipes_count=Count('recipes')
-        ).prefetch_related(
-            Prefetch('recipes', queryset=Recipe.objects.all().only(
-                'id', 'name', 'image', 'cooking_time'))
-        )
+        ).values('id', *rows.columns)
 
         paginator = PageNumberPaginationWithLimit()
         result_page = paginator.paginate_queryset(authors, request)
-        recipes_limit = request.query_params.get('recipes_limit')
-
-        serializer = UserWithRecipesSerializer(
-            result_page,
-            many=True,
-            context={
-                'request': request,
-                'recipes_limit': recipes_limit,
-                'is_subscriptions_list': True
-            }
-        )
-        return paginator.get_paginated_response(serializer.data)
+        if 'recipes' in rows.names:
+            recipes = newest_recipes(Recipe.objects.filter(
+                author_id__in=[author['id'] for author in result_page]
+            ), recipes_limit)
+            for recipe in recipes.values(
+                'author_id', *RecipeMinifiedRows().columns
+            ):
+                context['recipes'].setdefault(
+                    recipe['author_id'], []
+                ).append(recipe)
+        return paginator.get_paginated_response(rows.many(result_page))
 
 
 class RecipeShortLinkView(APIView):
@@ -231,45 +364,142 @@ class IngredientViewSet(mixins.ListModelMixin,
     pagination_class = None  # !!!
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        # Автодополнение обслуживается индексом в памяти; версию каталога
+        # он сверяет с БД не чаще раза в CATALOG_VERSION_CHECK_INTERVAL
+        name = request.query_params.get('name')
+        if name:
+            if request.query_params.get('fuzzy') in ('1', 'true'):
+                return Response(search_ingredients(name))
+            return Response(ingredient_index.startswith(name))
+        # Полный каталог отдается заранее отрендеренным
+        return ingredient_catalog.response(request)
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """Вьюсет для работы с рецептами"""
     http_method_names = ['get', 'post', 'patch', 'delete', 'head', 'options']
     permission_classes = [IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
-    pagination_class = PageNumberPaginationWithLimit
+    pagination_class = RecipePagination
     filterset_class = RecipeFilter
 
     def get_queryset(self):
-        queryset = Recipe.objects.all().order_by('-pub_date')
+        # Связанные объекты подгружает кеш фрагментов при промахе
+        return Recipe.objects.all().order_by('-pub_date', '-id')
 
-        queryset = queryset.select_related('author').prefetch_related(
-            Prefetch(
-                'ingredient_amounts',
-                queryset=RecipeIngredient.objects.select_related('ingredient')
-            )
+    def get_fieldset(self):
+        return parse_fieldset(self.request, RecipeSerializer.Meta.fields)
+
+    def column_rows(self, fields):
+        """Сериализатор рецептов без автора и ингредиентов.
+
+        None, если для полей fields нужен кеш фрагментов.
+        """
+        if fields is None or not fields.isdisjoint(FRAGMENT_FIELDS):
+            return None
+        return RecipeRows(self.get_serializer_context(), fields)
+
+    def render_recipes(self, rows, fields=None):
+        data, misses = recipe_fragments.render(rows, self.request, fields)
+        self.fragment_cache_header = (
+            f'hits={len(rows) - misses}, misses={misses}'
         )
+        return data
 
-        user = self.request.user
-        if user.is_authenticated:
-            queryset = queryset.annotate(
-                is_favorited=Exists(
-                    Favorite.objects.filter(
-                        user=user,
-                        recipe=OuterRef('pk')
-                    ),
-                    is_in_shopping_list=Exists(
-                        ShoppingCart.objects.filter(
-                            user=user,
-                            recipe=OuterRef('pk')
-                        )
-                    )))
-        return queryset
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        header = getattr(self, 'fragment_cache_header', None)
+        if header:
+            response['X-Fragment-Cache'] = header
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        fields = self.get_fieldset()
+        rows = self.column_rows(fields)
+        if rows is not None:
+            # Строки содержат только нужные столбцы и ключ курсора
+            page = self.paginate_queryset(
+                queryset.values('id', 'pub_date', *rows.columns)
+            )
+            return self.get_paginated_response(rows.many(page))
+        page = self.paginate_queryset(
+            queryset.values(*FRAGMENT_ROW_FIELDS)
+        )
+        return self.get_paginated_response(self.render_recipes(page, fields))
+
+    def retrieve(self, request, *args, **kwargs):
+        fields = self.get_fieldset()
+        rows = self.column_rows(fields)
+        if rows is not None:
+            row = get_object_or_404(
+                self.get_queryset().values(*rows.columns), pk=kwargs['pk']
+            )
+            return Response(rows.one(row))
+        row = get_object_or_404(
+            self.get_queryset().values(*FRAGMENT_ROW_FIELDS),
+            pk=kwargs['pk']
+        )
+        return Response(self.render_recipes([row], fields)[0])
 
     def get_serializer_class(self):
         if self.action in ['create', 'partial_update']:
             return RecipeCreateUpdateSerializer
         return RecipeSerializer
 
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated]
+    )
+    def feed(self, request):
+        """Рецепты авторов из подписок пользователя, от новых к старым."""
+        paginator = FeedPagination()
+        page = paginator.paginate_feed(Feed(request.user.pk), request)
+        rows = {
+            row['id']: row for row in Recipe.objects.filter(
+                pk__in=[item['id'] for item in page]
+            ).values(*FRAGMENT_ROW_FIELDS)
+        }
+        return paginator.get_paginated_response(self.render_recipes(
+            [rows[item['id']] for item in page if item['id'] in rows],
+            self.get_fieldset()
+        ))
+
+    @action(detail=False, methods=['get'])
+    def pantry(self, request):
+        """Рецепты из ингредиентов кладовой, сначала полностью готовые."""
+        params = PantryQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        matches = pantry_index.search(
+            params.validated_data['ingredients'],
+            params.validated_data['max_missing']
+        )
+        # Порядок задает индекс, поэтому курсор по дате здесь неприменим
+        paginator = PageNumberPaginationWithLimit()
+        page = paginator.paginate_queryset(matches, request, view=self)
+        rows = {
+            row['id']: row for row in Recipe.objects.filter(
+                pk__in=[pk for pk, _ in page]
+            ).values(*FRAGMENT_ROW_FIELDS)
+        }
+        data = {
+            item['id']: item for item in self.render_recipes(
+                [rows[pk] for pk, _ in page if pk in rows]
+            )
+        }
+        results = []
+        for pk, missing in page:
+            if pk not in data:
+                continue
+            item = data[pk]
+            item['missing_count'] = missing
+            item['missing_ingredients'] = matches.missing_ingredients(pk)
+            results.append(item)
+        return paginator.get_paginated_response(results)
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -279,14 +509,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated]
     )
     def favorite(self, request, pk=None):
-        return self._handle_relation(
-            request,
-            pk,
-            FavoriteSerializer,
-            Favorite,
-            'Рецепт уже в избранном',
-            'Рецепта нет в избранном'
-        )
+        return self._handle_relation(request, pk, Favorite)
 
     @action(
         detail=True,
@@ -294,77 +517,132 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated]
     )
     def shopping_cart(self, request, pk=None):
-        return self._handle_relation(
-            request,
-            pk,
-            ShoppingCartSerializer,
-            ShoppingCart,
-            'Рецепт уже в списке покупок',
-            'Рецепта нет в списке покупок'
-        )
+        return self._handle_relation(request, pk, ShoppingCart)
 
-    def _handle_relation(
-            self,
-            request,
-            pk,
-            serializer_class,
-            model,
-            exists_error,
-            not_found_error
-    ):
-        recipe = get_object_or_404(Recipe, pk=pk)
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='favorite/batch'
+    )
+    def favorite_batch(self, request):
+        return self._handle_relations(request, Favorite)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_cart/batch'
+    )
+    def shopping_cart_batch(self, request):
+        return self._handle_relations(request, ShoppingCart)
+
+    def _handle_relation(self, request, pk, model):
+        recipe_id = parse_pk(pk)
         user = request.user
-        data = {'recipe': recipe.id}
+        exists_error, not_found_error = RELATION_ERRORS[model]
 
         if request.method == 'POST':
-            serializer = serializer_class(
-                data=data,
-                context={'request': request}
+            # Связь и зависящие от нее итоги сохраняются вместе
+            with transaction.atomic():
+                created = add_relation(model, user.pk, 'recipe', recipe_id)
+            # Рецепт нужен для ответа, заодно отличаем 404 от повтора
+            recipe = Recipe.objects.filter(pk=recipe_id).only(
+                *RELATION_RECIPE_FIELDS
+            ).first()
+            if recipe is None:
+                raise NotFound
+            if created is None:
+                return Response(
+                    {'recipe': [exists_error]},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return Response(
+                RecipeMinifiedSerializer(
+                    recipe, context={'request': request}
+                ).data,
+                status=status.HTTP_201_CREATED
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save(user=user)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            obj = model.objects.filter(user=user, recipe=recipe).first()
-            if not obj:
+            with transaction.atomic():
+                deleted = remove_relation(
+                    model, user.pk, 'recipe', recipe_id
+                )
+            if deleted is None:
+                if not Recipe.objects.filter(pk=recipe_id).exists():
+                    raise NotFound
                 return Response(
                     {'error': not_found_error},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            obj.delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def _handle_relations(self, request, model):
+        """Пакетный _handle_relation для списка рецептов.
+
+        Для каждого рецепта results содержит код и тело ответа, которые
+        вернул бы одиночный запрос. Рецепты проверяются одним запросом
+        с IN, связи пишутся одним INSERT или DELETE.
+        """
+        params = RecipeIdsSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(params.validated_data['recipes']))
+        user = request.user
+        exists_error, not_found_error = RELATION_ERRORS[model]
+        not_found = {'detail': str(NotFound.default_detail)}
+        results = []
+
+        if request.method == 'POST':
+            with transaction.atomic():
+                created = add_relations(model, user.pk, 'recipe', recipe_ids)
+            recipes = Recipe.objects.only(
+                *RELATION_RECIPE_FIELDS
+            ).in_bulk(recipe_ids)
+            for pk in recipe_ids:
+                if pk not in recipes:
+                    results.append((pk, status.HTTP_404_NOT_FOUND, not_found))
+                elif pk not in created:
+                    results.append((pk, status.HTTP_400_BAD_REQUEST,
+                                    {'recipe': [exists_error]}))
+                else:
+                    results.append((
+                        pk, status.HTTP_201_CREATED,
+                        RecipeMinifiedSerializer(
+                            recipes[pk], context={'request': request}
+                        ).data
+                    ))
+
+        if request.method == 'DELETE':
+            with transaction.atomic():
+                deleted = remove_relations(
+                    model, user.pk, 'recipe', recipe_ids
+                )
+            missing = [pk for pk in recipe_ids if pk not in deleted]
+            existing = set(Recipe.objects.filter(
+                pk__in=missing
+            ).values_list('pk', flat=True)) if missing else set()
+            for pk in recipe_ids:
+                if pk in deleted:
+                    results.append((pk, status.HTTP_204_NO_CONTENT, None))
+                elif pk not in existing:
+                    results.append((pk, status.HTTP_404_NOT_FOUND, not_found))
+                else:
+                    results.append((pk, status.HTTP_400_BAD_REQUEST,
+                                    {'error': not_found_error}))
+
+        return Response({'results': [
+            {'id': pk, 'status': code, 'data': data}
+            for pk, code, data in results
+        ]})
+
     @action(
         detail=False,
         methods=['get'],
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        renderer_classes=EXPORT_RENDERERS
     )
     def download_shopping_cart(self, request):
-        user = request.user
-        ingredients = (
-            RecipeIngredient.objects
-            .filter(recipe__in_shopping_cart__user=user)
-            .values(
-                'ingredient__name',
-                'ingredient__measurement_unit'
-            )
-            .annotate(total_amount=Sum('amount'))
-            .order_by('ingredient__name')
-        )
-
-        text = "Список покупок:\n\n"
-        for item in ingredients:
-            text += (
-                f"{item['ingredient__name']} "
-                f"({item['ingredient__measurement_unit']}) - "
-                f"{item['total_amount']}\n"
-            )
-
-        response = HttpResponse(
-            text,
-            content_type='text/plain; charset=utf-8'
+        return shopping_list_export.response(
+            request, request.accepted_renderer
         )
-        response['Content-Disposition'] = ('attachment;'
-                                           ' filename="shopping_cart.txt"')
-        return response
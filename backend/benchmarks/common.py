@@ -0,0 +1,47 @@
+"""Общие утилиты бенчмарков.
+
+Бенчмарки запускаются из каталога backend командой
+``python -m benchmarks.<имя_модуля>`` и работают на отдельной
+тестовой базе, которая создается заново при каждом запуске.
+"""
+import os
+import time
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ.setdefault('DJANGO_ALLOWED_HOSTS', 'localhost,testserver')
+
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+
+def measure(func, repeat):
+    """Время выполнения func в миллисекундах для каждого из repeat вызовов."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(percent / 100 * len(ordered))))
+    return ordered[index]
+
+
+def report(label, samples):
+    print(
+        f'{label:<48} '
+        f'p50={percentile(samples, 50):8.3f} ms  '
+        f'p99={percentile(samples, 99):8.3f} ms'
+    )
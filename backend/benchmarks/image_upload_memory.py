@@ -0,0 +1,115 @@
+"""Пиковая память Python при загрузке изображения рецепта.
+
+Сравнивает data URI в JSON и multipart/form-data для изображения
+около 7,5 МБ. Измеряется только обработка запроса на сервере
+(tracemalloc), тело запроса готовится заранее.
+
+    python -m benchmarks.image_upload_memory
+"""
+import base64
+import json
+import os
+import tracemalloc
+from io import BytesIO
+
+from .common import setup_django
+
+SIDE = 1600
+
+
+def peak_mb(func):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        func()
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return peak / 1024 / 1024
+
+
+def main():
+    setup_django()
+
+    from django.core.files.base import ContentFile
+    from django.db import transaction
+    from PIL import Image
+    from rest_framework.test import APIRequestFactory, force_authenticate
+
+    from api.fields import Base64ImageField
+    from api.views import RecipeViewSet
+    from recipes.models import Ingredient
+    from users.models import User
+
+    author = User.objects.create_user(
+        email='author@example.com', username='author', password='x'
+    )
+    ingredient = Ingredient.objects.create(name='соль', measurement_unit='г')
+    buffer = BytesIO()
+    Image.frombytes(
+        'RGB', (SIDE, SIDE), os.urandom(SIDE * SIDE * 3)
+    ).save(buffer, 'PNG')
+    png = buffer.getvalue()
+    data_uri = 'data:image/png;base64,' + base64.b64encode(png).decode()
+    print(f'image {len(png) / 1024 / 1024:.1f} MB, '
+          f'data URI {len(data_uri) / 1024 / 1024:.1f} MB')
+
+    fields = {'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 30}
+    ingredients = [{'id': ingredient.id, 'amount': 5}]
+    factory = APIRequestFactory()
+    view = RecipeViewSet.as_view({'post': 'create'})
+
+    def post(request):
+        force_authenticate(request, author)
+        with transaction.atomic():
+            response = view(request)
+            assert response.status_code == 201, response.data
+            transaction.set_rollback(True)
+        # Как и обработчик Django, закрываем загруженные файлы запроса
+        request.close()
+
+    def json_request():
+        return factory.post('/api/recipes/', json.dumps(
+            {**fields, 'ingredients': ingredients, 'image': data_uri}
+        ), content_type='application/json')
+
+    def multipart_request():
+        image = BytesIO(png)
+        image.name = 'image.png'
+        return factory.post('/api/recipes/', {
+            **fields, 'ingredients': json.dumps(ingredients), 'image': image
+        }, format='multipart')
+
+    def legacy_decode():
+        encoded = data_uri.split(';base64,')[1]
+        ContentFile(base64.b64decode(encoded), name='temp.png')
+
+    def chunked_decode():
+        Base64ImageField().decode(data_uri).close()
+
+    print(f'{"decode: b64decode + ContentFile (old)":<48} '
+          f'peak={peak_mb(legacy_decode):6.1f} MB')
+    print(f'{"decode: chunked into temp file":<48} '
+          f'peak={peak_mb(chunked_decode):6.1f} MB')
+    for label, build in (
+        ('POST /api/recipes/ JSON data URI', json_request),
+        ('POST /api/recipes/ multipart', multipart_request),
+    ):
+        request = build()
+        print(f'{label:<48} peak={peak_mb(lambda: post(request)):6.1f} MB')
+
+    # Прежнее поведение поля: декодирование целиком в память
+    chunked = Base64ImageField.decode
+    Base64ImageField.decode = lambda self, data: ContentFile(
+        base64.b64decode(data.split(';base64,')[1]), name='temp.png'
+    )
+    try:
+        request = json_request()
+        label = 'POST /api/recipes/ JSON data URI (old field)'
+        print(f'{label:<48} peak={peak_mb(lambda: post(request)):6.1f} MB')
+    finally:
+        Base64ImageField.decode = chunked
+
+
+if __name__ == '__main__':
+    main()
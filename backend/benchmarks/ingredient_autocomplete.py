@@ -0,0 +1,50 @@
+"""p99 автодополнения ингредиентов: istartswith в БД против индекса.
+
+    python -m benchmarks.ingredient_autocomplete
+"""
+import csv
+from pathlib import Path
+
+from .common import measure, report, setup_django
+
+DATA_FILE = Path(__file__).resolve().parents[2] / 'data' / 'ingredients.csv'
+REPEAT = 20
+
+
+def main():
+    setup_django()
+
+    from recipes.catalog import bump_catalog_version
+    from recipes.ingredient_index import ingredient_index
+    from recipes.models import Ingredient
+
+    with open(DATA_FILE, encoding='utf-8') as f:
+        rows = {(name, unit) for name, unit in csv.reader(f)}
+    Ingredient.objects.bulk_create(
+        Ingredient(name=name, measurement_unit=unit) for name, unit in rows
+    )
+    bump_catalog_version()
+
+    # Префиксы, которые пользователь набирает по буквам
+    prefixes = []
+    for name in ('картофель', 'молоко', 'сахар', 'яйца', 'помидоры'):
+        prefixes.extend(name[:length] for length in range(1, len(name) + 1))
+
+    def query_database():
+        for prefix in prefixes:
+            list(Ingredient.objects.filter(name__istartswith=prefix).values(
+                'id', 'name', 'measurement_unit'
+            ))
+
+    def query_index():
+        for prefix in prefixes:
+            ingredient_index.startswith(prefix)
+
+    ingredient_index.startswith('')
+    print(f'{len(rows)} ingredients, {len(prefixes)} keystrokes per sample')
+    report('database istartswith', measure(query_database, REPEAT))
+    report('in-memory prefix index', measure(query_index, REPEAT))
+
+
+if __name__ == '__main__':
+    main()
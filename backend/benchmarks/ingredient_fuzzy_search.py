@@ -0,0 +1,81 @@
+"""Нечеткий поиск ингредиентов: поставляемый каталог и синтетические 100k.
+
+    python -m benchmarks.ingredient_fuzzy_search
+"""
+import csv
+import random
+import time
+from pathlib import Path
+
+from .common import measure, report, setup_django
+
+DATA_FILE = Path(__file__).resolve().parents[2] / 'data' / 'ingredients.csv'
+SYNTHETIC_SIZE = 100_000
+REPEAT = 50
+QUERIES = (
+    'мацарела', 'пормезан', 'картофил', 'молако', 'сахр',
+    'помидор', 'курин', 'масло сливочное', 'яйцо', 'сметана',
+)
+
+
+def load_catalog(size=None):
+    from recipes.catalog import bump_catalog_version
+    from recipes.models import Ingredient
+
+    with open(DATA_FILE, encoding='utf-8') as f:
+        rows = sorted({(name, unit) for name, unit in csv.reader(f)})
+    if size:
+        # Синтетический каталог: названия из словаря с номерами
+        rng = random.Random(0)
+        words = [name for name, _ in rows]
+        rows = [
+            (f'{rng.choice(words)} {i}', 'г')
+            for i in range(size)
+        ]
+    Ingredient.objects.all().delete()
+    Ingredient.objects.bulk_create(
+        (Ingredient(name=name, measurement_unit=unit)
+         for name, unit in rows),
+        batch_size=5000
+    )
+    bump_catalog_version()
+    return len(rows)
+
+
+def run(label, size=None):
+    from django.conf import settings
+
+    from recipes.ingredient_index import ingredient_index
+
+    count = load_catalog(size)
+    started = time.perf_counter()
+    ingredient_index.startswith('')
+    build = (time.perf_counter() - started) * 1000
+    print(f'{label}: {count} ingredients, index build {build:.0f} ms')
+
+    for query in QUERIES[:3]:
+        names = [
+            row['name'] for row in ingredient_index.search(
+                query, 5, settings.INGREDIENT_SEARCH_SIMILARITY
+            )
+        ]
+        print(f'  {query!r} -> {names}')
+
+    def search_all():
+        for query in QUERIES:
+            ingredient_index.search(
+                query, settings.INGREDIENT_SEARCH_LIMIT,
+                settings.INGREDIENT_SEARCH_SIMILARITY
+            )
+
+    report(f'  {len(QUERIES)} fuzzy queries', measure(search_all, REPEAT))
+
+
+def main():
+    setup_django()
+    run('shipped catalog')
+    run('synthetic catalog', SYNTHETIC_SIZE)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""URL медиафайлов: build_absolute_uri на каждый URL против MediaURLResolver.
+
+Сначала только сборка URL копий изображений для страницы из 100
+рецептов с готовыми копиями (5 URL на рецепт и 2 на аватар автора) и
+перенос на хост запроса относительных URL из кеша фрагментов. Затем -
+ответы /api/recipes/?limit=100 с прогретым кешем и /api/users/?limit=100.
+
+    python -m benchmarks.media_urls
+"""
+from .common import measure, report, setup_django
+
+ROWS = 100
+REPEAT = 200
+
+
+def recipe_variants(i):
+    return {'source': f'recipes/{i}.png', **{
+        variant: {extension: f'recipes/{variant}/{i}.{extension}'
+                  for extension in ('webp', 'jpeg')}
+        for variant in ('card', 'detail')
+    }}
+
+
+def avatar_variants(i):
+    return {'source': f'avatars/{i}.png', 'avatar': {
+        extension: f'avatars/variants/{i}.{extension}'
+        for extension in ('webp', 'jpeg')
+    }}
+
+
+def main():
+    setup_django()
+
+    from django.conf import settings
+    from django.core.cache import cache
+    from django.core.files.storage import default_storage
+    from rest_framework.test import APIClient, APIRequestFactory
+
+    from api.media import MediaURLResolver
+    from recipes.images import FORMATS
+    from recipes.models import Recipe
+    from users.models import User
+
+    User.objects.bulk_create(
+        User(email=f'user{i}@example.com', username=f'user{i}',
+             password='!', avatar=f'avatars/{i}.png',
+             avatar_variants=avatar_variants(i))
+        for i in range(ROWS)
+    )
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    Recipe.objects.bulk_create(
+        Recipe(author_id=user_ids[i], name=f'Рецепт {i}', text='Шаг',
+               cooking_time=10, image=f'recipes/{i}.png',
+               image_variants=recipe_variants(i))
+        for i in range(ROWS)
+    )
+    request = APIRequestFactory().get(
+        '/api/recipes/', HTTP_HOST='testserver',
+        HTTP_X_FORWARDED_PROTO='https'
+    )
+    images = [
+        (f'recipes/{i}.png', recipe_variants(i),
+         settings.RECIPE_IMAGE_VARIANTS)
+        for i in range(ROWS)
+    ] + [
+        (f'avatars/{i}.png', avatar_variants(i),
+         settings.AVATAR_IMAGE_VARIANTS)
+        for i in range(ROWS)
+    ]
+
+    def per_url():
+        # Прежний способ: storage.url и build_absolute_uri на каждый URL
+        return [
+            {variant: {
+                extension: request.build_absolute_uri(
+                    default_storage.url(variants[variant][extension])
+                ) for extension, _, _ in FORMATS
+            } for variant in sizes}
+            for _, variants, sizes in images
+        ]
+
+    def resolver():
+        media = MediaURLResolver(request)
+        return [media.image_urls(*image) for image in images]
+
+    assert per_url() == resolver()
+    report('image URLs, build_absolute_uri per URL', measure(per_url, REPEAT))
+    report('image URLs, MediaURLResolver', measure(resolver, REPEAT))
+
+    relative = MediaURLResolver()
+    fragments = [relative.image_urls(*image) for image in images]
+
+    def per_url_absolute():
+        return [
+            {variant: {extension: request.build_absolute_uri(url)
+                       for extension, url in urls.items()}
+             for variant, urls in fragment.items()}
+            for fragment in fragments
+        ]
+
+    def resolver_absolute():
+        media = MediaURLResolver(request)
+        return [media.absolute(fragment) for fragment in fragments]
+
+    assert per_url_absolute() == resolver_absolute()
+    report('fragment URLs, build_absolute_uri per URL',
+           measure(per_url_absolute, REPEAT))
+    report('fragment URLs, MediaURLResolver.absolute',
+           measure(resolver_absolute, REPEAT))
+
+    client = APIClient()
+    client.force_authenticate(User.objects.first())
+    cache.clear()
+    client.get('/api/recipes/?limit=100')
+    report('GET /api/recipes/?limit=100, warm cache',
+           measure(lambda: client.get('/api/recipes/?limit=100'), 20))
+    report('GET /api/users/?limit=100',
+           measure(lambda: client.get('/api/users/?limit=100'), 20))
+
+
+if __name__ == '__main__':
+    main()
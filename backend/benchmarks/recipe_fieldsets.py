@@ -0,0 +1,96 @@
+"""Размер ответа и время запроса для разных наборов полей.
+
+2 000 рецептов с текстом в 2 КБ и 8 ингредиентами, страница из 50
+рецептов. Полные ответы собираются из кеша фрагментов (прогретого и
+пустого), сокращенные без автора и ингредиентов - из столбцов рецепта.
+Отдельно - список пользователей и подписки.
+
+    python -m benchmarks.recipe_fieldsets
+"""
+import random
+
+from .common import measure, report, setup_django
+
+RECIPES = 2_000
+AUTHORS = 50
+INGREDIENTS = 500
+INGREDIENTS_PER_RECIPE = 8
+PAGE_SIZE = 50
+REPEAT = 30
+
+
+def main():
+    setup_django()
+
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIClient
+
+    from recipes.models import Ingredient, Recipe, RecipeIngredient
+    from users.models import Subscription, User
+
+    rng = random.Random(0)
+    User.objects.bulk_create(
+        User(email=f'author{i}@example.com', username=f'author{i}',
+             first_name='Имя', last_name='Фамилия', password='!')
+        for i in range(AUTHORS)
+    )
+    author_ids = list(User.objects.values_list('pk', flat=True))
+    reader = User.objects.create_user(
+        email='reader@example.com', username='reader', password='x'
+    )
+    Subscription.objects.bulk_create(
+        Subscription(user=reader, author_id=pk) for pk in author_ids
+    )
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+        for i in range(INGREDIENTS)
+    )
+    ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+    Recipe.objects.bulk_create(
+        (Recipe(author_id=rng.choice(author_ids), name=f'Рецепт {i}',
+                text='Шаг приготовления. ' * 100, cooking_time=10)
+         for i in range(RECIPES)),
+        batch_size=1000
+    )
+    RecipeIngredient.objects.bulk_create(
+        (RecipeIngredient(recipe_id=recipe_id, ingredient_id=pk, amount=10)
+         for recipe_id in Recipe.objects.values_list('pk', flat=True)
+         for pk in rng.sample(ingredient_ids, INGREDIENTS_PER_RECIPE)),
+        batch_size=5000
+    )
+    client = APIClient()
+    client.force_authenticate(reader)
+
+    def run(label, url, cold=False):
+        def get():
+            if cold:
+                cache.clear()
+            return client.get(url)
+        response = get()
+        assert response.status_code == 200, response.data
+        with CaptureQueriesContext(connection) as queries:
+            get()
+        print(f'{label}: {len(response.content)} bytes, '
+              f'{len(queries)} queries')
+        report(label, measure(get, REPEAT))
+
+    recipes = f'/api/recipes/?limit={PAGE_SIZE}'
+    run('recipes, all fields, cold cache', recipes, cold=True)
+    run('recipes, all fields, warm cache', recipes)
+    run('recipes, omit=text', f'{recipes}&omit=text')
+    run('recipes, fields=id,name,image,cooking_time',
+        f'{recipes}&fields=id,name,image,cooking_time')
+    run('recipes, fields=id,name', f'{recipes}&fields=id,name')
+
+    users = f'/api/users/?limit={PAGE_SIZE}'
+    run('users, all fields', users)
+    run('users, fields=id,username', f'{users}&fields=id,username')
+    subscriptions = f'/api/users/subscriptions/?limit={PAGE_SIZE}'
+    run('subscriptions, all fields', subscriptions)
+    run('subscriptions, omit=recipes', f'{subscriptions}&omit=recipes')
+
+
+if __name__ == '__main__':
+    main()
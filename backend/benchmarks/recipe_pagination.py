@@ -0,0 +1,61 @@
+"""Латентность первой и 10 000-й страницы ленты рецептов.
+
+Сравнивает постраничный режим (COUNT(*) + OFFSET) и курсорный режим
+по ключу (pub_date, id).
+
+    python -m benchmarks.recipe_pagination
+"""
+from datetime import timedelta
+
+from .common import measure, report, setup_django
+
+PAGE_SIZE = 6
+DEEP_PAGE = 10_000
+REPEAT = 20
+
+
+def main():
+    setup_django()
+
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+
+    from api.pagination import RecipePagination
+    from recipes.models import Recipe
+    from users.models import User
+
+    author = User.objects.create_user(
+        email='author@example.com', username='author', password='x'
+    )
+    total = PAGE_SIZE * (DEEP_PAGE + 1)
+    now = timezone.now()
+    Recipe.objects.bulk_create(
+        (Recipe(author=author, name=f'Рецепт {i}', text='Описание',
+                cooking_time=10, pub_date=now - timedelta(seconds=i))
+         for i in range(total)),
+        batch_size=5000
+    )
+    print(f'{total} recipes, page size {PAGE_SIZE}')
+
+    # Курсор, указывающий на начало страницы DEEP_PAGE
+    boundary = Recipe.objects.order_by('-pub_date', '-id')[
+        PAGE_SIZE * (DEEP_PAGE - 1) - 1
+    ]
+    deep_cursor = RecipePagination().encode_cursor(boundary)
+
+    client = APIClient()
+    urls = {
+        'page-number, page 1': f'/api/recipes/?limit={PAGE_SIZE}',
+        f'page-number, page {DEEP_PAGE}':
+            f'/api/recipes/?limit={PAGE_SIZE}&page={DEEP_PAGE}',
+        'cursor, page 1': f'/api/recipes/?limit={PAGE_SIZE}&cursor=',
+        f'cursor, page {DEEP_PAGE}':
+            f'/api/recipes/?limit={PAGE_SIZE}&cursor={deep_cursor}',
+    }
+    for label, url in urls.items():
+        assert client.get(url).status_code == 200
+        report(label, measure(lambda: client.get(url), REPEAT))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Подбор рецептов по кладовой: индекс в памяти против SQL.
+
+100 000 рецептов по 5-12 ингредиентов из каталога в 2 186 позиций.
+SQL-вариант считает реляционное деление одним запросом с GROUP BY.
+
+    python -m benchmarks.recipe_pantry
+    python -m benchmarks.recipe_pantry 10000
+"""
+import random
+import sys
+import time
+
+from .common import measure, report, setup_django
+
+DEFAULT_RECIPES = 100_000
+INGREDIENTS = 2_186
+REPEAT = 20
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RECIPES
+    setup_django()
+
+    from django.db.models import Count, F, Q
+    from rest_framework.test import APIClient
+
+    from recipes.models import Ingredient, Recipe, RecipeIngredient
+    from recipes.pantry import pantry_index, publish_pantry_changes
+    from users.models import User
+
+    rng = random.Random(0)
+    author = User.objects.create_user(
+        email='author@example.com', username='author', password='x'
+    )
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+        for i in range(INGREDIENTS)
+    )
+    ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+    # Популярность ингредиентов неравномерна, как в настоящих рецептах
+    weights = [1 / (rank + 1) for rank in range(INGREDIENTS)]
+    Recipe.objects.bulk_create(
+        (Recipe(author=author, name=f'Рецепт {i}', text='Описание',
+                cooking_time=10) for i in range(size)),
+        batch_size=5000
+    )
+    links = []
+    for recipe_id in Recipe.objects.values_list('pk', flat=True):
+        count = rng.randint(5, 12)
+        chosen = set(rng.choices(ingredient_ids, weights, k=count))
+        links.extend(
+            RecipeIngredient(recipe_id=recipe_id, ingredient_id=pk, amount=1)
+            for pk in chosen
+        )
+    RecipeIngredient.objects.bulk_create(links, batch_size=5000)
+    print(f'{size} recipes, {INGREDIENTS} ingredients, {len(links)} links')
+
+    started = time.perf_counter()
+    pantry_index.search([])
+    print(f'index build: {(time.perf_counter() - started) * 1000:.0f} ms')
+
+    recipe_id = Recipe.objects.values_list('pk', flat=True).first()
+    report('incremental update of one recipe', measure(
+        lambda: (publish_pantry_changes([recipe_id]),
+                 pantry_index.search([])),
+        REPEAT
+    ))
+
+    def sql(pantry, max_missing):
+        return list(
+            Recipe.objects.annotate(
+                total=Count('ingredient_amounts'),
+                found=Count(
+                    'ingredient_amounts',
+                    filter=Q(ingredient_amounts__ingredient_id__in=pantry)
+                )
+            ).filter(found__gt=0, total__lte=F('found') + max_missing)
+            .order_by(F('total') - F('found'), '-id')
+            .values_list('id', flat=True)[:6]
+        )
+
+    client = APIClient()
+    for pantry_size in (10, 30, 100):
+        pantry = ingredient_ids[:pantry_size]
+        for max_missing in (0, 2):
+            label = f'pantry {pantry_size}, max_missing {max_missing}'
+            url = (
+                '/api/recipes/pantry/?limit=6'
+                f'&max_missing={max_missing}'
+                f'&ingredients={",".join(map(str, pantry))}'
+            )
+            assert client.get(url).status_code == 200
+            report(f'index, {label}', measure(
+                lambda: pantry_index.search(pantry, max_missing), REPEAT
+            ))
+            report(f'API, {label}', measure(lambda: client.get(url), REPEAT))
+            report(f'SQL, {label}', measure(
+                lambda: sql(pantry, max_missing), 3
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Латентность полнотекстового поиска рецептов.
+
+Сравнивает поиск по индексу с наивным фильтром icontains по названию
+и описанию. Размер каталога задается аргументом:
+
+    python -m benchmarks.recipe_search 10000
+    python -m benchmarks.recipe_search 1000000
+"""
+import random
+import sys
+
+from .common import measure, report, setup_django
+
+DEFAULT_SIZE = 10_000
+REPEAT = 20
+WORDS = (
+    'картошка', 'курица', 'грибы', 'сыр', 'томаты', 'рис', 'гречка',
+    'лук', 'морковь', 'говядина', 'рыба', 'капуста', 'тыква', 'свекла',
+)
+DISHES = ('суп', 'салат', 'запеканка', 'рагу', 'пирог', 'каша', 'котлеты')
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIZE
+    setup_django()
+
+    from django.db.models import Q
+    from rest_framework.test import APIClient
+
+    from recipes.models import Recipe
+    from recipes.search import search_recipes, update_search_index
+    from users.models import User
+
+    author = User.objects.create_user(
+        email='author@example.com', username='author', password='x'
+    )
+    rng = random.Random(0)
+    Recipe.objects.bulk_create(
+        (Recipe(author=author,
+                name=f'{rng.choice(DISHES)} {rng.choice(WORDS)} {i}',
+                text=' '.join(rng.sample(WORDS, 5)),
+                cooking_time=10)
+         for i in range(size)),
+        batch_size=5000
+    )
+    ids = list(Recipe.objects.values_list('pk', flat=True))
+    for start in range(0, len(ids), 5000):
+        update_search_index(ids[start:start + 5000])
+    print(f'{size} recipes')
+
+    def naive(query):
+        return list(Recipe.objects.filter(
+            Q(name__icontains=query) | Q(text__icontains=query)
+        ).order_by('-pub_date', '-id').values('id')[:6])
+
+    def indexed(query):
+        return list(search_recipes(Recipe.objects.all(), query)
+                    .values('id')[:6])
+
+    client = APIClient()
+    for query in ('картошка', 'грибной суп', 'тыква свекла'):
+        url = f'/api/recipes/?limit=6&search={query}'
+        assert client.get(url).status_code == 200
+        report(f'API search "{query}"',
+               measure(lambda: client.get(url), REPEAT))
+        report(f'index "{query}" (ORM only)',
+               measure(lambda: indexed(query), REPEAT))
+        report(f'icontains "{query}" (ORM only)',
+               measure(lambda: naive(query), REPEAT))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Добавление в корзину и избранное: 100 одиночных запросов и один пакет.
+
+Запросы идут через APIClient с токеном, как у SPA, поэтому одиночные
+вызовы платят за аутентификацию, права и сериализацию каждый раз. У
+каждого рецепта 8 ингредиентов, итоги списка покупок обновляются.
+
+    python -m benchmarks.relation_batch
+"""
+import random
+
+from .common import measure, report, setup_django
+
+RECIPES = 100
+INGREDIENTS = 500
+INGREDIENTS_PER_RECIPE = 8
+REPEAT = 10
+
+
+def main():
+    setup_django()
+
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.authtoken.models import Token
+    from rest_framework.test import APIClient
+
+    from recipes.models import (
+        Favorite,
+        Ingredient,
+        Recipe,
+        RecipeIngredient,
+        ShoppingCart
+    )
+    from users.models import User
+
+    rng = random.Random(0)
+    user = User.objects.create_user(
+        email='user@example.com', username='user', password='x'
+    )
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+        for i in range(INGREDIENTS)
+    )
+    ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+    Recipe.objects.bulk_create(
+        Recipe(author=user, name=f'Рецепт {i}', text='Описание',
+               cooking_time=10) for i in range(RECIPES)
+    )
+    recipe_ids = list(Recipe.objects.values_list('pk', flat=True))
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe_id=recipe_id, ingredient_id=pk,
+                         amount=rng.randint(1, 500))
+        for recipe_id in recipe_ids
+        for pk in rng.sample(ingredient_ids, INGREDIENTS_PER_RECIPE)
+    )
+    client = APIClient()
+    client.credentials(
+        HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}'
+    )
+
+    for name, model in (('shopping_cart', ShoppingCart),
+                        ('favorite', Favorite)):
+        def single():
+            for recipe_id in recipe_ids:
+                client.post(f'/api/recipes/{recipe_id}/{name}/')
+            for recipe_id in recipe_ids:
+                client.delete(f'/api/recipes/{recipe_id}/{name}/')
+
+        def batch():
+            url = f'/api/recipes/{name}/batch/'
+            client.post(url, {'recipes': recipe_ids}, format='json')
+            client.delete(url, {'recipes': recipe_ids}, format='json')
+
+        for func in (single, batch):
+            with CaptureQueriesContext(connection) as queries:
+                func()
+            assert not model.objects.exists()
+            print(f'{name} {func.__name__}: {len(queries)} queries')
+        report(f'{name}, {RECIPES} single add + remove', measure(
+            single, REPEAT
+        ))
+        report(f'{name}, batch of {RECIPES} add + remove', measure(
+            batch, REPEAT
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Сериализаторы DRF против быстрых сериализаторов строк.
+
+Пропускная способность на строку: объекты и строки values() заранее
+загружены в память, измеряется только сборка словарей ответа. Затем -
+ответы /api/recipes/?limit=100 с пустым кешем фрагментов,
+/api/users/?limit=100 и сборка каталога ингредиентов.
+
+    python -m benchmarks.row_serializers
+"""
+import random
+
+from .common import measure, report, setup_django
+
+ROWS = 500
+INGREDIENTS = 2_000
+INGREDIENTS_PER_RECIPE = 8
+REPEAT = 10
+
+
+def main():
+    setup_django()
+
+    from django.core.cache import cache
+    from django.db.models import Prefetch
+    from rest_framework.request import Request
+    from rest_framework.test import APIClient, APIRequestFactory
+
+    from api.ingredient_catalog import ingredient_catalog
+    from api.row_serializers import (
+        IngredientRows,
+        RecipeMinifiedRows,
+        RecipeRows,
+        UserRows
+    )
+    from api.serializers import (
+        IngredientSerializer,
+        RecipeMinifiedSerializer,
+        RecipeSerializer,
+        UserSerializer
+    )
+    from recipes.models import Ingredient, Recipe, RecipeIngredient
+    from users.models import User
+
+    rng = random.Random(0)
+    User.objects.bulk_create(
+        User(email=f'user{i}@example.com', username=f'user{i}',
+             first_name='Имя', last_name='Фамилия', password='!',
+             avatar=f'avatars/{i}.png',
+             avatar_variants={'source': f'avatars/{i}.png', 'avatar': {
+                 'webp': f'avatars/variants/{i}.webp',
+                 'jpeg': f'avatars/variants/{i}.jpeg',
+             }})
+        for i in range(ROWS)
+    )
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+        for i in range(INGREDIENTS)
+    )
+    ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+    Recipe.objects.bulk_create(
+        Recipe(author_id=rng.choice(user_ids), name=f'Рецепт {i}',
+               text='Шаг приготовления. ' * 20, cooking_time=10,
+               image=f'recipes/{i}.png', image_variants={})
+        for i in range(ROWS)
+    )
+    RecipeIngredient.objects.bulk_create(
+        (RecipeIngredient(recipe_id=recipe_id, ingredient_id=pk, amount=10)
+         for recipe_id in Recipe.objects.values_list('pk', flat=True)
+         for pk in rng.sample(ingredient_ids, INGREDIENTS_PER_RECIPE)),
+        batch_size=5000
+    )
+    viewer = User.objects.first()
+    request = Request(APIRequestFactory().get('/api/recipes/'))
+    request.user = viewer
+
+    def context():
+        return {'request': request}
+
+    recipes = Recipe.objects.order_by('id')
+    cases = (
+        ('RecipeSerializer', RecipeSerializer, RecipeRows,
+         recipes.select_related('author')
+         .prefetch_related(Prefetch(
+             'ingredient_amounts',
+             queryset=RecipeIngredient.objects.select_related('ingredient')
+         )), recipes),
+        ('RecipeMinifiedSerializer', RecipeMinifiedSerializer,
+         RecipeMinifiedRows, recipes, recipes),
+        ('UserSerializer', UserSerializer, UserRows,
+         User.objects.all(), User.objects.all()),
+        ('IngredientSerializer', IngredientSerializer, IngredientRows,
+         Ingredient.objects.all(), Ingredient.objects.all()),
+    )
+    for name, serializer_class, rows_class, objects, queryset in cases:
+        instances = list(objects)
+        rows = list(queryset.values(*rows_class().columns))
+        drf = measure(lambda: serializer_class(
+            instances, many=True, context=context()
+        ).data, REPEAT)
+        # Строки догружают ингредиенты рецептов в preload, поэтому
+        # в их время входит этот запрос; у DRF предзагрузка уже сделана
+        fast = measure(lambda: rows_class(context()).many(rows), REPEAT)
+        count = len(rows)
+        report(f'{name}, DRF, per 1000 rows',
+               [sample * 1000 / count for sample in drf])
+        report(f'{name}, rows, per 1000 rows',
+               [sample * 1000 / count for sample in fast])
+
+    client = APIClient()
+    client.force_authenticate(viewer)
+
+    def cold_recipes():
+        cache.clear()
+        return client.get('/api/recipes/?limit=100')
+
+    report('GET /api/recipes/?limit=100, cold cache',
+           measure(cold_recipes, REPEAT))
+    report('GET /api/users/?limit=100',
+           measure(lambda: client.get('/api/users/?limit=100'), REPEAT))
+
+    def catalog():
+        ingredient_catalog._version = None
+        return ingredient_catalog.get_payload()
+
+    report('ingredient catalog build', measure(catalog, REPEAT))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Выгрузка списка покупок: GROUP BY по корзине против готовых итогов.
+
+Выгрузка измеряется потоком из базы, из кеша и ответом 304.
+
+Пользователь с 500 рецептами в корзине, по 5-12 ингредиентов из
+каталога в 2 186 позиций.
+
+    python -m benchmarks.shopping_list
+    python -m benchmarks.shopping_list 100
+"""
+import random
+import sys
+
+from .common import measure, report, setup_django
+
+DEFAULT_RECIPES = 500
+INGREDIENTS = 2_186
+REPEAT = 50
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RECIPES
+    setup_django()
+
+    from django.core.cache import cache
+    from django.db import connection
+    from django.db.models import Sum
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIClient
+
+    from recipes.models import (
+        Ingredient,
+        Recipe,
+        RecipeIngredient,
+        ShoppingCart
+    )
+    from users.models import User
+
+    rng = random.Random(0)
+    user = User.objects.create_user(
+        email='user@example.com', username='user', password='x'
+    )
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+        for i in range(INGREDIENTS)
+    )
+    ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+    weights = [1 / (rank + 1) for rank in range(INGREDIENTS)]
+    Recipe.objects.bulk_create(
+        Recipe(author=user, name=f'Рецепт {i}', text='Описание',
+               cooking_time=10) for i in range(size)
+    )
+    recipe_ids = list(Recipe.objects.values_list('pk', flat=True))
+    links = []
+    for recipe_id in recipe_ids:
+        count = rng.randint(5, 12)
+        chosen = set(rng.choices(ingredient_ids, weights, k=count))
+        links.extend(
+            RecipeIngredient(recipe_id=recipe_id, ingredient_id=pk,
+                             amount=rng.randint(1, 500))
+            for pk in chosen
+        )
+    RecipeIngredient.objects.bulk_create(links, batch_size=5000)
+
+    client = APIClient()
+    client.force_authenticate(user)
+    # Добавление через API поддерживает итоги так же, как в работе
+    for recipe_id in recipe_ids:
+        client.post(f'/api/recipes/{recipe_id}/shopping_cart/')
+    assert ShoppingCart.objects.filter(user=user).count() == size
+    print(f'{size} recipes in cart, {len(links)} ingredient links')
+
+    def group_by():
+        return list(
+            RecipeIngredient.objects
+            .filter(recipe__in_shopping_cart__user=user)
+            .values('ingredient__name', 'ingredient__measurement_unit')
+            .annotate(total_amount=Sum('amount'))
+            .order_by('ingredient__name')
+        )
+
+    url = '/api/recipes/download_shopping_cart/'
+    with CaptureQueriesContext(connection) as queries:
+        client.get(url).getvalue()
+    print(f'download: {len(queries)} queries')
+    report('GROUP BY over cart', measure(group_by, REPEAT))
+
+    def stream(export_format):
+        cache.clear()
+        return client.get(url, {'format': export_format}).getvalue()
+
+    for export_format in ('txt', 'csv', 'json', 'html'):
+        report(f'download {export_format}, streamed', measure(
+            lambda: stream(export_format), REPEAT
+        ))
+    response = client.get(url)
+    response.getvalue()
+    etag = response['ETag']
+    report('download txt, cached', measure(
+        lambda: client.get(url).content, REPEAT
+    ))
+    report('download txt, 304', measure(
+        lambda: client.get(url, HTTP_IF_NONE_MATCH=etag), REPEAT
+    ))
+    recipe_id = recipe_ids[0]
+    report('cart remove + add', measure(
+        lambda: (client.delete(f'/api/recipes/{recipe_id}/shopping_cart/'),
+                 client.post(f'/api/recipes/{recipe_id}/shopping_cart/')),
+        REPEAT
+    ))
+
+
+if __name__ == '__main__':
+    main()
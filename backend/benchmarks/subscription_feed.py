@@ -0,0 +1,127 @@
+"""Лента подписок: гибридная лента против соединения с подписками.
+
+10 000 авторов по 3 рецепта, 1% авторов популярные (их рецепты
+выбираются при чтении). Читатели подписаны на 10, 1 000 и 10 000
+авторов. Отдельно измеряется публикация рецепта автора с 1 000
+подписчиков (копирование в ленты и обрезка).
+
+    python -m benchmarks.subscription_feed
+"""
+import random
+
+from .common import measure, report, setup_django
+
+AUTHORS = 10_000
+RECIPES_PER_AUTHOR = 3
+POPULAR_SHARE = 0.01
+FOLLOWING = (10, 1_000, 10_000)
+FANOUT_SUBSCRIBERS = 1_000
+REPEAT = 30
+
+
+def main():
+    setup_django()
+
+    from django.conf import settings
+    from rest_framework.test import APIClient
+
+    from recipes.feed import Feed
+    from recipes.models import FeedEntry, Recipe
+    from users.models import Subscription, User
+
+    rng = random.Random(0)
+    User.objects.bulk_create(
+        (User(email=f'author{i}@example.com', username=f'author{i}',
+              password='!') for i in range(AUTHORS)),
+        batch_size=5000
+    )
+    author_ids = list(User.objects.values_list('pk', flat=True))
+    popular = set(rng.sample(author_ids, int(AUTHORS * POPULAR_SHARE)))
+    User.objects.filter(pk__in=popular).update(
+        subscribers_count=settings.FEED_FANOUT_MAX_SUBSCRIBERS + 1
+    )
+    Recipe.objects.bulk_create(
+        (Recipe(author_id=author_id, name=f'Рецепт {author_id}-{number}',
+                text='Описание', cooking_time=10)
+         for number in range(RECIPES_PER_AUTHOR)
+         for author_id in rng.sample(author_ids, len(author_ids))),
+        batch_size=5000
+    )
+    print(f'{AUTHORS} authors, {len(popular)} popular, '
+          f'{Recipe.objects.count()} recipes')
+
+    def follow(username, authors):
+        reader = User.objects.create_user(
+            email=f'{username}@example.com', username=username, password='x'
+        )
+        Subscription.objects.bulk_create(
+            (Subscription(user=reader, author_id=pk) for pk in authors),
+            batch_size=5000
+        )
+        # Записи ленты, какими их оставили бы публикации и обрезка
+        newest = Recipe.objects.filter(
+            author_id__in=[pk for pk in authors if pk not in popular]
+        ).order_by('-pub_date', '-id').values_list(
+            'id', 'author_id', 'pub_date'
+        )[:settings.FEED_MAX_LENGTH]
+        FeedEntry.objects.bulk_create(
+            (FeedEntry(user=reader, recipe_id=pk, author_id=author_id,
+                       pub_date=pub_date)
+             for pk, author_id, pub_date in newest),
+            batch_size=5000
+        )
+        return reader
+
+    client = APIClient()
+    for count in FOLLOWING:
+        reader = follow(f'reader{count}', rng.sample(author_ids, count))
+        client.force_authenticate(reader)
+        url = '/api/recipes/feed/'
+        response = client.get(url)
+        assert response.status_code == 200
+        assert len(response.data['results']) == 6
+        deep_url = url
+        for _ in range(3):
+            deep_url = client.get(deep_url).data['next']
+        report(f'feed, {count} authors, first page', measure(
+            lambda: client.get(url), REPEAT
+        ))
+        report(f'feed, {count} authors, page 4', measure(
+            lambda: client.get(deep_url), REPEAT
+        ))
+        report(f'Feed.page, {count} authors', measure(
+            lambda: Feed(reader.pk).page(None, 7), REPEAT
+        ))
+        report(f'join on subscriptions, {count} authors', measure(
+            lambda: list(
+                Recipe.objects.filter(author__subscribers__user=reader)
+                .order_by('-pub_date', '-id').values('id', 'pub_date')[:7]
+            ), REPEAT
+        ))
+
+    author = User.objects.create_user(
+        email='fanout@example.com', username='fanout', password='x'
+    )
+    User.objects.bulk_create(
+        (User(email=f'follower{i}@example.com', username=f'follower{i}',
+              password='!') for i in range(FANOUT_SUBSCRIBERS)),
+        batch_size=5000
+    )
+    Subscription.objects.bulk_create(
+        (Subscription(user_id=pk, author=author) for pk in User.objects.filter(
+            username__startswith='follower'
+        ).values_list('pk', flat=True)),
+        batch_size=5000
+    )
+    User.objects.filter(pk=author.pk).update(
+        subscribers_count=FANOUT_SUBSCRIBERS
+    )
+    report(f'publish with fan-out to {FANOUT_SUBSCRIBERS}', measure(
+        lambda: Recipe.objects.create(
+            author=author, name='Новый', text='Описание', cooking_time=5
+        ), 10
+    ))
+
+
+if __name__ == '__main__':
+    main()
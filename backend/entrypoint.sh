@@ -27,6 +27,11 @@ load_ingredients() {
     echo "Ingredients loaded "
 }
 
+build_search_index() {
+    echo "Building recipe search index..."
+    python manage.py rebuild_search_index
+}
+
 # Функция для создания суперпользователя, если его нет
 create_superuser() {
     if [ -n "$DJANGO_SUPERUSER_EMAIL" ] && [ -n "$DJANGO_SUPERUSER_PASSWORD" ]; then
@@ -44,6 +49,7 @@ wait_for_postgres
 apply_migrations
 collect_static
 load_ingredients
+build_search_index
 create_superuser
 
 # Создаем пользователей через Django shell
@@ -80,6 +80,16 @@ else:
 
     DEBUG = True
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -97,7 +107,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -111,6 +121,50 @@ REST_FRAMEWORK = {
 
 AUTH_USER_MODEL = 'users.User'
 
+# Кеш токенов аутентификации: LRU процесса (только для одного процесса)
+# или, с AUTH_TOKEN_CACHE_SHARED, общий кеш Django
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TTL = 60
+AUTH_TOKEN_CACHE_SHARED = os.getenv('AUTH_TOKEN_CACHE_SHARED') == 'true'
+
+# Нечеткий поиск ингредиентов (/api/ingredients/?name=...&fuzzy=1)
+INGREDIENT_SEARCH_LIMIT = 20
+INGREDIENT_SEARCH_SIMILARITY = 0.3
+# Как часто автодополнение сверяет версию каталога с базой, секунды
+CATALOG_VERSION_CHECK_INTERVAL = 1
+
+# Кеш представлений рецептов, не зависящих от пользователя
+RECIPE_FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Подбор рецептов по кладовой (/api/recipes/pantry/)
+PANTRY_CHANGE_LOG_TIMEOUT = 60 * 60 * 24
+PANTRY_MAX_INGREDIENTS = 200
+PANTRY_MAX_MISSING = 3
+
+# Лента подписок (/api/recipes/feed/): рецепты авторов с числом
+# подписчиков не больше порога копируются в ленты при публикации
+FEED_FANOUT_MAX_SUBSCRIBERS = 1000
+FEED_MAX_LENGTH = 500
+
+# Выгрузка списка покупок: кешируются тела не больше заданного размера
+SHOPPING_LIST_EXPORT_CACHE_TIMEOUT = 60 * 60 * 24
+SHOPPING_LIST_EXPORT_CACHE_MAX_SIZE = 1024 * 1024
+SHOPPING_LIST_EXPORT_CHUNK_SIZE = 2000
+
+# Пакетное добавление и удаление избранного и корзины
+RELATION_BATCH_MAX_SIZE = 500
+
+# Загрузка изображений: data URI в JSON или multipart/form-data
+IMAGE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+FILE_UPLOAD_HANDLERS = ['api.uploads.LimitedTemporaryFileUploadHandler']
+
+# Уменьшенные копии изображений: вариант -> (ширина, высота)
+RECIPE_IMAGE_VARIANTS = {'card': (480, 360), 'detail': (1200, 900)}
+AVATAR_IMAGE_VARIANTS = {'avatar': (160, 160)}
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+# Обрабатывать изображения в потоке запроса (для тестов и отладки)
+IMAGE_PROCESSING_SYNC = os.getenv('IMAGE_PROCESSING_SYNC') == 'true'
+
 DJOSER = {
     'USER_ID_FIELD': 'id',
     'LOGIN_FIELD': 'email',
@@ -138,6 +192,27 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# URL медиафайлов в ответах API: по умолчанию абсолютные от хоста
+# запроса, MEDIA_URLS_RELATIVE - относительные, MEDIA_URL_PREFIX - от
+# адреса CDN
+MEDIA_URLS_RELATIVE = os.getenv('MEDIA_URLS_RELATIVE') == 'true'
+MEDIA_URL_PREFIX = os.getenv('MEDIA_URL_PREFIX', '')
+# Схему запроса передает заголовок X-Forwarded-Proto. Ему можно верить,
+# только если бэкенд доступен лишь через прокси, который сам задает
+# заголовок (nginx из docker-compose), иначе его подделает любой клиент
+if os.getenv('DJANGO_TRUST_X_FORWARDED_PROTO') == 'true':
+    SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'foodgram.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+# Каталоги загрузок, которые обходит collect_media_garbage
+MEDIA_GARBAGE_DIRECTORIES = ('recipes', 'avatars')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -1,5 +1,4 @@
 from django.contrib import admin
-from django.db.models import Count
 
 from .models import (
     Ingredient, Recipe, RecipeIngredient,
@@ -12,23 +11,13 @@ class IngredientAdmin(admin.ModelAdmin):
     list_display = (
         'name',
         'measurement_unit',
-        'recipe_count'
+        'usage_count'
     )
     search_fields = ('name', )
     ordering = ('name', )
     fields = ('name', 'measurement_unit')
     search_help_text = 'Поиск по названию ингредиента'
 
-    def get_queryset(self, request):
-        return super().get_queryset(request).annotate(
-            recipe_count=Count('recipe_ingredients')
-        )
-
-    def recipe_count(self, obj):
-        return obj.recipe_ingredients.count()
-
-    recipe_count.short_description = 'Используется в рецептах'
-
 
 class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
@@ -68,15 +57,8 @@ class RecipeAdmin(admin.ModelAdmin):
             super().get_queryset(request)
             .select_related('author')
             .prefetch_related('ingredient_amounts')
-            .annotate(_favorites_count=Count('favorited_by'))
         )
 
-    def favorites_count(self, obj):
-        return obj._favorites_count
-
-    favorites_count.admin_order_field = '_favorites_count'
-    favorites_count.short_description = 'В избранном'
-
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
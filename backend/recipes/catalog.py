@@ -0,0 +1,48 @@
+from django.db import transaction
+from django.db.models import F
+
+from .models import Recipe, RecipeIngredient
+from .search import schedule_search_update
+from .versions import CachedVersion, bump_versions, get_version
+
+CATALOG_VERSION_KEY = 'ingredient-catalog'
+
+
+def get_catalog_version():
+    """Текущая версия каталога ингредиентов.
+
+    Версия хранится в базе, поэтому одинакова во всех процессах и
+    меняется для всех сразу после фиксации изменения каталога.
+    """
+    token, number, _ = get_version(CATALOG_VERSION_KEY)
+    return f'{token}-{number}'
+
+
+# Для автодополнения: без запроса к базе на каждое нажатие клавиши
+cached_catalog_version = CachedVersion(
+    get_catalog_version, 'CATALOG_VERSION_CHECK_INTERVAL'
+)
+
+
+def bump_catalog_version():
+    """Помечает все производные данные каталога как устаревшие."""
+    bump_versions([CATALOG_VERSION_KEY])
+    # Сразу - для самой транзакции, после фиксации - для остальных
+    # потоков процесса, успевших перечитать прежнюю версию
+    cached_catalog_version.reset()
+    transaction.on_commit(cached_catalog_version.reset)
+
+
+def touch_ingredient_recipes(ingredient_ids):
+    """Устаревают представления рецептов с этими ингредиентами.
+
+    Нужно после смены названия или единицы измерения: они входят в
+    кешируемые фрагменты рецептов и в поисковый индекс.
+    """
+    recipe_ids = RecipeIngredient.objects.filter(
+        ingredient_id__in=ingredient_ids
+    ).values('recipe_id')
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        version=F('version') + 1
+    )
+    schedule_search_update(recipe_ids.values_list('recipe_id', flat=True))
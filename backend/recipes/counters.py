@@ -0,0 +1,62 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+
+def change_counter(model, pks, field, delta):
+    """Атомарно изменяет счетчик field у строк model с ключами pks."""
+    if delta >= 0:
+        value = F(field) + delta
+    else:
+        # Расхождение не должно уводить счетчик в минус
+        value = Greatest(F(field) + delta, Value(0))
+    model.objects.filter(pk__in=pks).update(**{field: value})
+
+
+def counter_definitions(apps):
+    """Счетчики в виде (модель, поле, связанная модель, внешний ключ)."""
+    User = apps.get_model('users', 'User')
+    Subscription = apps.get_model('users', 'Subscription')
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    return (
+        (User, 'recipes_count', Recipe, 'author'),
+        (User, 'subscribers_count', Subscription, 'author'),
+        (Recipe, 'favorites_count', Favorite, 'recipe'),
+        (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+        (Ingredient, 'usage_count', RecipeIngredient, 'ingredient'),
+    )
+
+
+def actual_count(related, fk):
+    return Coalesce(
+        Subquery(
+            related.objects
+            .filter(**{fk: OuterRef('pk')})
+            .order_by()
+            .values(fk)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        Value(0)
+    )
+
+
+def repair_counter(model, field, related, fk, dry_run=False,
+                   batch_size=1000):
+    """Пересчитывает разошедшиеся счетчики, возвращает число строк."""
+    actual = actual_count(related, fk)
+    drifted = list(
+        model.objects
+        .annotate(actual=actual)
+        .exclude(**{field: F('actual')})
+        .values_list('pk', flat=True)
+    )
+    if not dry_run:
+        for start in range(0, len(drifted), batch_size):
+            model.objects.filter(
+                pk__in=drifted[start:start + batch_size]
+            ).update(**{field: actual})
+    return len(drifted)
@@ -0,0 +1,131 @@
+"""Лента рецептов авторов, на которых подписан пользователь.
+
+Гибридная схема: рецепт автора, у которого не больше
+FEED_FANOUT_MAX_SUBSCRIBERS подписчиков, при публикации записывается
+в ленты всех подписчиков (FeedEntry). Рецепты популярных авторов не
+копируются, а выбираются при чтении по индексу (author, pub_date) и
+сливаются с записями ленты. Лента каждого пользователя хранит не
+больше FEED_MAX_LENGTH последних записей.
+
+Если автор перестает быть популярным, его прежние рецепты в ленты не
+попадают: записи появляются начиная со следующей публикации.
+"""
+from django.conf import settings
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from users.models import Subscription, User
+
+from .models import FeedEntry, Recipe
+
+
+def is_fanout_author(subscribers_count):
+    return subscribers_count <= settings.FEED_FANOUT_MAX_SUBSCRIBERS
+
+
+def trim_feeds(user_ids):
+    """Удаляет записи сверх FEED_MAX_LENGTH в лентах user_ids."""
+    extra = FeedEntry.objects.filter(user_id__in=user_ids).annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=F('user_id'),
+            order_by=[F('pub_date').desc(), F('recipe_id').desc()]
+        )
+    ).filter(position__gt=settings.FEED_MAX_LENGTH).values_list(
+        'pk', flat=True
+    )
+    FeedEntry.objects.filter(pk__in=list(extra)).delete()
+
+
+def push_recipe(recipe):
+    """Записывает новый рецепт в ленты подписчиков автора."""
+    subscribers_count = User.objects.filter(
+        pk=recipe.author_id
+    ).values_list('subscribers_count', flat=True).first()
+    if not subscribers_count or not is_fanout_author(subscribers_count):
+        return
+    user_ids = list(Subscription.objects.filter(
+        author_id=recipe.author_id
+    ).values_list('user_id', flat=True))
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, recipe_id=recipe.pk,
+                   author_id=recipe.author_id, pub_date=recipe.pub_date)
+         for user_id in user_ids),
+        ignore_conflicts=True,
+        batch_size=1000
+    )
+    trim_feeds(user_ids)
+
+
+def add_author(user_id, author_id):
+    """Переносит в ленту последние рецепты нового автора подписки."""
+    subscribers_count = User.objects.filter(
+        pk=author_id
+    ).values_list('subscribers_count', flat=True).first()
+    if subscribers_count is None or not is_fanout_author(subscribers_count):
+        return
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, recipe_id=pk, author_id=author_id,
+                   pub_date=pub_date)
+         for pk, pub_date in Recipe.objects.filter(author_id=author_id)
+         .order_by('-pub_date', '-id')
+         .values_list('id', 'pub_date')[:settings.FEED_MAX_LENGTH]),
+        ignore_conflicts=True,
+        batch_size=1000
+    )
+    trim_feeds([user_id])
+
+
+def remove_author(user_id, author_id):
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def _after(queryset, position, pk_field):
+    # Первое условие дает индексу границу диапазона
+    if position is None:
+        return queryset
+    pub_date, pk = position
+    return queryset.filter(
+        Q(pub_date__lt=pub_date) | Q(**{f'{pk_field}__lt': pk}),
+        pub_date__lte=pub_date
+    )
+
+
+class Feed:
+    """Лента пользователя: записи FeedEntry и рецепты популярных авторов."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+
+    def pulled_authors(self):
+        return list(Subscription.objects.filter(
+            user_id=self.user_id,
+            author__subscribers_count__gt=settings.FEED_FANOUT_MAX_SUBSCRIBERS
+        ).values_list('author_id', flat=True))
+
+    def page(self, position, size):
+        """До size рецептов после позиции (pub_date, id), от новых.
+
+        Возвращает словари с ключами id и pub_date.
+        """
+        pulled = self.pulled_authors()
+        entries = FeedEntry.objects.filter(user_id=self.user_id)
+        if pulled:
+            # Записи, созданные, пока автор не был популярным
+            entries = entries.exclude(author_id__in=pulled)
+        rows = [
+            {'id': pk, 'pub_date': pub_date}
+            for pk, pub_date in _after(entries, position, 'recipe_id')
+            .order_by('-pub_date', '-recipe_id')
+            .values_list('recipe_id', 'pub_date')[:size]
+        ]
+        if pulled:
+            rows.extend(
+                _after(Recipe.objects.filter(author_id__in=pulled),
+                       position, 'id')
+                .order_by('-pub_date', '-id')
+                .values('id', 'pub_date')[:size]
+            )
+            rows.sort(key=lambda row: (row['pub_date'], row['id']),
+                      reverse=True)
+        return rows[:size]
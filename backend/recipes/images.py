@@ -0,0 +1,177 @@
+"""Уменьшенные копии изображений рецептов и аватаров.
+
+Для каждого варианта размера создаются файлы WebP и JPEG, их имена
+хранятся в JSON-поле модели вместе с именем исходного файла (source).
+Пока source не совпадает с текущим изображением, сериализаторы отдают
+оригинал. Обработка идет в пуле потоков после фиксации транзакции.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import F
+from PIL import Image, ImageOps
+
+from users.models import User
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+# Расширение файла, формат Pillow и параметры кодирования
+FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+JPEG_BACKGROUND = (255, 255, 255)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variants_ready(file, variants):
+    """Готовы ли копии для текущего файла изображения."""
+    return bool(file) and variants.get('source') == file.name
+
+
+def variant_name(source, variant, extension):
+    # Хранилище может разложить файл по подкаталогам, копии же лежат
+    # в каталоге variants рядом с верхним каталогом загрузок
+    directory = source.split('/', 1)[0]
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return f'{directory}/variants/{stem}-{variant}.{extension}'
+
+
+def _encode(image, image_format, options):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, JPEG_BACKGROUND)
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def render_variants(source, sizes, crop=False):
+    """Создает копии файла source и возвращает словарь их имен.
+
+    При crop изображение обрезается до пропорций варианта (аватары),
+    иначе вписывается в него. Увеличение не выполняется.
+    """
+    with default_storage.open(source, 'rb') as file:
+        image = Image.open(file)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    variants = {'source': source}
+    for variant, size in sizes.items():
+        if crop:
+            resized = ImageOps.fit(image, size, Image.LANCZOS)
+        else:
+            resized = image.copy()
+            resized.thumbnail(size, Image.LANCZOS)
+        files = {}
+        for extension, image_format, options in FORMATS:
+            name = variant_name(source, variant, extension)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            files[extension] = default_storage.save(
+                name, ContentFile(_encode(resized, image_format, options))
+            )
+        variants[variant] = files
+    return variants
+
+
+def delete_variants(variants, keep=None):
+    keep = keep or {}
+    kept = {
+        name for variant, files in keep.items() if variant != 'source'
+        for name in files.values()
+    }
+    for variant, files in variants.items():
+        if variant == 'source':
+            continue
+        for name in files.values():
+            if name not in kept:
+                default_storage.delete(name)
+
+
+def _store_variants(model, pk, field, variants_field, sizes, crop, **extra):
+    row = model.objects.filter(pk=pk).values(field, variants_field).first()
+    if not row or not row[field]:
+        return False
+    source, previous = row[field], row[variants_field] or {}
+    try:
+        variants = render_variants(source, sizes, crop)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.exception('Не удалось обработать %s', source)
+        return False
+    # Изображение могло смениться, пока шла обработка
+    updated = model.objects.filter(pk=pk, **{field: source}).update(
+        **{variants_field: variants}, **extra
+    )
+    if updated:
+        delete_variants(previous, keep=variants)
+    else:
+        delete_variants(variants)
+    return bool(updated)
+
+
+def process_recipe_image(recipe_id):
+    return _store_variants(
+        Recipe, recipe_id, 'image', 'image_variants',
+        settings.RECIPE_IMAGE_VARIANTS, crop=False,
+        version=F('version') + 1
+    )
+
+
+def process_avatar(user_id):
+    updated = _store_variants(
+        User, user_id, 'avatar', 'avatar_variants',
+        settings.AVATAR_IMAGE_VARIANTS, crop=True
+    )
+    if updated:
+        # Аватар входит в кешируемое представление рецептов автора
+        Recipe.objects.filter(author_id=user_id).update(
+            version=F('version') + 1
+        )
+    return updated
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_PROCESSING_WORKERS,
+                    thread_name_prefix='image-variants'
+                )
+    return _executor
+
+
+def _run(task, pk):
+    try:
+        task(pk)
+    except Exception:
+        logger.exception('Ошибка обработки изображения %s(%s)', task, pk)
+    finally:
+        connection.close()
+
+
+def schedule_variants(task, pk):
+    """Запускает task(pk) в пуле потоков после фиксации транзакции."""
+    def submit():
+        if settings.IMAGE_PROCESSING_SYNC:
+            task(pk)
+        else:
+            get_executor().submit(_run, task, pk)
+    transaction.on_commit(submit)
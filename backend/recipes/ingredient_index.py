@@ -0,0 +1,146 @@
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+from .catalog import cached_catalog_version
+from .models import Ingredient
+
+PREFIX_UPPER_BOUND = '\U0010ffff'
+
+WORD_RE = re.compile(r'\w+')
+
+
+def trigrams(text):
+    """Множество триграмм строки по правилам pg_trgm.
+
+    Каждое слово дополняется двумя пробелами слева и одним справа.
+    """
+    result = set()
+    for word in WORD_RE.findall(text.casefold()):
+        padded = f'  {word} '
+        result.update(
+            padded[i:i + 3] for i in range(len(padded) - 2)
+        )
+    return result
+
+
+class IngredientIndex:
+    """Индекс названий ингредиентов в памяти процесса.
+
+    Хранит отсортированный массив названий в casefold для поиска по
+    префиксу и инвертированный индекс триграмм для нечеткого поиска.
+    Строится лениво при первом обращении и перестраивается, когда
+    меняется версия каталога. Изменения из других процессов видны не
+    позже чем через CATALOG_VERSION_CHECK_INTERVAL секунд.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._keys = []
+        self._rows = []
+        self._trigram_counts = []
+        self._postings = {}
+
+    def _ensure_fresh(self):
+        version = cached_catalog_version.get()
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self._build(version)
+
+    def _build(self, version):
+        entries = sorted(
+            (row['name'].casefold(), row['name'], row['id'], row)
+            for row in Ingredient.objects.values(
+                'id', 'name', 'measurement_unit'
+            )
+        )
+        postings = {}
+        trigram_counts = []
+        for position, entry in enumerate(entries):
+            row_trigrams = trigrams(entry[0])
+            trigram_counts.append(len(row_trigrams))
+            for trigram in row_trigrams:
+                postings.setdefault(trigram, []).append(position)
+
+        self._keys = [entry[0] for entry in entries]
+        self._rows = [entry[3] for entry in entries]
+        self._trigram_counts = trigram_counts
+        self._postings = postings
+        self._version = version
+
+    def _prefix_range(self, prefix):
+        key = prefix.casefold()
+        start = bisect_left(self._keys, key)
+        end = bisect_right(self._keys, key + PREFIX_UPPER_BOUND, lo=start)
+        return start, end
+
+    def startswith(self, prefix):
+        """Строки ингредиентов, название которых начинается с prefix."""
+        self._ensure_fresh()
+        start, end = self._prefix_range(prefix)
+        return [dict(row) for row in self._rows[start:end]]
+
+    def startswith_ids(self, prefix):
+        self._ensure_fresh()
+        start, end = self._prefix_range(prefix)
+        return [row['id'] for row in self._rows[start:end]]
+
+    def search(self, query, limit, threshold):
+        """Нечеткий поиск с ранжированием.
+
+        Сначала идут совпадения по префиксу, затем по подстроке, затем
+        по сходству триграмм не ниже threshold. Внутри групп префиксов
+        и подстрок порядок алфавитный, триграммы упорядочены по
+        убыванию сходства.
+        """
+        self._ensure_fresh()
+        key = query.casefold().strip()
+        if not key:
+            return []
+
+        start, end = self._prefix_range(key)
+        ranked = list(range(start, min(end, start + limit)))
+        if len(ranked) >= limit:
+            return self._result(ranked)
+        found = set(range(start, end))
+
+        query_trigrams = trigrams(key)
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(self._postings.get(trigram, ()))
+
+        # Кандидаты на подстроку: триграммы без краевых пробелов должны
+        # встречаться в названии, для коротких запросов нужен полный проход
+        if len(key) >= 3:
+            candidates = sorted(shared)
+        else:
+            candidates = range(len(self._keys))
+        for position in candidates:
+            if position not in found and key in self._keys[position]:
+                ranked.append(position)
+                found.add(position)
+                if len(ranked) >= limit:
+                    return self._result(ranked)
+
+        similar = []
+        for position, count in shared.items():
+            if position in found:
+                continue
+            similarity = count / (
+                len(query_trigrams) + self._trigram_counts[position] - count
+            )
+            if similarity >= threshold:
+                similar.append((-similarity, position))
+        similar.sort()
+        ranked.extend(position for _, position in similar)
+        return self._result(ranked[:limit])
+
+    def _result(self, positions):
+        return [dict(self._rows[position]) for position in positions]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .ingredient_index import ingredient_index
+from .models import Ingredient
+
+_pg_trgm_available = None
+
+
+def pg_trgm_available():
+    """Установлено ли расширение pg_trgm (проверяется раз на процесс)."""
+    global _pg_trgm_available
+    if connection.vendor != 'postgresql':
+        return False
+    if _pg_trgm_available is None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+            )
+            _pg_trgm_available = cursor.fetchone() is not None
+    return _pg_trgm_available
+
+
+def _search_postgres(query, limit, threshold):
+    # Импорт внутри функции: модули postgres требуют psycopg
+    from django.contrib.postgres.lookups import TrigramSimilar
+    from django.contrib.postgres.search import TrigramSimilarity
+
+    name_field = Ingredient._meta.get_field('name')
+    if 'trigram_similar' not in name_field.get_lookups():
+        name_field.register_lookup(TrigramSimilar)
+
+    return list(
+        Ingredient.objects
+        .annotate(
+            rank=Case(
+                When(name__istartswith=query, then=Value(0)),
+                When(name__icontains=query, then=Value(1)),
+                default=Value(2),
+                output_field=IntegerField()
+            ),
+            similarity=TrigramSimilarity('name', query)
+        )
+        .filter(
+            Q(name__icontains=query)
+            | Q(name__trigram_similar=query, similarity__gte=threshold)
+        )
+        .order_by('rank', '-similarity', 'name')
+        .values('id', 'name', 'measurement_unit')[:limit]
+    )
+
+
+def search_ingredients(query, limit=None):
+    """Нечеткий поиск ингредиентов, устойчивый к опечаткам.
+
+    На Postgres с pg_trgm запрос обслуживает GIN-индекс триграмм,
+    в остальных случаях используется индекс в памяти процесса.
+    """
+    limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+    threshold = settings.INGREDIENT_SEARCH_SIMILARITY
+    if pg_trgm_available():
+        return _search_postgres(query, limit, threshold)
+    return ingredient_index.search(query, limit, threshold)
@@ -0,0 +1,59 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from recipes.images import process_avatar, process_recipe_image
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Build resized image variants for recipes and avatars'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать копии, даже если они уже есть'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Сколько изображений обрабатывать параллельно'
+        )
+
+    def pending(self, queryset, field, variants_field):
+        rows = queryset.exclude(**{field: ''}).exclude(
+            **{f'{field}__isnull': True}
+        ).values_list('pk', field, variants_field)
+        return [
+            pk for pk, name, variants in rows.iterator()
+            if self.rebuild_all or (variants or {}).get('source') != name
+        ]
+
+    def run(self, task, pk):
+        try:
+            return task(pk)
+        finally:
+            connection.close()
+
+    def handle(self, *args, **options):
+        self.rebuild_all = options['all']
+        jobs = (
+            ('recipes', process_recipe_image,
+             self.pending(Recipe.objects.all(), 'image', 'image_variants')),
+            ('avatars', process_avatar,
+             self.pending(User.objects.all(), 'avatar', 'avatar_variants')),
+        )
+        workers = options['workers']
+        for label, task, ids in jobs:
+            if workers > 1:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    done = sum(pool.map(lambda pk: self.run(task, pk), ids))
+            else:
+                done = sum(task(pk) for pk in ids)
+            self.stdout.write(self.style.SUCCESS(
+                f'{label}: {done} of {len(ids)} processed'
+            ))
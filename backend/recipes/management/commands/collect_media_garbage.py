@@ -0,0 +1,95 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Delete uploaded media files that are not referenced anymore'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=60 * 60,
+            help='Не трогать файлы моложе стольких секунд'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько файлов удалять за один проход'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что будет удалено'
+        )
+
+    def referenced(self):
+        """Имена файлов, на которые ссылаются записи в базе."""
+        names = set()
+        for model, field, variants_field in (
+            (Recipe, 'image', 'image_variants'),
+            (User, 'avatar', 'avatar_variants'),
+        ):
+            for name, variants in model.objects.values_list(
+                field, variants_field
+            ).iterator(chunk_size=2000):
+                if name:
+                    names.add(name)
+                for variant, files in (variants or {}).items():
+                    if variant != 'source':
+                        names.update(files.values())
+        return names
+
+    def walk(self, path):
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self.walk(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+    def handle(self, *args, **options):
+        referenced = self.referenced()
+        root = default_storage.location
+        deadline = time.time() - options['min_age']
+        batch, deleted, freed = [], 0, 0
+
+        def flush():
+            nonlocal deleted
+            for path in batch:
+                if not options['dry_run']:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        continue
+                deleted += 1
+            batch.clear()
+
+        for directory in settings.MEDIA_GARBAGE_DIRECTORIES:
+            top = os.path.join(root, directory)
+            if not os.path.isdir(top):
+                continue
+            for entry in self.walk(top):
+                name = os.path.relpath(entry.path, root).replace(os.sep, '/')
+                stat = entry.stat(follow_symlinks=False)
+                if name in referenced or stat.st_mtime > deadline:
+                    continue
+                batch.append(entry.path)
+                freed += stat.st_size
+                if len(batch) >= options['batch_size']:
+                    flush()
+        flush()
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {deleted} files, {freed / 1024 / 1024:.1f} MB, '
+            f'{len(referenced)} referenced'
+        ))
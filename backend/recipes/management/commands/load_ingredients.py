@@ -1,54 +1,222 @@
+import csv
 import json
 import os
+from contextlib import ExitStack
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
+from recipes.catalog import bump_catalog_version, touch_ingredient_recipes
 from recipes.models import Ingredient
 
+READ_CHUNK_SIZE = 64 * 1024
 
-class Command(BaseCommand):
-    help = 'Load ingredients from JSON file into database'
 
-    def handle(self, *args, **options):
-        print(Ingredient.objects.count())
+def iter_csv(f):
+    for row in csv.reader(f):
+        if row:
+            yield {'name': row[0], 'measurement_unit': row[1]}
 
-        file_path = os.path.join('data', 'ingredients.json')
 
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                ingredients = json.load(f)
+def iter_json(f):
+    """Потоково разбирает JSON-массив объектов, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
 
-                stats = {'created': 0, 'updated': 0, 'unchanged': 0}
+    while True:
+        # Пропускаем пробелы и разделители между элементами массива
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if not started and position < len(buffer):
+            if buffer[position] != '[':
+                raise json.JSONDecodeError(
+                    'Expecting array', buffer, position
+                )
+            started = True
+            position += 1
+            continue
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        if position < len(buffer):
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield item
+                position = end
+                continue
+        if eof:
+            raise json.JSONDecodeError(
+                'Unterminated array', buffer, position
+            )
+        chunk = f.read(READ_CHUNK_SIZE)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
 
-                for item in ingredients:
-                    obj, created = Ingredient.objects.update_or_create(
-                        name=item['name'],
-                        defaults={
-                            'measurement_unit': item['measurement_unit']
-                        }
-                    )
 
-                    if created:
-                        stats['created'] += 1
-                    elif obj.measurement_unit != item['measurement_unit']:
-                        stats['updated'] += 1
-                    else:
-                        stats['unchanged'] += 1
-
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f"Ingredients processed: "
-                        f"{stats['created']} created, "
-                        f"{stats['updated']} updated, "
-                        f"{stats['unchanged']} unchanged"
-                    )
-                )
+READERS = {
+    '.csv': iter_csv,
+    '.json': iter_json,
+}
 
+
+class Command(BaseCommand):
+    help = 'Load ingredients from JSON or CSV file into database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=os.path.join('data', 'ingredients.json'),
+            help='Путь к файлу .json или .csv с ингредиентами'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пакета для bulk_create/bulk_update'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать изменения, не записывая их в БД'
+        )
+
+    def handle(self, *args, **options):
+        file_path = options['path']
+        reader = READERS.get(os.path.splitext(file_path)[1].lower())
+        if reader is None:
+            self.stdout.write(
+                self.style.ERROR(f"Unsupported file format: {file_path}")
+            )
+            return
+
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                stats = self.load(reader(f), options)
         except FileNotFoundError:
             self.stdout.write(
                 self.style.ERROR(f"File not found: {file_path}")
             )
+            return
         except json.JSONDecodeError as e:
             self.stdout.write(
                 self.style.ERROR(f"JSON decode error: {str(e)}")
             )
+            return
+
+        prefix = 'Dry run: ' if options['dry_run'] else ''
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{prefix}Ingredients processed: "
+                f"{stats['created']} created, "
+                f"{stats['updated']} updated, "
+                f"{stats['unchanged']} unchanged, "
+                f"{stats['duplicates']} duplicates (last row kept)"
+            )
+        )
+
+    def load(self, items, options):
+        """Сравнивает файл с БД и применяет разницу пакетами.
+
+        Существующие ингредиенты читаются из БД одним запросом.
+        Транзакция открывается только при первом изменении, поэтому
+        повторная загрузка того же каталога стоит ровно один запрос.
+        Если название встречается в файле несколько раз, действует
+        последняя строка, а повторы попадают в статистику.
+        """
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        verbose = options['verbosity'] > 1
+
+        stats = {'created': 0, 'updated': 0, 'unchanged': 0, 'duplicates': 0}
+        rows = {}
+        for item in items:
+            name = item['name'].strip()
+            unit = item['measurement_unit'].strip()
+            if name in rows:
+                stats['duplicates'] += 1
+                if verbose:
+                    self.stdout.write(
+                        f'duplicate: {name} ({rows[name]} -> {unit})'
+                    )
+            rows[name] = unit
+
+        # У одного названия в БД может быть несколько единиц измерения
+        existing = {}
+        for pk, name, unit in Ingredient.objects.order_by('id').values_list(
+            'id', 'name', 'measurement_unit'
+        ):
+            existing.setdefault(name, {}).setdefault(unit, pk)
+
+        to_create = []
+        to_update = []
+        updated_ids = []
+
+        with ExitStack() as stack:
+            in_transaction = False
+
+            def flush(force=False):
+                nonlocal in_transaction
+                if dry_run:
+                    to_create.clear()
+                    to_update.clear()
+                    return
+                if not in_transaction:
+                    stack.enter_context(transaction.atomic())
+                    in_transaction = True
+                if to_create and (force or len(to_create) >= batch_size):
+                    Ingredient.objects.bulk_create(
+                        to_create, batch_size=batch_size,
+                        ignore_conflicts=True
+                    )
+                    to_create.clear()
+                if to_update and (force or len(to_update) >= batch_size):
+                    Ingredient.objects.bulk_update(
+                        to_update, ['measurement_unit'],
+                        batch_size=batch_size
+                    )
+                    to_update.clear()
+
+            for name, unit in rows.items():
+                units = existing.get(name)
+                if units is not None and unit in units:
+                    stats['unchanged'] += 1
+                    continue
+
+                if units is not None:
+                    # Пары (name, unit) в БД нет, поэтому смена единицы
+                    # у самой старой строки не нарушит unique_ingredient
+                    stats['updated'] += 1
+                    updated_ids.append(min(units.values()))
+                    to_update.append(Ingredient(
+                        id=updated_ids[-1], name=name,
+                        measurement_unit=unit
+                    ))
+                    action = 'update'
+                else:
+                    stats['created'] += 1
+                    to_create.append(
+                        Ingredient(name=name, measurement_unit=unit)
+                    )
+                    action = 'create'
+                if verbose:
+                    self.stdout.write(f'{action}: {name} ({unit})')
+                if max(len(to_create), len(to_update)) >= batch_size:
+                    flush()
+
+            if to_create or to_update:
+                flush(force=True)
+            # bulk_update не отправляет сигналов, а единица измерения
+            # входит в кешируемые представления рецептов
+            if updated_ids and not dry_run:
+                touch_ingredient_recipes(updated_ids)
+
+        if not dry_run and (stats['created'] or stats['updated']):
+            bump_catalog_version()
+        return stats
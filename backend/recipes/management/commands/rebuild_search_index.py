@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.search import unindexed_recipes, update_search_index
+
+
+class Command(BaseCommand):
+    help = 'Build full-text search index for recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Переиндексировать все рецепты, а не только новые'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько рецептов индексировать за раз'
+        )
+
+    def handle(self, *args, **options):
+        queryset = (
+            Recipe.objects.all() if options['all'] else unindexed_recipes()
+        )
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+        batch_size = options['batch_size']
+        for start in range(0, len(ids), batch_size):
+            update_search_index(ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {len(ids)} recipes'))
@@ -0,0 +1,34 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from recipes.shopping_list import repair_shopping_lists
+
+
+class Command(BaseCommand):
+    help = 'Recompute shopping list totals from carts and repair drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Скольких пользователей сверять за один проход'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения'
+        )
+
+    def handle(self, *args, **options):
+        repaired = repair_shopping_lists(
+            apps,
+            dry_run=options['dry_run'],
+            batch_size=options['batch_size']
+        )
+        if repaired:
+            self.stdout.write(
+                self.style.WARNING(f'Shopping lists: {repaired} drifted')
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS('Shopping lists: ok'))
@@ -0,0 +1,38 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import counter_definitions, repair_counter
+
+
+class Command(BaseCommand):
+    help = 'Recount denormalized counters and repair drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько строк исправлять одним UPDATE'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения'
+        )
+
+    def handle(self, *args, **options):
+        for model, field, related, fk in counter_definitions(apps):
+            with transaction.atomic():
+                drifted = repair_counter(
+                    model, field, related, fk,
+                    dry_run=options['dry_run'],
+                    batch_size=options['batch_size']
+                )
+            label = f'{model._meta.label}.{field}'
+            if drifted:
+                self.stdout.write(
+                    self.style.WARNING(f'{label}: {drifted} drifted')
+                )
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{label}: ok'))
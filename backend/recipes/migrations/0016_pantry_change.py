@@ -0,0 +1,25 @@
+# Generated by Django 5.2.3 on 2026-10-18 04:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_data_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PantryChange',
+            fields=[
+                ('number', models.PositiveBigIntegerField(primary_key=True, serialize=False, verbose_name='Номер')),
+                ('changes', models.JSONField(verbose_name='Наборы ингредиентов рецептов')),
+                ('created', models.DateTimeField(db_index=True, verbose_name='Время записи')),
+            ],
+            options={
+                'verbose_name': 'Изменение для подбора по кладовой',
+                'verbose_name_plural': 'Журнал подбора по кладовой',
+            },
+        ),
+    ]
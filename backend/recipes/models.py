@@ -16,6 +16,10 @@ class Ingredient(models.Model):
         verbose_name='Единица измерения',
         max_length=INGREDIENT_MAX_LENGTH,
     )
+    usage_count = models.PositiveIntegerField(
+        verbose_name='Используется в рецептах',
+        default=0
+    )
 
     class Meta:
         verbose_name = 'Ингредиент'
@@ -54,6 +58,12 @@ class Recipe(models.Model):
         blank=True,
         null=True
     )
+    image_variants = models.JSONField(
+        verbose_name='Уменьшенные копии изображения',
+        default=dict,
+        blank=True,
+        editable=False
+    )
     text = models.TextField(
         verbose_name='Описание'
     )
@@ -72,11 +82,35 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В списках покупок',
+        default=0
+    )
+    version = models.PositiveIntegerField(
+        verbose_name='Версия представления',
+        default=1,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['pub_date']
+        indexes = [
+            # Ключ курсорной навигации ленты рецептов
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -173,3 +207,178 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} — {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    """Итог списка покупок пользователя по одному ингредиенту.
+
+    Сумма количеств ингредиента во всех рецептах корзины, обновляется
+    вместе с корзиной и ингредиентами рецептов.
+    """
+    user = models.ForeignKey(
+        to=User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list'
+    )
+    ingredient = models.ForeignKey(
+        to=Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items'
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество'
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    'user',
+                    'ingredient'
+                ],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} — {self.amount} {self.ingredient}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписок пользователя.
+
+    Записи создаются при публикации рецепта для подписчиков авторов
+    с небольшим числом подписчиков. pub_date копируется из рецепта,
+    чтобы лента листалась по индексу без соединения с рецептами.
+    """
+    user = models.ForeignKey(
+        to=User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries'
+    )
+    recipe = models.ForeignKey(
+        to=Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries'
+    )
+    author = models.ForeignKey(
+        to=User,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    'user',
+                    'recipe'
+                ],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_entry_user_pub_date_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} — {self.recipe}'
+
+
+class RecipeSearchTerm(models.Model):
+    """Встроенный инвертированный индекс для полнотекстового поиска.
+
+    Используется, когда база данных не поддерживает tsvector.
+    """
+    recipe = models.ForeignKey(
+        to=Recipe,
+        on_delete=models.CASCADE,
+        related_name='search_terms'
+    )
+    term = models.CharField(
+        verbose_name='Основа слова',
+        max_length=64
+    )
+    weight = models.PositiveSmallIntegerField(
+        verbose_name='Вес'
+    )
+
+    class Meta:
+        verbose_name = 'Термин поискового индекса'
+        verbose_name_plural = 'Поисковый индекс рецептов'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['term', 'recipe'],
+                name='search_term_recipe_unique'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.term} → {self.recipe_id}'
+
+
+class DataVersion(models.Model):
+    """Версия данных, по которой процессы сверяют свои кеши и индексы.
+
+    Токен задается при создании строки, номер увеличивается при каждом
+    изменении данных в той же транзакции.
+    """
+    key = models.CharField(
+        verbose_name='Ключ',
+        max_length=64,
+        primary_key=True
+    )
+    token = models.CharField(
+        verbose_name='Токен',
+        max_length=32
+    )
+    number = models.PositiveBigIntegerField(
+        verbose_name='Номер',
+        default=0
+    )
+    changed = models.DateTimeField(
+        verbose_name='Время изменения'
+    )
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.key}: {self.number}'
+
+
+class PantryChange(models.Model):
+    """Запись журнала изменений наборов ингредиентов рецептов.
+
+    По журналу процессы обновляют свои индексы подбора по кладовой.
+    changes - список пар [id рецепта, отсортированные id ингредиентов].
+    """
+    number = models.PositiveBigIntegerField(
+        verbose_name='Номер',
+        primary_key=True
+    )
+    changes = models.JSONField(
+        verbose_name='Наборы ингредиентов рецептов'
+    )
+    created = models.DateTimeField(
+        verbose_name='Время записи',
+        db_index=True
+    )
+
+    class Meta:
+        verbose_name = 'Изменение для подбора по кладовой'
+        verbose_name_plural = 'Журнал подбора по кладовой'
+
+    def __str__(self):
+        return f'{self.number}'
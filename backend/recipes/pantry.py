@@ -0,0 +1,226 @@
+"""Индекс «что приготовить из того, что есть».
+
+Для каждого ингредиента хранится битовая маска рецептов (бит с номером
+id рецепта), для каждого рецепта - отсортированный кортеж его
+ингредиентов. Число недостающих ингредиентов считается поразрядными
+операциями над масками ингредиентов, которых нет в кладовой, без
+перебора рецептов в Python.
+
+Индекс живет в памяти процесса. Изменения рецептов записываются в
+журнал в базе (PantryChange) с номерами подряд, номер последней записи
+хранится в версии DataVersion, и каждый процесс применяет недостающие
+записи журнала перед запросом. Записи старше PANTRY_CHANGE_LOG_TIMEOUT
+удаляются; процесс, которому их не хватило, строит индекс заново из
+RecipeIngredient.
+"""
+import threading
+from collections import defaultdict
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import PantryChange, RecipeIngredient
+from .versions import bump_versions, get_version
+
+PANTRY_VERSION_KEY = 'pantry'
+
+
+def get_pantry_version():
+    """Текущая версия журнала: (токен, номер последней записи).
+
+    Токен меняется, только если строка версии создана заново, и тогда
+    все процессы перестраивают индекс целиком.
+    """
+    token, number, _ = get_version(PANTRY_VERSION_KEY)
+    return token, number
+
+
+def publish_pantry_changes(recipe_ids):
+    """Записывает в журнал актуальные наборы ингредиентов рецептов.
+
+    Рецепт без ингредиентов (в том числе удаленный) попадает в журнал
+    с пустым набором и удаляется из индекса.
+    """
+    changes = {pk: [] for pk in recipe_ids}
+    if not changes:
+        return
+    for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+        recipe_id__in=changes
+    ).values_list('recipe_id', 'ingredient_id'):
+        changes[recipe_id].append(ingredient_id)
+    now = timezone.now()
+    with transaction.atomic():
+        # Строка версии заблокирована до фиксации, поэтому записи
+        # журнала становятся видны строго в порядке номеров
+        bump_versions([PANTRY_VERSION_KEY])
+        _, number = get_pantry_version()
+        PantryChange.objects.filter(
+            Q(number__gte=number) | Q(created__lt=now - timedelta(
+                seconds=settings.PANTRY_CHANGE_LOG_TIMEOUT
+            ))
+        ).delete()
+        PantryChange.objects.create(
+            number=number,
+            changes=[[pk, sorted(set(ids))] for pk, ids in changes.items()],
+            created=now
+        )
+
+
+def schedule_pantry_update(recipe_ids):
+    """Публикует изменения рецептов после фиксации транзакции."""
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(lambda: publish_pantry_changes(recipe_ids))
+
+
+class PantryMatches:
+    """Результат подбора: ленивая последовательность (id, недостает).
+
+    levels[n] - маска рецептов, которым не хватает ровно n ингредиентов.
+    Внутри уровня рецепты идут по убыванию id, то есть от новых к старым,
+    и раскрываются из маски только для запрошенного среза. recipes -
+    наборы ингредиентов рецептов из того же состояния индекса.
+    """
+
+    def __init__(self, levels, recipes, pantry):
+        self.levels = levels
+        self.recipes = recipes
+        self.pantry = pantry
+
+    def missing_ingredients(self, recipe_id):
+        """Ингредиенты рецепта, которых нет в кладовой, без запросов."""
+        return [
+            ingredient_id for ingredient_id in self.recipes.get(recipe_id, ())
+            if ingredient_id not in self.pantry
+        ]
+
+    def __len__(self):
+        return sum(mask.bit_count() for mask in self.levels)
+
+    def __iter__(self):
+        for missing, mask in enumerate(self.levels):
+            bits = bin(mask)
+            top = len(bits) - 1
+            position = bits.find('1', 2)
+            while position != -1:
+                yield top - position, missing
+                position = bits.find('1', position + 1)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        return list(islice(self, index.start, index.stop))
+
+
+class PantryIndex:
+    """Битовые маски рецептов по ингредиентам в памяти процесса."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._recipes = {}
+        self._masks = {}
+
+    def _ensure_fresh(self):
+        version = get_pantry_version()
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self._sync(version)
+
+    def _sync(self, version):
+        token, number = version
+        if self._version is None or self._version[0] != token:
+            self._build(version)
+            return
+        changes = list(PantryChange.objects.filter(
+            number__gt=self._version[1], number__lte=number
+        ).order_by('number').values_list('changes', flat=True))
+        if len(changes) != number - self._version[1]:
+            self._build(version)
+            return
+        # Копия при записи: результаты прежних подборов ссылаются на
+        # старый словарь и не видят изменений после себя
+        self._recipes = dict(self._recipes)
+        for change in changes:
+            for recipe_id, ingredient_ids in change:
+                self._set_recipe(recipe_id, tuple(ingredient_ids))
+        self._version = version
+
+    def _build(self, version):
+        sets = defaultdict(set)
+        bits = defaultdict(list)
+        for recipe_id, ingredient_id in (
+            RecipeIngredient.objects.values_list('recipe_id', 'ingredient_id')
+            .iterator(chunk_size=10000)
+        ):
+            sets[recipe_id].add(ingredient_id)
+            bits[ingredient_id].append(recipe_id)
+        self._recipes = {
+            recipe_id: tuple(sorted(ingredient_ids))
+            for recipe_id, ingredient_ids in sets.items()
+        }
+        self._masks = {
+            ingredient_id: _mask(recipe_ids)
+            for ingredient_id, recipe_ids in bits.items()
+        }
+        self._version = version
+
+    def _set_recipe(self, recipe_id, ingredient_ids):
+        bit = 1 << recipe_id
+        for ingredient_id in self._recipes.pop(recipe_id, ()):
+            mask = self._masks[ingredient_id] & ~bit
+            if mask:
+                self._masks[ingredient_id] = mask
+            else:
+                del self._masks[ingredient_id]
+        if ingredient_ids:
+            self._recipes[recipe_id] = tuple(ingredient_ids)
+            for ingredient_id in ingredient_ids:
+                self._masks[ingredient_id] = (
+                    self._masks.get(ingredient_id, 0) | bit
+                )
+
+    def search(self, pantry, max_missing=0):
+        """Рецепты, которым не хватает не больше max_missing ингредиентов.
+
+        Учитываются только рецепты, где есть хотя бы один ингредиент
+        кладовой. Результат упорядочен по числу недостающих, затем от
+        новых рецептов к старым.
+        """
+        self._ensure_fresh()
+        pantry = set(pantry)
+        with self._lock:
+            masks = self._masks
+            recipes = self._recipes
+            covered = 0
+            for ingredient_id in pantry:
+                covered |= masks.get(ingredient_id, 0)
+            # at_least[n] - рецепты, где вне кладовой n + 1 и более
+            # ингредиентов; счет насыщается на max_missing + 1
+            at_least = [0] * (max_missing + 1)
+            for ingredient_id, mask in masks.items():
+                if ingredient_id in pantry:
+                    continue
+                mask &= covered
+                for level in range(max_missing, 0, -1):
+                    at_least[level] |= at_least[level - 1] & mask
+                at_least[0] |= mask
+        levels = [covered & ~at_least[0]]
+        for level in range(1, max_missing + 1):
+            levels.append(at_least[level - 1] & ~at_least[level])
+        return PantryMatches(levels, recipes, pantry)
+
+
+def _mask(recipe_ids):
+    bits = bytearray(max(recipe_ids) // 8 + 1)
+    for recipe_id in recipe_ids:
+        bits[recipe_id >> 3] |= 1 << (recipe_id & 7)
+    return int.from_bytes(bits, 'little')
+
+
+pantry_index = PantryIndex()
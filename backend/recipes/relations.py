@@ -0,0 +1,172 @@
+"""Добавление и удаление связей пользователя за один запрос.
+
+Избранное, корзина и подписки - строки с уникальной парой (user, цель).
+Связь создается одним INSERT ... SELECT ... ON CONFLICT DO NOTHING
+RETURNING: строка появляется, только если цель существует и связи еще
+нет, а повторный запрос (двойной клик) не приводит к IntegrityError.
+Удаление - один DELETE ... RETURNING.
+
+Поскольку запросы идут в обход ORM, сигналы post_save и post_delete
+отправляются вручную с теми же аргументами, что и у Model.save и
+Model.delete: от них зависят счетчики, списки покупок и ленты. Пакетные
+add_relations и remove_relations вместо сигнала на каждую строку
+отправляют один relations_added или relations_removed. Базы без
+ON CONFLICT и RETURNING используют ORM.
+"""
+from django.db import IntegrityError, connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal
+
+# Пакетные изменения связей одного пользователя. Аргументы: user_id и
+# target_ids - список id целей, связи с которыми созданы или удалены.
+relations_added = Signal()
+relations_removed = Signal()
+
+
+def _native():
+    return (
+        connection.vendor in ('postgresql', 'sqlite')
+        and connection.features.can_return_columns_from_insert
+    )
+
+
+def _insert(model, user_id, field, target_ids):
+    """Вставляет связи с существующими целями, возвращает (pk, цель)."""
+    opts = model._meta
+    target = opts.get_field(field)
+    related = target.related_model._meta
+    qn = connection.ops.quote_name
+    instance = model(user_id=user_id)
+    columns, values = [], []
+    for model_field in opts.concrete_fields:
+        if model_field.primary_key or model_field.name in ('user', field):
+            continue
+        # Например, auto_now_add у Subscription.created
+        value = model_field.pre_save(instance, add=True)
+        columns.append(qn(model_field.column))
+        values.append(model_field.get_db_prep_save(value, connection))
+    columns = [qn(opts.get_field('user').column), *columns, qn(target.column)]
+    placeholders = ', '.join(['%s'] * (len(values) + 1))
+    sql = (
+        f'INSERT INTO {qn(opts.db_table)} ({", ".join(columns)}) '
+        f'SELECT {placeholders}, {qn(related.pk.column)} '
+        f'FROM {qn(related.db_table)} WHERE {qn(related.pk.column)} '
+        f'IN ({", ".join(["%s"] * len(target_ids))}) '
+        f'ON CONFLICT DO NOTHING '
+        f'RETURNING {qn(opts.pk.column)}, {qn(target.column)}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, *values, *target_ids])
+        return cursor.fetchall()
+
+
+def _delete(model, user_id, field, target_ids):
+    """Удаляет связи с целями target_ids, возвращает (pk, цель)."""
+    opts = model._meta
+    qn = connection.ops.quote_name
+    target = qn(opts.get_field(field).column)
+    sql = (
+        f'DELETE FROM {qn(opts.db_table)} '
+        f'WHERE {qn(opts.get_field("user").column)} = %s '
+        f'AND {target} IN ({", ".join(["%s"] * len(target_ids))}) '
+        f'RETURNING {qn(opts.pk.column)}, {target}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, *target_ids])
+        return cursor.fetchall()
+
+
+def _instance(model, pk, user_id, field, target_id):
+    instance = model(pk=pk, user_id=user_id, **{f'{field}_id': target_id})
+    instance._state.adding = False
+    instance._state.db = connection.alias
+    return instance
+
+
+def add_relation(model, user_id, field, target_id):
+    """Создает связь пользователя с объектом target_id по полю field.
+
+    Возвращает созданный экземпляр или None, если связь уже есть или
+    объекта target_id нет. Вызывать внутри transaction.atomic.
+    """
+    if not _native():
+        instance = model(user_id=user_id, **{f'{field}_id': target_id})
+        try:
+            with transaction.atomic():
+                instance.save(force_insert=True)
+        except IntegrityError:
+            return None
+        return instance
+
+    rows = _insert(model, user_id, field, [target_id])
+    if not rows:
+        return None
+    instance = _instance(model, rows[0][0], user_id, field, target_id)
+    post_save.send(
+        sender=model, instance=instance, created=True, update_fields=None,
+        raw=False, using=connection.alias
+    )
+    return instance
+
+
+def remove_relation(model, user_id, field, target_id):
+    """Удаляет связь и возвращает удаленный экземпляр или None."""
+    if not _native():
+        instance = model.objects.filter(
+            user_id=user_id, **{f'{field}_id': target_id}
+        ).first()
+        if instance is not None:
+            instance.delete()
+        return instance
+
+    rows = _delete(model, user_id, field, [target_id])
+    if not rows:
+        return None
+    instance = _instance(model, rows[0][0], user_id, field, target_id)
+    post_delete.send(
+        sender=model, instance=instance, using=connection.alias,
+        origin=instance
+    )
+    return instance
+
+
+def add_relations(model, user_id, field, target_ids):
+    """Пакетная add_relation: возвращает множество целей новых связей.
+
+    Цели, которых нет в базе, и уже связанные пропускаются. Вызывать
+    внутри transaction.atomic.
+    """
+    if not target_ids:
+        return set()
+    if not _native():
+        return {
+            target_id for target_id in target_ids
+            if add_relation(model, user_id, field, target_id) is not None
+        }
+    added = [target_id for _, target_id in _insert(
+        model, user_id, field, list(target_ids)
+    )]
+    if added:
+        relations_added.send(
+            sender=model, user_id=user_id, target_ids=added
+        )
+    return set(added)
+
+
+def remove_relations(model, user_id, field, target_ids):
+    """Пакетная remove_relation: возвращает множество удаленных целей."""
+    if not target_ids:
+        return set()
+    if not _native():
+        return {
+            target_id for target_id in target_ids
+            if remove_relation(model, user_id, field, target_id) is not None
+        }
+    removed = [target_id for _, target_id in _delete(
+        model, user_id, field, list(target_ids)
+    )]
+    if removed:
+        relations_removed.send(
+            sender=model, user_id=user_id, target_ids=removed
+        )
+    return set(removed)
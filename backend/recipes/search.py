@@ -0,0 +1,138 @@
+"""Полнотекстовый поиск рецептов по названию, описанию и ингредиентам.
+
+На Postgres используется колонка search_vector (tsvector со словарем
+russian) и GIN-индекс по ней, на остальных базах - таблица
+RecipeSearchTerm с основами слов от встроенного стеммера.
+"""
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import BooleanField, Count, FloatField, Sum
+from django.db.models.expressions import RawSQL
+
+from .models import Recipe, RecipeIngredient, RecipeSearchTerm
+from .stemmer import tokenize
+
+# Вес совпадения в зависимости от поля рецепта
+NAME_WEIGHT = 4
+INGREDIENT_WEIGHT = 2
+TEXT_WEIGHT = 1
+MAX_TERM_WEIGHT = 32767
+MAX_TERM_LENGTH = 64
+
+POSTGRES_VECTOR_SQL = """
+    setweight(to_tsvector('russian', recipes_recipe.name), 'A')
+    || setweight(to_tsvector('russian', coalesce((
+        SELECT string_agg(recipes_ingredient.name, ' ')
+        FROM recipes_recipeingredient
+        JOIN recipes_ingredient
+            ON recipes_ingredient.id = recipes_recipeingredient.ingredient_id
+        WHERE recipes_recipeingredient.recipe_id = recipes_recipe.id
+    ), '')), 'B')
+    || setweight(to_tsvector('russian', recipes_recipe.text), 'C')
+"""
+
+
+def uses_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def _document_terms(name, ingredient_names, text):
+    weights = defaultdict(int)
+    for words, weight in (
+        (name, NAME_WEIGHT),
+        (' '.join(ingredient_names), INGREDIENT_WEIGHT),
+        (text, TEXT_WEIGHT),
+    ):
+        for term in tokenize(words):
+            weights[term[:MAX_TERM_LENGTH]] += weight
+    return {
+        term: min(weight, MAX_TERM_WEIGHT)
+        for term, weight in weights.items()
+    }
+
+
+def schedule_search_update(recipe_ids):
+    """Обновляет индекс после фиксации текущей транзакции.
+
+    Откладывание позволяет не индексировать рецепты, которые удаляются
+    в той же транзакции каскадом.
+    """
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(lambda: update_search_index(recipe_ids))
+
+
+def update_search_index(recipe_ids):
+    """Пересчитывает поисковый индекс для перечисленных рецептов."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    if uses_postgres():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE recipes_recipe SET search_vector = '
+                f'{POSTGRES_VECTOR_SQL} WHERE recipes_recipe.id = ANY(%s)',
+                [recipe_ids]
+            )
+        return
+
+    ingredient_names = defaultdict(list)
+    for recipe_id, name in RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'ingredient__name'):
+        ingredient_names[recipe_id].append(name)
+
+    terms = []
+    for recipe_id, name, text in Recipe.objects.filter(
+        pk__in=recipe_ids
+    ).values_list('id', 'name', 'text'):
+        terms.extend(
+            RecipeSearchTerm(recipe_id=recipe_id, term=term, weight=weight)
+            for term, weight in _document_terms(
+                name, ingredient_names[recipe_id], text
+            ).items()
+        )
+    RecipeSearchTerm.objects.filter(recipe_id__in=recipe_ids).delete()
+    RecipeSearchTerm.objects.bulk_create(terms, batch_size=1000)
+
+
+def unindexed_recipes():
+    """Рецепты, для которых поисковый индекс еще не построен."""
+    if uses_postgres():
+        return Recipe.objects.filter(
+            RawSQL(
+                'recipes_recipe.search_vector IS NULL', [],
+                output_field=BooleanField()
+            )
+        )
+    return Recipe.objects.filter(search_terms__isnull=True)
+
+
+def search_recipes(queryset, query):
+    """Рецепты queryset, подходящие под запрос, по убыванию релевантности."""
+    if uses_postgres():
+        return queryset.filter(
+            RawSQL(
+                "recipes_recipe.search_vector @@ "
+                "websearch_to_tsquery('russian', %s)",
+                [query],
+                output_field=BooleanField()
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                "ts_rank(recipes_recipe.search_vector, "
+                "websearch_to_tsquery('russian', %s))",
+                [query],
+                output_field=FloatField()
+            )
+        ).order_by('-search_rank', '-pub_date', '-id')
+
+    terms = sorted({term[:MAX_TERM_LENGTH] for term in tokenize(query)})
+    if not terms:
+        return queryset.none()
+    # У рецепта каждая основа хранится одной строкой, поэтому число
+    # совпавших строк равно числу найденных слов запроса
+    return queryset.filter(search_terms__term__in=terms).annotate(
+        matched=Count('search_terms'),
+        search_rank=Sum('search_terms__weight')
+    ).filter(matched=len(terms)).order_by('-search_rank', '-pub_date', '-id')
@@ -0,0 +1,164 @@
+"""Итоги списков покупок, поддерживаемые при каждом изменении.
+
+ShoppingListItem хранит для пары (пользователь, ингредиент) сумму
+количеств по всем рецептам в корзине. Изменения корзины и ингредиентов
+рецептов переводятся в приращения по ингредиентам и применяются в той
+же транзакции, поэтому выгрузка списка - одно чтение по индексу.
+
+Версия списка каждого пользователя хранится в базе (DataVersion) и
+меняется после фиксации любого изменения его итогов, по ней кешируются
+выгрузки.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from .models import RecipeIngredient, ShoppingListItem
+from .versions import bump_versions, get_version
+
+SHOPPING_LIST_VERSION_KEY = 'shopping-list:{}'
+
+
+def get_shopping_list_version(user_id):
+    """Токен текущей версии списка покупок пользователя."""
+    token, number, _ = get_version(SHOPPING_LIST_VERSION_KEY.format(user_id))
+    return f'{token}-{number}'
+
+
+def bump_shopping_list_versions(user_ids):
+    bump_versions(
+        SHOPPING_LIST_VERSION_KEY.format(user_id) for user_id in user_ids
+    )
+
+
+def schedule_shopping_list_bump(user_ids):
+    """Меняет версии списков после фиксации транзакции.
+
+    До фиксации параллельный запрос еще видит старые итоги и не должен
+    сохранить их в кеш под новой версией.
+    """
+    user_ids = list(user_ids)
+    transaction.on_commit(lambda: bump_shopping_list_versions(user_ids))
+
+
+def change_shopping_lists(user_ids, deltas):
+    """Прибавляет deltas {id ингредиента: приращение} к спискам user_ids."""
+    user_ids = list(user_ids)
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not user_ids or not deltas:
+        return
+    with transaction.atomic():
+        # Сначала заводим недостающие строки, затем одно UPDATE для всех
+        ShoppingListItem.objects.bulk_create(
+            (ShoppingListItem(user_id=user_id, ingredient_id=pk, amount=0)
+             for user_id in user_ids
+             for pk, delta in deltas.items() if delta > 0),
+            ignore_conflicts=True,
+            batch_size=1000
+        )
+        items = ShoppingListItem.objects.filter(
+            user_id__in=user_ids, ingredient_id__in=deltas
+        )
+        items.update(amount=Greatest(
+            F('amount') + Case(
+                *(When(ingredient_id=pk, then=Value(delta))
+                  for pk, delta in deltas.items()),
+                output_field=IntegerField()
+            ),
+            Value(0)
+        ))
+        if any(delta < 0 for delta in deltas.values()):
+            items.filter(amount=0).delete()
+    schedule_shopping_list_bump(user_ids)
+
+
+def recipe_amounts(recipe_id):
+    return dict(
+        RecipeIngredient.objects.filter(recipe_id=recipe_id)
+        .values_list('ingredient_id', 'amount')
+    )
+
+
+def recipes_amounts(recipe_ids):
+    """Суммы количеств по ингредиентам нескольких рецептов."""
+    return dict(
+        RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+        .values('ingredient_id').annotate(total=Sum('amount'))
+        .order_by().values_list('ingredient_id', 'total')
+    )
+
+
+def expected_totals(apps, user_ids):
+    """Итоги, посчитанные заново по корзинам: {(user, ingredient): сумма}."""
+    RecipeIngredient = apps.get_model(  # noqa: N806
+        'recipes', 'RecipeIngredient'
+    )
+    return {
+        (row['recipe__in_shopping_cart__user'], row['ingredient']):
+            row['total']
+        for row in RecipeIngredient.objects.filter(
+            recipe__in_shopping_cart__user__in=user_ids
+        ).values('recipe__in_shopping_cart__user', 'ingredient')
+        .annotate(total=Sum('amount')).order_by()
+    }
+
+
+def repair_shopping_lists(apps, dry_run=False, batch_size=500):
+    """Сверяет итоги с корзинами и исправляет расхождения.
+
+    Возвращает число исправленных строк (созданных, измененных и
+    удаленных).
+    """
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    user_ids = sorted(
+        set(ShoppingCart.objects.values_list('user_id', flat=True))
+        | set(ShoppingListItem.objects.values_list('user_id', flat=True))
+    )
+    repaired = 0
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        expected = expected_totals(apps, batch)
+        stored = {
+            (item.user_id, item.ingredient_id): item
+            for item in ShoppingListItem.objects.filter(user_id__in=batch)
+        }
+        missing = [
+            ShoppingListItem(user_id=key[0], ingredient_id=key[1],
+                             amount=total)
+            for key, total in expected.items() if key not in stored
+        ]
+        wrong = []
+        for key, item in stored.items():
+            if key in expected and item.amount != expected[key]:
+                item.amount = expected[key]
+                wrong.append(item)
+        extra = [item.pk for key, item in stored.items()
+                 if key not in expected]
+        repaired += len(missing) + len(wrong) + len(extra)
+        if dry_run:
+            continue
+        with transaction.atomic():
+            ShoppingListItem.objects.bulk_create(missing, batch_size=1000)
+            ShoppingListItem.objects.bulk_update(
+                wrong, ['amount'], batch_size=1000
+            )
+            ShoppingListItem.objects.filter(pk__in=extra).delete()
+            schedule_shopping_list_bump({
+                key[0] for key in expected.keys() ^ stored.keys()
+            } | {item.user_id for item in wrong})
+    return repaired
+
+
+def ingredient_deltas(added, changed, removed):
+    """Приращения по ингредиентам из набора изменений рецепта."""
+    deltas = defaultdict(int)
+    for pk, amount in added.items():
+        deltas[pk] += amount
+    for pk, (old, new) in changed.items():
+        deltas[pk] += new - old
+    for pk, amount in removed.items():
+        deltas[pk] -= amount
+    return deltas
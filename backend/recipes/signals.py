@@ -0,0 +1,275 @@
+from django.db.models import F, QuerySet
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save
+)
+from django.dispatch import Signal, receiver
+
+from users.models import Subscription, User
+
+from .catalog import bump_catalog_version, touch_ingredient_recipes
+from .counters import change_counter
+from .feed import add_author, push_recipe, remove_author
+from .images import (
+    process_avatar,
+    process_recipe_image,
+    schedule_variants,
+    variants_ready
+)
+from .models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart
+)
+from .pantry import schedule_pantry_update
+from .relations import relations_added, relations_removed
+from .search import schedule_search_update
+from .shopping_list import (
+    change_shopping_lists,
+    ingredient_deltas,
+    recipe_amounts,
+    recipes_amounts
+)
+
+# Набор ингредиентов рецепта изменился. Аргументы: recipe_id и словари
+# по id ингредиента: added {id: количество}, changed {id: (было, стало)},
+# removed {id: количество}. Массовые изменения (сериализатор рецепта,
+# удаление рецепта или ингредиента) отправляют один сигнал на рецепт.
+recipe_ingredients_changed = Signal()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    bump_catalog_version()
+
+
+# Поля ингредиента, входящие в кешируемое представление рецепта
+INGREDIENT_FIELDS = {'name', 'measurement_unit'}
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created, update_fields, **kwargs):
+    if created or (
+        update_fields is not None and INGREDIENT_FIELDS.isdisjoint(
+            update_fields
+        )
+    ):
+        return
+    touch_ingredient_recipes([instance.pk])
+
+
+# Поля пользователя, входящие в кешируемое представление рецепта
+AUTHOR_PROFILE_FIELDS = {
+    'email', 'username', 'first_name', 'last_name', 'avatar'
+}
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_bump_version(sender, instance, raw, update_fields, **kwargs):
+    # Версия увеличивается в том же UPDATE, что и сохраняет рецепт
+    if raw or instance._state.adding:
+        return
+    if update_fields is None or 'version' in update_fields:
+        instance.version = F('version') + 1
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, update_fields, **kwargs):
+    if created:
+        change_counter(User, [instance.author_id], 'recipes_count', 1)
+        push_recipe(instance)
+    else:
+        if update_fields is not None and 'version' not in update_fields:
+            change_counter(Recipe, [instance.pk], 'version', 1)
+        # Версию увеличил UPDATE, в объекте вместо F() должно быть число
+        instance.refresh_from_db(fields=['version'])
+    schedule_search_update([instance.pk])
+    if instance.image and not variants_ready(
+        instance.image, instance.image_variants
+    ):
+        schedule_variants(process_recipe_image, instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    change_counter(User, [instance.author_id], 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, [instance.recipe_id], 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    change_counter(Recipe, [instance.recipe_id], 'favorites_count', -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, [instance.recipe_id], 'in_carts_count', 1)
+        change_shopping_lists(
+            [instance.user_id], recipe_amounts(instance.recipe_id)
+        )
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_deleted(sender, instance, origin=None, **kwargs):
+    change_counter(Recipe, [instance.recipe_id], 'in_carts_count', -1)
+    # При удалении рецепта его ингредиенты уже вычтены обработчиком
+    # recipe_ingredients_changed, при удалении пользователя строки
+    # списка удаляются каскадом
+    if origin is instance or (
+        isinstance(origin, QuerySet) and origin.model is ShoppingCart
+    ):
+        change_shopping_lists(
+            [instance.user_id],
+            {pk: -amount
+             for pk, amount in recipe_amounts(instance.recipe_id).items()}
+        )
+
+
+@receiver(relations_added, sender=Favorite)
+def favorites_added(sender, user_id, target_ids, **kwargs):
+    change_counter(Recipe, target_ids, 'favorites_count', 1)
+
+
+@receiver(relations_removed, sender=Favorite)
+def favorites_removed(sender, user_id, target_ids, **kwargs):
+    change_counter(Recipe, target_ids, 'favorites_count', -1)
+
+
+@receiver(relations_added, sender=ShoppingCart)
+def shopping_cart_added(sender, user_id, target_ids, **kwargs):
+    change_counter(Recipe, target_ids, 'in_carts_count', 1)
+    change_shopping_lists([user_id], recipes_amounts(target_ids))
+
+
+@receiver(relations_removed, sender=ShoppingCart)
+def shopping_cart_removed(sender, user_id, target_ids, **kwargs):
+    change_counter(Recipe, target_ids, 'in_carts_count', -1)
+    change_shopping_lists(
+        [user_id],
+        {pk: -amount for pk, amount in recipes_amounts(target_ids).items()}
+    )
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_added_to_feed(sender, instance, created, **kwargs):
+    if created:
+        add_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_removed_from_feed(sender, instance, **kwargs):
+    remove_author(instance.user_id, instance.author_id)
+
+
+@receiver(recipe_ingredients_changed)
+def update_recipe_ingredient_dependents(
+    sender, recipe_id, added, changed, removed, **kwargs
+):
+    if added:
+        change_counter(Ingredient, list(added), 'usage_count', 1)
+    if removed:
+        change_counter(Ingredient, list(removed), 'usage_count', -1)
+    change_counter(Recipe, [recipe_id], 'version', 1)
+    change_shopping_lists(
+        ShoppingCart.objects.filter(recipe_id=recipe_id)
+        .values_list('user_id', flat=True),
+        ingredient_deltas(added, changed, removed)
+    )
+    # Количество не участвует ни в поиске, ни в подборе по кладовой
+    if added or removed:
+        schedule_search_update([recipe_id])
+        schedule_pantry_update([recipe_id])
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_ingredients_deleted(sender, instance, **kwargs):
+    removed = dict(
+        instance.ingredient_amounts.values_list('ingredient_id', 'amount')
+    )
+    if removed:
+        recipe_ingredients_changed.send(
+            sender=Recipe, recipe_id=instance.pk,
+            added={}, changed={}, removed=removed
+        )
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_removed_from_recipes(sender, instance, **kwargs):
+    for recipe_id, amount in instance.recipe_ingredients.values_list(
+        'recipe_id', 'amount'
+    ):
+        recipe_ingredients_changed.send(
+            sender=Recipe, recipe_id=recipe_id,
+            added={}, changed={}, removed={instance.pk: amount}
+        )
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def recipe_ingredient_remember(sender, instance, raw, **kwargs):
+    # Одиночные сохранения (админка, shell) сравниваются с базой
+    instance._previous = None
+    if not raw and not instance._state.adding:
+        instance._previous = RecipeIngredient.objects.filter(
+            pk=instance.pk
+        ).values_list('ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_ingredient_saved(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    added, changed, removed = {}, {}, {}
+    previous = getattr(instance, '_previous', None)
+    if previous is None:
+        added[instance.ingredient_id] = instance.amount
+    elif previous[0] != instance.ingredient_id:
+        removed[previous[0]] = previous[1]
+        added[instance.ingredient_id] = instance.amount
+    elif previous[1] != instance.amount:
+        changed[instance.ingredient_id] = (previous[1], instance.amount)
+    else:
+        return
+    recipe_ingredients_changed.send(
+        sender=Recipe, recipe_id=instance.recipe_id,
+        added=added, changed=changed, removed=removed
+    )
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_deleted(sender, instance, origin=None, **kwargs):
+    # Каскадные и массовые удаления сообщает тот, кто их начал
+    if origin is not instance:
+        return
+    recipe_ingredients_changed.send(
+        sender=Recipe, recipe_id=instance.recipe_id,
+        added={}, changed={}, removed={instance.ingredient_id: instance.amount}
+    )
+
+
+@receiver(post_save, sender=User)
+def avatar_saved(sender, instance, **kwargs):
+    if instance.avatar and not variants_ready(
+        instance.avatar, instance.avatar_variants
+    ):
+        schedule_variants(process_avatar, instance.pk)
+
+
+@receiver(post_save, sender=User)
+def author_profile_saved(sender, instance, created, update_fields, **kwargs):
+    if created:
+        return
+    if update_fields is None or AUTHOR_PROFILE_FIELDS & set(update_fields):
+        Recipe.objects.filter(author_id=instance.pk).update(
+            version=F('version') + 1
+        )
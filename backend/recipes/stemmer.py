@@ -0,0 +1,145 @@
+"""Стеммер русского языка по алгоритму Snowball (Porter).
+
+Используется встроенным поисковым индексом рецептов, когда база данных
+не умеет полнотекстовый поиск сама.
+"""
+import re
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND = (
+    ('вшись', 'вши', 'в'),
+    ('ившись', 'ывшись', 'ивши', 'ывши', 'ив', 'ыв'),
+)
+ADJECTIVE = (
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому',
+    'ее', 'ие', 'ые', 'ое', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым',
+    'ом', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+)
+PARTICIPLE = (
+    ('ем', 'нн', 'вш', 'ющ', 'щ'),
+    ('ивш', 'ывш', 'ующ'),
+)
+REFLEXIVE = ('ся', 'сь')
+VERB = (
+    ('ете', 'йте', 'ешь', 'нно', 'ла', 'на', 'ли', 'ем', 'ло', 'но', 'ет',
+     'ют', 'ны', 'ть', 'й', 'л', 'н'),
+    ('ейте', 'уйте', 'ила', 'ыла', 'ена', 'ите', 'или', 'ыли', 'ило',
+     'ыло', 'ено', 'ует', 'уют', 'ены', 'ить', 'ыть', 'ишь', 'ей', 'уй',
+     'ил', 'ыл', 'им', 'ым', 'ен', 'ят', 'ит', 'ыт', 'ую', 'ю'),
+)
+NOUN = (
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях',
+    'ев', 'ов', 'ие', 'ье', 'еи', 'ии', 'ей', 'ой', 'ий', 'ям', 'ем',
+    'ам', 'ом', 'ах', 'ях', 'ию', 'ью', 'ия', 'ья',
+    'а', 'е', 'и', 'й', 'о', 'у', 'ы', 'ь', 'ю', 'я',
+)
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+WORD_RE = re.compile(r'[^\W\d_]+')
+
+STOP_WORDS = frozenset((
+    'и', 'в', 'во', 'не', 'что', 'он', 'на', 'я', 'с', 'со', 'как', 'а',
+    'то', 'все', 'она', 'так', 'его', 'но', 'да', 'ты', 'к', 'у', 'же',
+    'вы', 'за', 'бы', 'по', 'ее', 'мне', 'есть', 'из', 'для', 'или',
+    'от', 'до', 'при', 'без', 'над', 'под', 'о', 'об',
+))
+
+
+def _longest(word, start, endings):
+    for ending in sorted(endings, key=len, reverse=True):
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            return ending
+    return None
+
+
+def _remove_grouped(word, start, groups):
+    """Удаляет окончание из групп (после а/я, без условия)."""
+    candidates = []
+    for ending in groups[0]:
+        cut = len(word) - len(ending)
+        if (word.endswith(ending) and cut - 1 >= start
+                and word[cut - 1] in 'ая'):
+            candidates.append(ending)
+    for ending in groups[1]:
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            candidates.append(ending)
+    if not candidates:
+        return None
+    return word[:-len(max(candidates, key=len))]
+
+
+def _regions(word):
+    rv = r1 = r2 = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    rv, r2 = _regions(word)
+
+    # Шаг 1
+    result = _remove_grouped(word, rv, PERFECTIVE_GERUND)
+    if result is not None:
+        word = result
+    else:
+        ending = _longest(word, rv, REFLEXIVE)
+        if ending:
+            word = word[:-len(ending)]
+        ending = _longest(word, rv, ADJECTIVE)
+        if ending:
+            word = word[:-len(ending)]
+            result = _remove_grouped(word, rv, PARTICIPLE)
+            if result is not None:
+                word = result
+        else:
+            result = _remove_grouped(word, rv, VERB)
+            if result is not None:
+                word = result
+            else:
+                ending = _longest(word, rv, NOUN)
+                if ending:
+                    word = word[:-len(ending)]
+
+    # Шаг 2
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3
+    ending = _longest(word, r2, DERIVATIONAL)
+    if ending:
+        word = word[:-len(ending)]
+
+    # Шаг 4
+    if word.endswith('нн') and len(word) - 2 >= rv:
+        word = word[:-1]
+    else:
+        ending = _longest(word, rv, SUPERLATIVE)
+        if ending:
+            word = word[:-len(ending)]
+            if word.endswith('нн') and len(word) - 2 >= rv:
+                word = word[:-1]
+        elif word.endswith('ь') and len(word) - 1 >= rv:
+            word = word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Основы значимых слов текста в порядке появления."""
+    return [
+        stem(word) for word in WORD_RE.findall(text.lower())
+        if len(word) > 1 and word not in STOP_WORDS
+    ]
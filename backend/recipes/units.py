@@ -0,0 +1,115 @@
+"""Приведение единиц измерения при сложении количеств.
+
+Ингредиенты с одинаковым названием, но разными единицами (г и кг, мл
+и ст. л.) складываются в базовой единице своей величины, после чего
+итог записывается в удобной для чтения единице. Штучные и бытовые
+единицы (шт., банка, щепотка) ни во что не переводятся и выводятся
+отдельными строками.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+from fractions import Fraction
+from itertools import groupby
+
+MASS = 'mass'
+VOLUME = 'volume'
+
+# Единица -> (величина, сколько базовых единиц в ней). Базовые: г и мл
+UNITS = {
+    'мг': (MASS, Fraction(1, 1000)),
+    'г': (MASS, Fraction(1)),
+    'кг': (MASS, Fraction(1000)),
+    'капля': (VOLUME, Fraction(1, 20)),
+    'мл': (VOLUME, Fraction(1)),
+    'ч. л.': (VOLUME, Fraction(5)),
+    'дес. л.': (VOLUME, Fraction(10)),
+    'ст. л.': (VOLUME, Fraction(15)),
+    'стакан': (VOLUME, Fraction(250)),
+    'л': (VOLUME, Fraction(1000)),
+}
+
+# Единицы вывода от крупной к мелкой: берется первая, в которой итог
+# не меньше единицы
+OUTPUT_UNITS = {
+    MASS: ('кг', 'г', 'мг'),
+    VOLUME: ('л', 'мл'),
+}
+
+AMOUNT_PRECISION = Decimal('0.01')
+
+
+def unit_key(unit):
+    """Написание единицы без регистра, пробелов и точки в конце."""
+    return unit.lower().replace(' ', '').rstrip('.')
+
+
+_UNITS_BY_KEY = {unit_key(unit): unit for unit in UNITS}
+
+
+def canonical_unit(unit):
+    """Единица из таблицы UNITS или None, если она не переводится."""
+    return _UNITS_BY_KEY.get(unit_key(unit))
+
+
+def readable_amount(value, dimension):
+    """Итог в базовой единице -> (количество, единица вывода)."""
+    units = OUTPUT_UNITS[dimension]
+    for unit in units:
+        if value >= UNITS[unit][1]:
+            break
+    return value / UNITS[unit][1], unit
+
+
+def format_amount(value):
+    """int для целых количеств, иначе Decimal с двумя знаками."""
+    if value.denominator == 1:
+        return value.numerator
+    amount = (Decimal(value.numerator) / Decimal(value.denominator)).quantize(
+        AMOUNT_PRECISION, rounding=ROUND_HALF_UP
+    )
+    if amount == amount.to_integral_value():
+        return int(amount)
+    return amount.normalize()
+
+
+def combine_group(rows):
+    """Складывает строки (единица, количество) одного ингредиента.
+
+    Возвращает список (единица, количество), упорядоченный по единице.
+    Если у величины всего одна единица, итог остается в ней: три ч. л.
+    так и остаются ч. л., 1500 г - граммами.
+    """
+    totals = {}
+    units = {}
+    separate = {}
+    for unit, amount in rows:
+        canonical = canonical_unit(unit)
+        if canonical is None:
+            separate[unit] = separate.get(unit, 0) + amount
+            continue
+        dimension, factor = UNITS[canonical]
+        totals[dimension] = totals.get(dimension, 0) + factor * amount
+        units.setdefault(dimension, set()).add(canonical)
+    combined = list(separate.items())
+    for dimension, total in totals.items():
+        (unit, *others) = units[dimension]
+        if others:
+            value, unit = readable_amount(total, dimension)
+        else:
+            value = total / UNITS[unit][1]
+        combined.append((unit, format_amount(value)))
+    return sorted(combined)
+
+
+def combine_units(rows):
+    """Объединяет строки (название, единица, количество) по названию.
+
+    Строки должны быть упорядочены по названию: тогда объединение идет
+    за один проход и не держит в памяти больше одного ингредиента.
+    """
+    for name, group in groupby(rows, key=lambda row: row[0]):
+        group = [(unit, amount) for _, unit, amount in group]
+        if len(group) == 1:
+            yield name, *group[0]
+            continue
+        for unit, amount in combine_group(group):
+            yield name, unit, amount
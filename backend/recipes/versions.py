@@ -0,0 +1,90 @@
+"""Версии данных, общие для всех процессов gunicorn.
+
+Индексы и отрендеренные ответы живут в памяти процесса или в кеше
+Django, который по умолчанию у каждого процесса свой. Поэтому версии,
+по которым они устаревают, хранятся в базе: строка DataVersion
+создается при первом обращении со случайным токеном, а номер
+увеличивается вместе с изменением данных.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DataVersion
+
+
+def _create(keys):
+    now = timezone.now()
+    DataVersion.objects.bulk_create(
+        (DataVersion(key=key, token=uuid.uuid4().hex, changed=now)
+         for key in keys),
+        ignore_conflicts=True
+    )
+
+
+def _read(keys):
+    return {
+        key: (token, number, changed)
+        for key, token, number, changed in DataVersion.objects.filter(
+            key__in=keys
+        ).values_list('key', 'token', 'number', 'changed')
+    }
+
+
+def get_versions(keys):
+    """Версии {ключ: (токен, номер, время изменения)}."""
+    keys = list(keys)
+    versions = _read(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        _create(missing)
+        versions.update(_read(missing))
+    return versions
+
+
+def get_version(key):
+    return get_versions([key])[key]
+
+
+def bump_versions(keys):
+    """Увеличивает номера версий keys.
+
+    Строка блокируется до конца транзакции, поэтому одновременные
+    изменения не теряют приращений.
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    _create(keys)
+    DataVersion.objects.filter(key__in=keys).update(
+        number=F('number') + 1, changed=timezone.now()
+    )
+
+
+class CachedVersion:
+    """Версия, которую процесс перечитывает не чаще раза в interval секунд.
+
+    load читает версию из базы, interval - имя настройки с интервалом.
+    Изменения, сделанные в этом же процессе, должны вызывать reset().
+    """
+
+    def __init__(self, load, interval):
+        self.load = load
+        self.interval = interval
+        self._cached = None
+
+    def get(self):
+        now = time.monotonic()
+        cached = self._cached
+        if cached is None or (
+            now - cached[0] >= getattr(settings, self.interval)
+        ):
+            cached = (now, self.load())
+            self._cached = cached
+        return cached[1]
+
+    def reset(self):
+        self._cached = None
@@ -11,6 +11,8 @@ class CustomUserAdmin(UserAdmin):
         'username',
         'first_name',
         'last_name',
+        'recipes_count',
+        'subscribers_count',
         'is_staff'
     )
     search_fields = (
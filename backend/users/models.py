@@ -1,5 +1,30 @@
 from django.db import models
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
+from django.dispatch import Signal
+
+# Пароль или активность пользователей изменены через QuerySet.update,
+# post_save при этом не отправляется. Аргумент: user_ids.
+credentials_updated = Signal()
+
+# Поля, от которых зависит аутентификация пользователя
+CREDENTIAL_FIELDS = {'password', 'is_active'}
+
+
+class UserQuerySet(models.QuerySet):
+    """Сообщает об изменении пароля и активности через update()."""
+
+    def update(self, **kwargs):
+        if CREDENTIAL_FIELDS.isdisjoint(kwargs):
+            return super().update(**kwargs)
+        user_ids = list(self.values_list('pk', flat=True))
+        rows = super().update(**kwargs)
+        if user_ids:
+            credentials_updated.send(sender=self.model, user_ids=user_ids)
+        return rows
+
+
+class CustomUserManager(UserManager.from_queryset(UserQuerySet)):
+    """UserManager с UserQuerySet."""
 
 
 class User(AbstractUser):
@@ -36,6 +61,22 @@ class User(AbstractUser):
         default='',
         help_text='Загрузите ваш аватар'
     )
+    avatar_variants = models.JSONField(
+        verbose_name='Уменьшенные копии аватара',
+        default=dict,
+        blank=True,
+        editable=False
+    )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0
+    )
+    subscribers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0
+    )
+
+    objects = CustomUserManager()
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']